@@ -0,0 +1,185 @@
+"""Benchmark the sync and async nlq pipelines against stubbed AWS clients.
+
+Every client call sleeps for a fixed, representative latency (scaled by --scale), so the
+numbers show how the pipeline arranges its I/O rather than how fast AWS is. The Glue catalog
+is re-listed on every request (as after the metadata TTL expires) and the answer and result
+caches are off, so each request does the full amount of work. For each mode it reports the time
+per request spent in each stage and when the request finished.
+
+    python async_pipeline.py [--runs 5] [--scale 0.2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NLQ_DIR = os.path.join(HERE, "..", "nlq")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("TABLE_NAME", "nlq-benchmark-history")
+
+import config
+import cache
+import metadata
+import lambda_function
+from conversation import ConversationContext
+
+# Simulated latency of each client call, in milliseconds
+LATENCY_MS = {
+    "glue.get_tables": 150,
+    "dynamodb.query": 40,
+    "dynamodb.get_item": 20,
+    "dynamodb.batch_write": 40,
+    "dynamodb.put_item": 20,
+    "bedrock.converse": 700,
+    "athena.start_query_execution": 60,
+    "athena.get_query_execution": 40,
+    "athena.get_query_results": 80,
+}
+
+SAMPLE_TABLES = {
+    "sample_donations": ["donationkey", "donorkey", "campaignkey", "eventkey", "datekey", "donationamount", "paymentmethodkey"],
+    "sample_campaigns": ["campaignkey", "campaignid", "campaignname", "startdate", "enddate", "campaigntype", "targetamount"],
+}
+
+scale = 1.0
+
+
+def wait(call):
+    time.sleep(LATENCY_MS[call] * scale / 1000)
+
+
+class StubGlue:
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, DatabaseName):
+        wait("glue.get_tables")
+        yield {"TableList": [{"Name": name, "UpdateTime": "2024-01-01",
+                              "StorageDescriptor": {"Columns": [{"Name": c, "Type": "int"} for c in columns]}}
+                             for name, columns in SAMPLE_TABLES.items()]}
+
+
+class StubDynamoDB:
+
+    def batch_write_item(self, RequestItems):
+        wait("dynamodb.batch_write")
+        return {"UnprocessedItems": {}}
+
+    def put_item(self, TableName, Item):
+        wait("dynamodb.put_item")
+
+    def get_item(self, TableName, Key):
+        wait("dynamodb.get_item")
+        return {}
+
+    def query(self, **kwargs):
+        wait("dynamodb.query")
+        return {"Items": []}
+
+
+class StubBedrock:
+
+    def converse(self, **request):
+        wait("bedrock.converse")
+        if request["messages"][-1]["content"][0]["text"].startswith("<question>"):
+            text = "<SQL>SELECT c.campaignname, SUM(d.donationamount) AS total FROM sample_donations d JOIN sample_campaigns c ON d.campaignkey = c.campaignkey GROUP BY 1</SQL>"
+        else:
+            text = "Donations by campaign:\n\n| campaign | total |\n| --- | --- |\n| spring | 100 |"
+        return {"output": {"message": {"role": "assistant", "content": [{"text": text}]}}, "usage": {}}
+
+
+class StubAthena:
+
+    def start_query_execution(self, **request):
+        wait("athena.start_query_execution")
+        return {"QueryExecutionId": "execution-1"}
+
+    def get_query_execution(self, QueryExecutionId):
+        wait("athena.get_query_execution")
+        return {"QueryExecution": {"QueryExecutionId": QueryExecutionId, "Status": {"State": "SUCCEEDED"}, "Statistics": {},
+                                   "ResultConfiguration": {"OutputLocation": "s3://results/execution-1.csv"}}}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        wait("athena.get_query_results")
+        columns = [{"Name": "campaignname", "Type": "varchar"}, {"Name": "total", "Type": "bigint"}]
+        rows = [{"Data": [{"VarCharValue": "campaignname"}, {"VarCharValue": "total"}]},
+                {"Data": [{"VarCharValue": "spring"}, {"VarCharValue": "100"}]}]
+        return {"ResultSet": {"ResultSetMetadata": {"ColumnInfo": columns}, "Rows": rows}}
+
+
+class StageTimer:
+    # Wraps pipeline functions and records the duration of each call under a stage name
+
+    def __init__(self):
+        self.durations = {}
+
+    def wrap(self, owner, attribute, stage):
+        function = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.durations.setdefault(stage, []).append((time.perf_counter() - start) * 1000)
+
+        setattr(owner, attribute, timed)
+
+
+def run_mode(mode, runs, timer):
+    config.ASYNC_PIPELINE = mode == "async"
+    total_ms = []
+    timer.durations.clear()
+    for run in range(runs):
+        start = time.perf_counter()
+        lambda_function.run_pipeline("What is the total donation amount per campaign?", f"{mode}-session-{run}")
+        total_ms.append((time.perf_counter() - start) * 1000)
+
+    # Time per request spent in each stage (a stage can be entered more than once per request)
+    stages = {stage: sum(values) / runs for stage, values in timer.durations.items()}
+    return stages, statistics.mean(total_ms)
+
+
+def main():
+    global scale
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=0.2, help="multiplier applied to the simulated latencies")
+    args = parser.parse_args()
+    scale = args.scale
+
+    config.glue_client = StubGlue()
+    config.dynamodb_client = StubDynamoDB()
+    config.bedrock_client = StubBedrock()
+    config.athena_client = StubAthena()
+    config.METADATA_CACHE_TTL_SECONDS = 0
+    config.ANSWER_CACHE_ENABLED = False
+    config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES = 0
+    config.logger.setLevel("WARNING")
+
+    timer = StageTimer()
+    timer.wrap(metadata, "get_relevant_metadata", "metadata")
+    timer.wrap(ConversationContext, "load", "history read")
+    timer.wrap(lambda_function, "generate_sql", "generate sql")
+    timer.wrap(lambda_function, "summarize_results", "summarize")
+    timer.wrap(ConversationContext, "add_turn", "history write")
+    timer.wrap(cache, "store_answer", "answer cache store")
+
+    results = {mode: run_mode(mode, args.runs, timer) for mode in ("sync", "async")}
+
+    print(f"{args.runs} runs per mode, latency scale {args.scale}\n")
+    print(f"{'stage (ms/request)':<22} {'sync':>9} {'async':>9}")
+    for stage in ["metadata", "history read", "generate sql", "summarize", "history write", "answer cache store"]:
+        row = [results[mode][0].get(stage) for mode in ("sync", "async")]
+        print(f"{stage:<22} " + " ".join(f"{value:>9.1f}" if value is not None else f"{'-':>9}" for value in row))
+    print(f"{'end to end':<22} {results['sync'][1]:>9.1f} {results['async'][1]:>9.1f}")
+    print("\nBoth modes read the history before the answer cache lookup: after the metadata in sync mode,\n"
+          "alongside it in async mode.")
+
+
+if __name__ == "__main__":
+    main()
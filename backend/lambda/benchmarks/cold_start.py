@@ -0,0 +1,96 @@
+"""Benchmark Lambda module import and AWS client construction time.
+
+Each measurement runs in a fresh Python process, the way a new Lambda execution environment
+starts. For the nlq and nlq-kb Lambdas it reports the handler import time, the cost of each
+client the first time it is used, and the previous eager setup: every client plus the DynamoDB
+resource built at import time. No AWS calls are made; only client construction is timed.
+
+    python cold_start.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(HERE, "..")
+
+LAMBDAS = {
+    "nlq": {
+        "path": [os.path.join(LAMBDA_DIR, "nlq"), os.path.join(LAMBDA_DIR, "nlq", "services")],
+        "clients": ["bedrock_client", "athena_client", "s3_client", "glue_client", "dynamodb_client", "redshift_data_client"],
+        # Clients each kind of request touches
+        "requests": {
+            "answer cache hit": ["glue_client", "dynamodb_client"],
+            "full pipeline": ["glue_client", "dynamodb_client", "bedrock_client", "athena_client", "s3_client"],
+        },
+        # What config.py used to build at import time
+        "eager": ["bedrock_client", "athena_client", "s3_client", "glue_client"],
+    },
+    "nlq-kb": {
+        "path": [os.path.join(LAMBDA_DIR, "nlq-kb")],
+        "clients": ["agent_client", "dynamodb_client"],
+        "requests": {
+            "knowledge base query": ["agent_client", "dynamodb_client"],
+        },
+        "eager": ["agent_client"],
+    },
+}
+
+# Runs in the child process: prints the elapsed milliseconds of the measured block
+CHILD = """
+import sys, time
+sys.path[:0] = {path!r}
+start = time.perf_counter()
+import lambda_function
+import config
+imported = time.perf_counter()
+{body}
+print((imported - start) * 1000, (time.perf_counter() - imported) * 1000)
+"""
+
+EAGER_RESOURCE = """
+import boto3
+boto3.resource('dynamodb').Table(config.TABLE_NAME)
+"""
+
+
+def measure(path, body, runs):
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"), TABLE_NAME="nlq-benchmark-history")
+    imports, work = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CHILD.format(path=path, body=body)],
+                                capture_output=True, text=True, env=env, check=True).stdout.split()
+        imports.append(float(output[-2]))
+        work.append(float(output[-1]))
+    return statistics.median(imports), statistics.median(work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, spec in LAMBDAS.items():
+        print(f"{name} (median of {args.runs} fresh processes)")
+
+        import_ms, _ = measure(spec["path"], "", args.runs)
+        print(f"  {'handler import (lazy clients)':<40} {import_ms:>8.1f} ms")
+
+        for client in spec["clients"]:
+            _, client_ms = measure(spec["path"], f"config.{client}", args.runs)
+            print(f"  {'first use of ' + client:<40} {client_ms:>8.1f} ms")
+
+        for request, clients in spec["requests"].items():
+            _, request_ms = measure(spec["path"], "\n".join(f"config.{client}" for client in clients), args.runs)
+            print(f"  {'clients for ' + request:<40} {request_ms:>8.1f} ms")
+
+        eager = "\n".join(f"config.{client}" for client in spec["eager"]) + EAGER_RESOURCE
+        _, eager_ms = measure(spec["path"], eager, args.runs)
+        print(f"  {'previous eager setup (clients + resource)':<40} {eager_ms:>8.1f} ms")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark conversation history size as a chat session grows.
+
+Plays a long session against an in-memory stand-in for the DynamoDB history table. Every
+answer carries a markdown table, as real answers do. For each turn it reports the history
+tokens the previous behaviour would send (every stored message, in full) and the tokens the
+compacted context sends for SQL generation and for the whole kept window. The session is played
+again with --tight-budget, so that turns are also folded by the budget while they are still
+inside the HISTORY_MAX_TURNS window. Exits non-zero if, before any question of either session:
+
+- the compacted history exceeds the session's token budget
+- reading the history folds turns again (each turn is folded once, into the 0_summary item)
+- a turn at or before the summary's "through" timestamp is still in the window
+- a question is missing from, or repeated across, the summary and the window (only the oldest
+  may drop out of the summary)
+
+    python history_compaction.py [--turns 100] [--rows 20] [--tight-budget 1000]
+"""
+import argparse
+import os
+import re
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NLQ_DIR = os.path.join(HERE, "..", "nlq")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("TABLE_NAME", "nlq-benchmark-history")
+
+import config
+import dynamodb
+from compaction import message_tokens
+from conversation import ConversationContext, _sort_key
+
+SESSION_ID = "benchmark-session"
+
+
+class StubDynamoDB:
+    # A single-session history table behind the low-level client API, keyed by the "timestamp" sort key
+
+    def __init__(self):
+        self.items = {}
+        self.calls = {"query": 0, "get_item": 0, "put_item": 0, "batch_write_item": 0}
+
+    def batch_write_item(self, RequestItems):
+        self.calls["batch_write_item"] += 1
+        for requests in RequestItems.values():
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                self.items[item["timestamp"]["S"]] = item
+        return {"UnprocessedItems": {}}
+
+    def put_item(self, TableName, Item):
+        self.calls["put_item"] += 1
+        self.items[Item["timestamp"]["S"]] = Item
+
+    def get_item(self, TableName, Key):
+        self.calls["get_item"] += 1
+        item = self.items.get(Key["timestamp"]["S"])
+        return {"Item": item} if item else {}
+
+    def query(self, Limit, ExclusiveStartKey=None, **kwargs):
+        # Newest first, excluding the summary item, as the key condition does
+        self.calls["query"] += 1
+        keys = sorted((key for key in self.items if key > dynamodb.SUMMARY_TIMESTAMP), reverse=True)
+        if ExclusiveStartKey:
+            keys = [key for key in keys if key < ExclusiveStartKey["timestamp"]["S"]]
+        page = keys[:Limit]
+        response = {"Items": [self.items[key] for key in page]}
+        if len(keys) > Limit:
+            response["LastEvaluatedKey"] = {"id": {"S": SESSION_ID}, "timestamp": {"S": page[-1]}}
+        return response
+
+
+def make_answer(turn, rows):
+    table = ["| campaign | total |", "| --- | --- |"]
+    table += [f"| Campaign {turn}-{row} | {1000 + row * 37}.00 |" for row in range(rows)]
+    return (f"Here are the donation totals for question {turn}. The campaign with the highest total "
+            f"raised noticeably more than the rest.\n\n" + "\n".join(table))
+
+
+def full_history_tokens(table):
+    # Previous behaviour: every stored message, answers included in full
+    return sum(message_tokens(dynamodb._deserialize(item)["message"]) for key, item in table.items.items() if key > dynamodb.SUMMARY_TIMESTAMP)
+
+
+def check_turn(table, context, turn, summary_writes):
+    # Problems with the history read before asking question `turn`
+    problems = []
+    window_tokens = sum(message_tokens(m) for m in context.messages())
+    if window_tokens > context.token_budget:
+        problems.append(f"history of {window_tokens} tokens exceeds the {context.token_budget} token budget")
+    if table.calls["put_item"] != summary_writes:
+        problems.append("reading the history folded turns that were already folded")
+
+    stored = table.items.get(dynamodb.SUMMARY_TIMESTAMP)
+    summary = dynamodb._deserialize(stored) if stored else {"summary": "", "through": ""}
+    if summary["through"] and any(_sort_key(kept["timestamp"]) <= _sort_key(summary["through"]) for kept in context._turns):
+        problems.append(f"a turn at or before {summary['through']} is still in the window")
+
+    summarized = [int(number) for number in re.findall(r"for question (\d+)\?", summary["summary"])]
+    kept = [int(number) for kept in context._turns for number in re.findall(r"for question (\d+)\?", kept["user"]["content"][0]["text"])]
+    asked = summarized + kept
+    if asked != list(range(turn - len(asked), turn)):
+        problems.append(f"questions {asked} are not the last {len(asked)} asked, each once")
+    return [f"turn {turn}: {problem}" for problem in problems]
+
+
+def play(turns, rows, token_budget, report=()):
+    # Plays a session on a fresh table; returns the table, the largest history sent and any problems
+    table = StubDynamoDB()
+    config.dynamodb_client = table
+
+    largest = 0
+    problems = []
+    for turn in range(1, turns + 1):
+        context = ConversationContext(SESSION_ID, token_budget=token_budget)
+        problems += check_turn(table, context, turn, table.calls["put_item"])
+        sql_tokens = sum(message_tokens(m) for m in context.messages(config.SQL_HISTORY_TURNS))
+        window_tokens = sum(message_tokens(m) for m in context.messages())
+        largest = max(largest, window_tokens)
+
+        if turn in report:
+            print(f"{turn:>5} {full_history_tokens(table):>13} {sql_tokens:>12} {window_tokens:>12}")
+
+        context.add_turn(f"What were the donation totals by campaign for question {turn}?",
+                         f"SELECT c.campaignname, SUM(d.donationamount) FROM sample_donations d JOIN sample_campaigns c "
+                         f"ON d.campaignkey = c.campaignkey WHERE d.datekey > {turn} GROUP BY 1",
+                         make_answer(turn, rows))
+    return table, largest, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=20, help="rows in each answer's markdown table")
+    parser.add_argument("--tight-budget", type=int, default=1000,
+                        help="budget of a second session, small enough that turns are folded while still inside the window")
+    args = parser.parse_args()
+
+    config.logger.setLevel("WARNING")
+
+    print(f"budget {config.HISTORY_TOKEN_BUDGET} tokens (summary {config.HISTORY_SUMMARY_MAX_TOKENS}), "
+          f"window {config.HISTORY_MAX_TURNS} turns, SQL generation sends {config.SQL_HISTORY_TURNS}\n")
+    print(f"{'turn':>5} {'full history':>13} {'sql context':>12} {'kept window':>12}")
+
+    report = {1, 2, 5, 10, 20, 50, args.turns}
+    table, largest, problems = play(args.turns, args.rows, config.HISTORY_TOKEN_BUDGET, report)
+
+    calls = table.calls
+    print(f"\nDynamoDB calls over {args.turns} turns: {calls['query']} queries, {calls['get_item']} summary reads, "
+          f"{calls['put_item']} summary writes, {calls['batch_write_item']} batched turn writes")
+    print(f"largest history sent: {largest} tokens")
+
+    _, tight_largest, tight_problems = play(args.turns, args.rows, args.tight_budget)
+    print(f"largest history sent with a {args.tight_budget} token budget: {tight_largest} tokens")
+
+    problems += tight_problems
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""Replay a corpus of questions through the nlq Lambda handler, offline.
+
+Each question in the corpus (fixtures/replay_corpus.json) goes through lambda_handler as an API
+Gateway request. AWS is replaced by recorded and local stand-ins:
+
+- Glue answers with the recorded catalog of the sample tables (fixtures/glue_get_tables.json)
+- Bedrock answers with the responses recorded for each question, in order, and reports token usage
+  estimated from the request it was actually sent
+- Athena runs the generated SQL on the local query engine (services/local_engine.py, sqlite) over
+  the backend/sample_data CSVs, and serves the results through the same results API and S3 result
+  object the Lambda reads
+- DynamoDB is an in-memory history table, so follow-up questions in a session see earlier turns
+
+The answer cache and Athena result reuse are off, so every question does the full amount of work.
+The report shows throughput, per-stage latency from the request traces, SQL generation attempts
+and calls (which differ with SQL_CANDIDATES) and the prompt tokens sent to Bedrock. Recorded model
+latencies are only simulated with --replay-latency.
+
+Exits non-zero if a question fails or does not take its recorded number of attempts or rows, or if
+prompt tokens, attempts or SQL generation calls grow beyond --tolerance compared with a --baseline
+report saved by --save.
+
+    python replay.py [--repeat 3] [--replay-latency] [--save report.json] [--baseline report.json]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NLQ_DIR = os.path.join(HERE, "..", "nlq")
+SAMPLE_DATA_DIR = os.path.join(HERE, "..", "..", "sample_data")
+FIXTURES_DIR = os.path.join(HERE, "fixtures")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("TABLE_NAME", "nlq-benchmark-history")
+os.environ.setdefault("ATHENA_OUTPUT", "s3://nlq-replay-results/")
+
+import config
+import intents
+import lambda_function
+import local_engine
+from tokens import estimate_tokens
+
+RESULTS_PAGE_SIZE = 1000
+# Characters per content delta in streamed responses
+STREAM_CHUNK_CHARS = 40
+
+
+class LambdaContext:
+
+    def __init__(self, timeout_ms=30000):
+        self.aws_request_id = str(uuid.uuid4())
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+#### GLUE ####
+
+class RecordedGlue:
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.page = json.load(f)
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, DatabaseName):
+        yield self.page
+
+
+#### ATHENA ON THE LOCAL QUERY ENGINE ####
+
+def _varchar(value):
+    return {} if value is None else {"VarCharValue": str(value)}
+
+
+class SqliteAthena:
+    # Runs each query to completion on the local query engine in start_query_execution; results are
+    # kept per execution id and served through get_query_results and as the CSV result object in S3
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.executions = {}
+        self.calls = {"start_query_execution": 0, "get_query_execution": 0, "get_query_results": 0}
+
+    def start_query_execution(self, QueryString, ResultConfiguration, **request):
+        self.calls["start_query_execution"] += 1
+        execution_id = str(uuid.uuid4())
+        start = time.perf_counter()
+        try:
+            output = self.engine.execute(QueryString, max_rows=sys.maxsize, max_bytes=sys.maxsize)
+            columns = [{"Name": col["name"], "Type": col["type"]} for col in output["columns"]]
+            rows = output["rows"]
+            status = {"State": "SUCCEEDED"}
+        except local_engine.LocalQueryError as e:
+            columns, rows = [], []
+            status = {"State": "FAILED", "StateChangeReason": str(e)}
+
+        self.executions[execution_id] = {
+            "QueryExecutionId": execution_id,
+            "Query": QueryString,
+            "Status": status,
+            "Statistics": {"EngineExecutionTimeInMillis": int((time.perf_counter() - start) * 1000),
+                           "QueryQueueTimeInMillis": 0, "DataScannedInBytes": 0},
+            "ResultConfiguration": {"OutputLocation": f"{ResultConfiguration['OutputLocation']}{execution_id}.csv"},
+            "columns": columns,
+            "rows": rows,
+        }
+        return {"QueryExecutionId": execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        self.calls["get_query_execution"] += 1
+        execution = self.executions[QueryExecutionId]
+        return {"QueryExecution": {key: value for key, value in execution.items() if key not in ("columns", "rows")}}
+
+    def stop_query_execution(self, QueryExecutionId):
+        pass
+
+    def get_query_results(self, QueryExecutionId, MaxResults=RESULTS_PAGE_SIZE, NextToken=None):
+        self.calls["get_query_results"] += 1
+        execution = self.executions[QueryExecutionId]
+        # The header is the first row of the first page, as in Athena
+        rows = [tuple(col["Name"] for col in execution["columns"])] + execution["rows"]
+        offset = int(NextToken or 0)
+        page = rows[offset:offset + MaxResults]
+        response = {"ResultSet": {
+            "ResultSetMetadata": {"ColumnInfo": execution["columns"]},
+            "Rows": [{"Data": [_varchar(value) for value in row]} for row in page],
+        }}
+        if offset + MaxResults < len(rows):
+            response["NextToken"] = str(offset + MaxResults)
+        return response
+
+    def result_csv(self, key):
+        execution = self.executions[key.rsplit("/", 1)[-1][:-len(".csv")]]
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_ALL)
+        writer.writerow(col["Name"] for col in execution["columns"])
+        writer.writerows(["" if value is None else value for value in row] for row in execution["rows"])
+        return output.getvalue().encode("utf-8")
+
+
+class ResultObjects:
+    # The S3 result objects of the sqlite executions
+
+    class Body:
+
+        def __init__(self, data):
+            self.data = data
+
+        def iter_lines(self, keepends=False):
+            return iter(self.data.splitlines(keepends))
+
+    def __init__(self, athena):
+        self.athena = athena
+
+    def get_object(self, Bucket, Key):
+        return {"Body": self.Body(self.athena.result_csv(Key))}
+
+
+#### BEDROCK ####
+
+def _request_text(request):
+    parts = [block.get("text", "") for block in request.get("system", [])]
+    parts += [block.get("text", "") for message in request["messages"] for block in message["content"]]
+    return "\n".join(parts)
+
+
+class RecordedBedrock:
+    # Serves the recorded responses for the question in the prompt. SQL generation prompts start with
+    # <question>; each distinct failed query appended as feedback moves on to the next recorded attempt
+    # (parallel candidates all get the same recorded response, so they fail with the same query).
+
+    def __init__(self, corpus, replay_latency=False):
+        self.responses = {entry["question"]: entry["bedrock"] for entry in corpus}
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def _recorded(self, prompt):
+        if prompt.startswith("<question>"):
+            question = prompt[len("<question>"):].split("</question>")[0].strip()
+            failed = {part.strip().split("\n", 1)[0] for part in prompt.split("Update the below SQL query to resolve the issue:")[1:]}
+            attempt = len(failed) + 1
+            recorded = self.responses[question]["sql"]
+            return question, attempt, recorded[min(attempt, len(recorded)) - 1]
+        question = prompt.split("Question:", 1)[1].split("\n", 1)[0].strip()
+        return question, None, self.responses[question]["summary"]
+
+    def converse(self, **request):
+        question, attempt, recorded = self._recorded(request["messages"][-1]["content"][-1]["text"])
+        if self.replay_latency:
+            time.sleep(recorded.get("latency_ms", 0) / 1000)
+
+        usage = {"inputTokens": estimate_tokens(_request_text(request)), "outputTokens": estimate_tokens(recorded["text"])}
+        with self.lock:
+            self.calls.append({"question": question, "attempt": attempt, "input_tokens": usage["inputTokens"]})
+
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": recorded["text"]}]}},
+            "usage": usage,
+            "metrics": {"latencyMs": recorded.get("latency_ms", 0)},
+        }
+
+    def converse_stream(self, **request):
+        # The recorded response in a few deltas, with the recorded latency spread across them; used
+        # for cancellable candidate generation (SQL_CANDIDATES > 1)
+        question, attempt, recorded = self._recorded(request["messages"][-1]["content"][-1]["text"])
+        text = recorded["text"]
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        usage = {"inputTokens": estimate_tokens(_request_text(request)), "outputTokens": estimate_tokens(text)}
+        with self.lock:
+            self.calls.append({"question": question, "attempt": attempt, "input_tokens": usage["inputTokens"]})
+
+        def events():
+            for chunk in chunks:
+                if self.replay_latency:
+                    time.sleep(recorded.get("latency_ms", 0) / 1000 / len(chunks))
+                yield {"contentBlockDelta": {"delta": {"text": chunk}}}
+            yield {"metadata": {"usage": usage, "metrics": {"latencyMs": recorded.get("latency_ms", 0)}}}
+
+        return {"stream": events()}
+
+
+#### DYNAMODB ####
+
+class MemoryDynamoDB:
+    # History table behind the low-level client API, keyed by (id, timestamp)
+
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        with self.lock:
+            for requests in RequestItems.values():
+                for request in requests:
+                    item = request["PutRequest"]["Item"]
+                    self.items[(item["id"]["S"], item["timestamp"]["S"])] = item
+        return {"UnprocessedItems": {}}
+
+    def put_item(self, TableName, Item):
+        with self.lock:
+            self.items[(Item["id"]["S"], Item["timestamp"]["S"])] = Item
+
+    def get_item(self, TableName, Key):
+        item = self.items.get((Key["id"]["S"], Key["timestamp"]["S"]))
+        return {"Item": item} if item else {}
+
+    def query(self, ExpressionAttributeValues, Limit, ExclusiveStartKey=None, **kwargs):
+        # Newest first, excluding the summary item when the key condition does
+        id = ExpressionAttributeValues[":id"]["S"]
+        after = ExpressionAttributeValues.get(":summary", {"S": ""})["S"]
+        with self.lock:
+            keys = sorted((timestamp for item_id, timestamp in self.items if item_id == id and timestamp > after), reverse=True)
+        if ExclusiveStartKey:
+            keys = [key for key in keys if key < ExclusiveStartKey["timestamp"]["S"]]
+        page = keys[:Limit]
+        response = {"Items": [self.items[(id, key)] for key in page]}
+        if len(keys) > Limit:
+            response["LastEvaluatedKey"] = {"id": {"S": id}, "timestamp": {"S": page[-1]}}
+        return response
+
+
+#### REPLAY ####
+
+def replay(corpus, bedrock, athena, run):
+    # Sends every question through the handler; sessions get a fresh id per run
+    results = []
+    start = time.perf_counter()
+    for entry in corpus:
+        event = {
+            "headers": {config.TRACE_REQUEST_HEADER: "1"},
+            "body": json.dumps({"message": entry["question"], "id": f"{entry['session']}-{run}"}),
+        }
+        calls_before = len(bedrock.calls)
+        response = lambda_function.lambda_handler(event, LambdaContext())
+        trace = json.loads(response["headers"]["X-NLQ-Trace"])
+
+        stages = {}
+        for span in trace["spans"]:
+            stages[span["name"]] = stages.get(span["name"], 0) + span["duration_ms"]
+        calls = bedrock.calls[calls_before:]
+        rows = [span.get("rows") for span in trace["spans"] if span["name"] == "athena_query" and span.get("state") == "PASSED"]
+
+        results.append({
+            "question": entry["question"],
+            "status": response["statusCode"],
+            "total_ms": trace["total_ms"],
+            "stages": stages,
+            "attempts": max((call["attempt"] for call in calls if call["attempt"]), default=0),
+            "sql_calls": sum(1 for call in calls if call["attempt"]),
+            "prompt_tokens": sum(call["input_tokens"] for call in calls),
+            "rows": rows[-1] if rows else None,
+            "athena_queries": sum(1 for span in trace["spans"] if span["name"] == "athena_query"),
+        })
+    return results, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(corpus, runs, elapsed):
+    results = [result for run in runs for result in run]
+    stage_names = list(dict.fromkeys(stage for result in results for stage in result["stages"]))
+    return {
+        "questions": len(corpus),
+        "runs": len(runs),
+        "throughput_qps": round(len(results) / elapsed, 2),
+        "latency_ms": {
+            "p50": percentile([result["total_ms"] for result in results], 0.5),
+            "p95": percentile([result["total_ms"] for result in results], 0.95),
+        },
+        # Mean time per request in each stage (zero for requests that skipped it)
+        "stages_ms": {stage: round(statistics.mean(result["stages"].get(stage, 0) for result in results), 1) for stage in stage_names},
+        # Deterministic for a given corpus, so compared exactly against the baseline
+        "per_question": [{key: result[key] for key in ("question", "attempts", "sql_calls", "prompt_tokens", "rows", "athena_queries")} for result in runs[0]],
+        "attempts": sum(result["attempts"] for result in runs[0]),
+        "retries": sum(max(result["attempts"] - 1, 0) for result in runs[0]),
+        "sql_calls": sum(result["sql_calls"] for result in runs[0]),
+        "prompt_tokens": sum(result["prompt_tokens"] for result in runs[0]),
+    }
+
+
+def check(corpus, runs, report, baseline, tolerance):
+    problems = []
+    for run in runs:
+        for entry, result in zip(corpus, run):
+            if result["status"] != 200:
+                problems.append(f"{entry['question']!r} failed with status {result['status']}")
+            elif result["attempts"] != entry["expected_attempts"] or result["rows"] != entry["expected_rows"]:
+                problems.append(f"{entry['question']!r} took {result['attempts']} attempts for {result['rows']} rows, "
+                                f"recorded {entry['expected_attempts']} attempts for {entry['expected_rows']} rows")
+
+    if baseline:
+        for key in ("prompt_tokens", "attempts", "sql_calls"):
+            if report[key] > baseline[key] * (1 + tolerance):
+                problems.append(f"{key} grew from {baseline[key]} to {report[key]} (tolerance {tolerance:.0%})")
+    return sorted(set(problems))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(FIXTURES_DIR, "replay_corpus.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="times the corpus is replayed")
+    parser.add_argument("--replay-latency", action="store_true", help="sleep for the recorded Bedrock latencies")
+    parser.add_argument("--save", help="write the report as JSON, to use as a later --baseline")
+    parser.add_argument("--baseline", help="report saved by an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="allowed growth in prompt tokens, attempts and SQL calls")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)["questions"]
+
+    glue = RecordedGlue(os.path.join(FIXTURES_DIR, "glue_get_tables.json"))
+    athena = SqliteAthena(local_engine.LocalEngine(SAMPLE_DATA_DIR, "sample_"))
+    bedrock = RecordedBedrock(corpus, args.replay_latency)
+
+    config.glue_client = glue
+    config.athena_client = athena
+    config.s3_client = ResultObjects(athena)
+    config.bedrock_client = bedrock
+    config.dynamodb_client = MemoryDynamoDB()
+    config.ANSWER_CACHE_ENABLED = False
+    config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES = 0
+    config.METRICS_ENABLED = False
+    config.TRACE_HEADER_MAX_BYTES = 1024 * 1024
+    config.logger.setLevel("WARNING")
+
+    # The intent router's value dictionary is loaded in the background; replay against a warm instance
+    intents.load_all_values()
+
+    runs, elapsed = [], 0
+    for run in range(args.repeat):
+        results, run_elapsed = replay(corpus, bedrock, athena, run)
+        runs.append(results)
+        elapsed += run_elapsed
+    report = summarize(corpus, runs, elapsed)
+
+    print(f"{report['questions']} questions x {report['runs']} runs, SQL_CANDIDATES={config.SQL_CANDIDATES}, "
+          f"ASYNC_PIPELINE={config.ASYNC_PIPELINE}, recorded latency {'on' if args.replay_latency else 'off'}\n")
+    print(f"{'question':<60} {'attempts':>8} {'sql calls':>9} {'rows':>5} {'prompt tokens':>14}")
+    for result in report["per_question"]:
+        print(f"{result['question'][:60]:<60} {result['attempts']:>8} {result['sql_calls']:>9} {str(result['rows']):>5} {result['prompt_tokens']:>14}")
+
+    print(f"\n{'stage':<22} {'ms/request':>10}")
+    for stage, value in report["stages_ms"].items():
+        print(f"{stage:<22} {value:>10.1f}")
+
+    print(f"\nthroughput {report['throughput_qps']} questions/s, latency p50 {report['latency_ms']['p50']} ms, "
+          f"p95 {report['latency_ms']['p95']} ms")
+    print(f"SQL attempts {report['attempts']} ({report['retries']} retries, {report['sql_calls']} generation calls), prompt tokens {report['prompt_tokens']}, "
+          f"Athena executions {athena.calls['start_query_execution']}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"baseline: SQL attempts {baseline['attempts']}, prompt tokens {baseline['prompt_tokens']}, "
+              f"throughput {baseline['throughput_qps']} questions/s, latency p50 {baseline['latency_ms']['p50']} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    problems = check(corpus, runs, report, baseline, args.tolerance)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
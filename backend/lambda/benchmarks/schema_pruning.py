@@ -0,0 +1,131 @@
+"""Benchmark schema pruning on a large synthetic Glue catalog.
+
+Builds a catalog with the six sample tables plus several hundred distractor tables,
+then compares the full schema prompt (previous behaviour) with the pruned schema
+returned by the schema retrieval index: prompt tokens, per-question latency and
+whether the tables the question needs were kept.
+
+    python schema_pruning.py [--tables 400] [--scorer lexical|embedding|hybrid]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NLQ_DIR = os.path.join(HERE, "..", "nlq")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import config
+import metadata
+from tokens import estimate_tokens
+
+SAMPLE_TABLES = {
+    "sample_donations": ["donationkey", "donorkey", "campaignkey", "eventkey", "datekey", "donationamount", "paymentmethodkey"],
+    "sample_donors": ["donorkey", "donorid", "firstname", "lastname", "email", "phone", "address", "joindate", "donorstatus"],
+    "sample_campaigns": ["campaignkey", "campaignid", "campaignname", "startdate", "enddate", "campaigntype", "targetamount"],
+    "sample_events": ["eventkey", "eventid", "eventname", "eventdate", "eventlocation", "eventtype"],
+    "sample_date": ["datekey", "date", "day", "month", "year", "quarter", "isholiday"],
+    "sample_payment": ["paymentmethodkey", "paymentmethodname"],
+}
+
+QUESTIONS = [
+    ("What was the total donation amount for the March Miracle Makers campaign?", {"sample_donations", "sample_campaigns"}),
+    ("Who are the top 5 donors by total donations?", {"sample_donations", "sample_donors"}),
+    ("How much was donated through each payment method?", {"sample_donations", "sample_payment"}),
+    ("Which events took place in Central Park?", {"sample_events"}),
+    ("How many donors have an inactive status?", {"sample_donors"}),
+    ("What is the target amount of each crowdfunding campaign?", {"sample_campaigns"}),
+    ("Total donations per quarter in 2024", {"sample_donations", "sample_date"}),
+]
+
+DOMAINS = ["inventory", "shipment", "invoice", "employee", "payroll", "ticket", "vendor", "warehouse",
+           "product", "order", "customer", "asset", "contract", "lead", "budget", "forecast", "audit",
+           "session", "device", "sensor", "claim", "policy", "course", "enrollment", "facility"]
+SUFFIXES = ["fact", "dim", "history", "snapshot", "staging", "daily", "monthly", "log"]
+COLUMN_WORDS = ["id", "name", "status", "code", "amount", "quantity", "created", "updated", "owner", "region",
+                "category", "description", "price", "cost", "score", "level", "type", "flag", "note", "count"]
+
+
+def build_tables(total, seed=7):
+    rng = random.Random(seed)
+    tables = [{"Name": name, "UpdateTime": "2024-01-01", "StorageDescriptor": {"Columns": [{"Name": c, "Type": "string"} for c in cols]}}
+              for name, cols in SAMPLE_TABLES.items()]
+
+    while len(tables) < total:
+        domain = rng.choice(DOMAINS)
+        name = f"{domain}_{rng.choice(SUFFIXES)}_{len(tables)}"
+        columns = [f"{domain}key"] + [f"{domain}{rng.choice(COLUMN_WORDS)}" for _ in range(rng.randint(5, 25))]
+        columns += [f"{rng.choice(DOMAINS)}key" for _ in range(rng.randint(0, 3))]
+        tables.append({"Name": name, "UpdateTime": "2024-01-01",
+                       "StorageDescriptor": {"Columns": [{"Name": c, "Type": "string"} for c in dict.fromkeys(columns)]}})
+    return tables
+
+
+class StubGlue:
+    # Serves the synthetic catalog through the get_tables paginator in pages of 100
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, DatabaseName):
+        for i in range(0, len(self.tables), 100):
+            yield {"TableList": self.tables[i:i + 100]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=400)
+    parser.add_argument("--scorer", default="lexical", choices=["lexical", "embedding", "hybrid"])
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    config.glue_client = StubGlue(build_tables(args.tables))
+    config.SCHEMA_INDEX_SCORER = args.scorer
+    config.SCHEMA_INDEX_SAMPLE_VALUES = 0
+    config.logger.setLevel("WARNING")
+
+    # Before: every table goes into the prompt
+    config.SCHEMA_INDEX_TOP_K = args.tables + 1
+    start = time.perf_counter()
+    full_schema = metadata.render_schema(metadata.get_relevant_metadata(QUESTIONS[0][0]))
+    catalog_ms = (time.perf_counter() - start) * 1000
+    full_tokens = estimate_tokens(full_schema)
+
+    # After: top-k tables plus join neighbors
+    config.SCHEMA_INDEX_TOP_K = args.top_k
+    start = time.perf_counter()
+    metadata.get_relevant_metadata(QUESTIONS[0][0])
+    index_build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"catalog: {args.tables} tables, scorer={args.scorer}, top_k={args.top_k}")
+    print(f"full schema prompt: {full_tokens} tokens (catalog load {catalog_ms:.1f} ms)")
+    print(f"index build (once per schema version): {index_build_ms:.1f} ms\n")
+    print(f"{'question':<60} {'tables':>6} {'tokens':>7} {'ms':>7}  recall")
+
+    latencies, token_counts, hits = [], [], 0
+    for question, expected in QUESTIONS:
+        start = time.perf_counter()
+        pruned = metadata.get_relevant_metadata(question)
+        text = metadata.render_schema(pruned)
+        elapsed = (time.perf_counter() - start) * 1000
+        recalled = expected <= set(pruned)
+        hits += recalled
+
+        latencies.append(elapsed)
+        token_counts.append(estimate_tokens(text))
+        print(f"{question[:58]:<60} {len(pruned):>6} {token_counts[-1]:>7} {elapsed:>7.2f}  {'ok' if recalled else 'MISSED'}")
+
+    print(f"\nmean pruned prompt: {statistics.mean(token_counts):.0f} tokens "
+          f"({100 * (1 - statistics.mean(token_counts) / full_tokens):.1f}% smaller than full schema)")
+    print(f"mean selection latency: {statistics.mean(latencies):.2f} ms, recall {hits}/{len(QUESTIONS)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""One-off backfill of the verified-examples partition from existing chat history.
+
+The nlq Lambda writes each question it answers with working SQL to the
+verified-examples partition of the history table, and the example store only
+reads that partition. Run this once after deploying to add the questions that
+were answered before then. It scans the whole history table, so run it offline,
+not from the Lambda. It needs AWS credentials plus the same environment variables
+as the deployed Lambda (TABLE_NAME, GLUE_CATALOG, GLUE_DB, ...), since each pair
+is validated against the current schema before it is written.
+
+    python seed_examples.py [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+
+NLQ_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nlq")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+
+import athena
+import config
+import dynamodb
+import history
+import metadata
+import sql_validator
+
+
+def scan_messages(source):
+    # Message items of every session recorded by the given pipeline (items written before turns had a
+    # source attribute are included)
+    scan_args = {
+        "TableName": config.TABLE_NAME,
+        "FilterExpression": "attribute_exists(#message) AND (attribute_not_exists(#source) OR #source = :source)",
+        "ExpressionAttributeNames": {"#id": "id", "#timestamp": "timestamp", "#message": "message", "#source": "source"},
+        "ExpressionAttributeValues": {":source": {"S": source}},
+        "ProjectionExpression": "#id, #timestamp, #message",
+    }
+    while True:
+        response = config.dynamodb_client.scan(**scan_args)
+        yield from map(dynamodb._deserialize, response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            break
+        scan_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def pair_turns(items):
+    # (question, sql) for each user message followed by an assistant answer with SQL, newest first.
+    # Both messages of a turn share the time part of their "<time.time()>_<index>" sort key.
+    turns = {}
+    for item in items:
+        message = item.get("message") or {}
+        turn = turns.setdefault((item["id"], item["timestamp"].partition("_")[0]), {})
+        turn[message.get("role")] = message
+
+    pairs = []
+    for _, turn in sorted(turns.items(), key=lambda entry: float(entry[0][1]), reverse=True):
+        if "user" not in turn or "assistant" not in turn:
+            continue
+        try:
+            question = turn["user"]["content"][0]["text"]
+            sql = json.loads(turn["assistant"]["content"][0]["text"]).get("sql_query")
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+        if question and sql:
+            pairs.append((question, sql))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="count the pairs without writing them")
+    args = parser.parse_args()
+
+    pairs = pair_turns(scan_messages("nlq"))
+    schema_details = metadata.get_full_metadata()
+
+    examples, fingerprints = [], set()
+    for question, sql in pairs:
+        sql = " ".join(sql.split())
+        fingerprint = athena.fingerprint_sql(sql)
+        # Newest first, so the latest question for equivalent SQL is kept
+        if fingerprint in fingerprints or not sql_validator.validate_sql(sql, schema_details)["valid"]:
+            continue
+        fingerprints.add(fingerprint)
+        examples.append((fingerprint, question, sql))
+
+    if not args.dry_run:
+        # Item keys are stamped in the order the questions were asked, since the example store reads
+        # the newest items first
+        history.write_items([dynamodb.example_item(*example) for example in reversed(examples)])
+    print(f"{len(examples)} verified examples from {len(pairs)} answered questions{' (dry run)' if args.dry_run else ''}")
+
+
+if __name__ == "__main__":
+    main()
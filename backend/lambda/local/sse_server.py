@@ -0,0 +1,105 @@
+"""Local stand-in for Lambda response streaming.
+
+Serves POST /nlq on localhost and writes the pipeline's progress events as
+Server-Sent Events while they happen, so the web app can be developed against
+true incremental output. It calls the real AWS services, so it needs AWS
+credentials plus the same environment variables as the deployed Lambda.
+
+The nlq pipeline (the default) needs ATHENA_OUTPUT, GLUE_CATALOG, GLUE_DB,
+ATHENA_WORKGROUP, TABLE_NAME and MODEL_ID. With QUERY_ENGINE=local, generated SQL
+runs on the local query engine over backend/sample_data instead, and only Bedrock
+and DynamoDB are called. With --pipeline kb, /nlq is answered by the Knowledge
+Base Lambda (nlq-kb) instead, as in the KB deployment mode; it needs
+KNOWLEDGE_BASE_ID, MODEL_ID and TABLE_NAME.
+
+    python sse_server.py [--port 8787] [--pipeline nlq|kb]
+
+Then set VITE_API_ENDPOINT=http://localhost:8787/ and VITE_STREAMING=true in frontend/web/.env.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PIPELINE_DIRS = {"nlq": "nlq", "kb": "nlq-kb"}
+
+# The pipeline's lambda_function module, imported by main()
+lambda_function = None
+pipeline = None
+
+
+def load_pipeline(name):
+    # Both Lambdas have top-level lambda_function and config modules, so only one can be loaded
+    global lambda_function, pipeline
+    directory = os.path.join(LAMBDA_DIR, PIPELINE_DIRS[name])
+    sys.path[:0] = [directory, os.path.join(directory, "services"), os.path.join(LAMBDA_DIR, "shared", "python")]
+    lambda_function = importlib.import_module("lambda_function")
+    pipeline = name
+
+
+def stream_events(body):
+    # (event, data) tuples from the loaded pipeline, as they happen
+    if pipeline == "kb":
+        return lambda_function.stream_answer(body.get("message"), body.get("kb_session_id"), body.get("id"))
+    return lambda_function.stream_final_output(body.get("message"), body.get("id"))
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def _cors(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "Authorization,Content-Type,Accept")
+        self.send_header("Access-Control-Allow-Methods", "OPTIONS,POST")
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self._cors()
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/nlq":
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if "text/event-stream" not in (self.headers.get("Accept") or ""):
+            # Same response the Lambda returns through API Gateway
+            response = lambda_function.lambda_handler({"body": body}, None)
+            self.send_response(response["statusCode"])
+            self._cors()
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(response["body"].encode("utf-8"))
+            return
+
+        self.send_response(200)
+        self._cors()
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        for event, data in stream_events(body):
+            self.wfile.write(lambda_function.format_sse(event, data).encode("utf-8"))
+            self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--pipeline", choices=sorted(PIPELINE_DIRS), default="nlq",
+                        help="answer /nlq with the custom pipeline or the Knowledge Base Lambda")
+    args = parser.parse_args()
+    load_pipeline(args.pipeline)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Serving the {args.pipeline} pipeline on http://127.0.0.1:{args.port}/nlq")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
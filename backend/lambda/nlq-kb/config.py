@@ -1,19 +1,37 @@
 import os
 import logging
+import threading
 import boto3
 from botocore.config import Config
 
 # AWS Session & Clients
-REGION = boto3.session.Session().region_name
+# Clients are created on first use and cached for the life of the container, and share one session
 RETRY_CONFIG = Config(retries={'max_attempts': 10})
-session = boto3.Session(region_name=REGION)
 
-# Initialize Bedrock client
-agent_client = session.client('bedrock-agent-runtime', region_name=REGION, config=RETRY_CONFIG)
+_CLIENT_SERVICES = {
+    "agent_client": "bedrock-agent-runtime",  # Bedrock Knowledge Bases
+    "dynamodb_client": "dynamodb",            # conversation history
+}
 
-# Initialize DynamoDB for conversation history
-dynamodb = boto3.resource('dynamodb')
-dynamodb_table = dynamodb.Table(os.environ.get('TABLE_NAME'))
+_session = None
+_client_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def __getattr__(name):
+    # Resolves config.<service>_client on first access (PEP 562)
+    if name not in _CLIENT_SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _client_lock:
+        if name not in globals():
+            globals()[name] = get_session().client(_CLIENT_SERVICES[name], config=RETRY_CONFIG)
+    return globals()[name]
 
 # Logger Configuration
 logger = logging.getLogger(__name__)
@@ -23,4 +41,10 @@ logger.addHandler(logging.StreamHandler())
 
 # Environment Variables
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
-MODEL_ID = os.environ.get('MODEL_ID')
\ No newline at end of file
+MODEL_ID = os.environ.get('MODEL_ID')
+TABLE_NAME = os.environ.get('TABLE_NAME')
+
+# Answers to standalone questions (no kb_session_id) are cached with their generated SQL and citations,
+# keyed by knowledge base ID and normalized question. KB_CACHE_TTL_SECONDS=0 disables the cache.
+KB_CACHE_TTL_SECONDS = int(os.environ.get('KB_CACHE_TTL_SECONDS', '300'))
+KB_CACHE_MAX_ENTRIES = int(os.environ.get('KB_CACHE_MAX_ENTRIES', '128'))
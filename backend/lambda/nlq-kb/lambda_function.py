@@ -1,9 +1,17 @@
 import config
-import boto3
 import os
 import json
+import queue
+import re
+import sys
+import threading
 import time
-from botocore.config import Config
+from collections import OrderedDict
+
+# history.py is shared with the other Lambdas through a layer, which the runtime puts on the path;
+# outside Lambda it is read from its source directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+import history
 
 
 def lambda_handler(event, context):
@@ -33,6 +41,7 @@ def lambda_handler(event, context):
             
             user_prompt = body.get('message')
             session_id = body.get('kb_session_id')
+            conversation_id = body.get('id')
             
             config.logger.info(f'User prompt: {user_prompt}')
             config.logger.info(f'Session: {session_id}')
@@ -40,7 +49,8 @@ def lambda_handler(event, context):
         else:
             # Direct Lambda invocation
             user_prompt = event.get('message')
-            session_id = body.get('kb_session_id')
+            session_id = event.get('kb_session_id')
+            conversation_id = event.get('id')
             
             config.logger.info(f'User prompt: {user_prompt}')
             config.logger.info(f'Session: {session_id}')
@@ -53,24 +63,13 @@ def lambda_handler(event, context):
             }
         
         # Invoke the model and get the response
-        response_output, sql_query, response_session_id = invoke_model(user_prompt, session_id)
-        
-        config.logger.info(f'Output: {response_output}')
-        config.logger.info(f'SQL: {sql_query}')
-        config.logger.info(f'Session: {response_session_id}')
-        
-        # Write the exchange to DynamoDB for historical analysis
-        write_history_to_dynamodb(user_prompt, response_output, sql_query, response_session_id)
+        output = answer_question(user_prompt, session_id, conversation_id)
         
         # Return the response with CORS headers
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
-                'answer': response_output,
-                'sql_query': sql_query,
-                'kb_session_id': response_session_id
-            })
+            'body': json.dumps(output)
         }
     
     except Exception as e:
@@ -81,8 +80,49 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def invoke_model(user_prompt, session_id):
 
+def _no_events(event, data):
+    pass
+
+
+def answer_question(user_prompt, session_id, conversation_id=None, emit=None):
+    # Answers the question from the cache or the knowledge base, records the exchange and returns
+    # the API response. With emit, the answer is generated with retrieve_and_generate_stream and
+    # reported as it is produced. A cached answer has no knowledge base session, so the next turn
+    # starts a new one.
+    cached = answer_cache.get(user_prompt) if not session_id else None
+    if cached is not None:
+        config.logger.info("Serving answer from the knowledge base answer cache")
+        response_output, citations, response_session_id = cached["answer"], cached["citations"], ""
+        if emit is not None:
+            emit("token", {"text": response_output})
+    elif emit is not None:
+        emit("status", {"stage": "retrieving"})
+        response_output, citations, response_session_id = invoke_model_stream(user_prompt, session_id, emit)
+    else:
+        response_output, citations, response_session_id = invoke_model(user_prompt, session_id)
+
+    sql_query = sql_from_citations(citations)
+
+    config.logger.info(f'Output: {response_output}')
+    config.logger.info(f'SQL: {sql_query}')
+    config.logger.info(f'Session: {response_session_id}')
+
+    # Only standalone questions are cached: within a session the answer depends on earlier turns
+    if cached is None and not session_id:
+        answer_cache.put(user_prompt, {"answer": response_output, "citations": citations})
+
+    # Record the exchange for historical analysis
+    write_history(user_prompt, response_output, sql_query, conversation_id, response_session_id)
+
+    return {
+        'answer': response_output,
+        'sql_query': sql_query,
+        'kb_session_id': response_session_id
+    }
+
+
+def _retrieve_and_generate_args(user_prompt, session_id):
     retrieve_and_generate_args = {
         'input': {
             'text': user_prompt,
@@ -100,39 +140,163 @@ def invoke_model(user_prompt, session_id):
     if session_id:
         retrieve_and_generate_args['sessionId'] = session_id
 
+    return retrieve_and_generate_args
+
+
+def invoke_model(user_prompt, session_id):
+    # Returns (answer, citations, session id). Failures are raised to the handler, which returns them
+    # as a 500 response.
     try:
         # Pass our arguments to the bedrock knowledge bases retrieve and generate request
-        response = config.agent_client.retrieve_and_generate(**retrieve_and_generate_args)
-    
-        response_output = response['output']['text']
-        sql_sample = response["citations"][0]["retrievedReferences"][0]["location"]["sqlLocation"]["query"]
-        response_session_id = response.get('sessionId')
-    
-        return response_output, sql_sample, response_session_id
-        
+        response = config.agent_client.retrieve_and_generate(**_retrieve_and_generate_args(user_prompt, session_id))
     except Exception as e:
         config.logger.error(f"Knowledge Base query failed: {str(e)}")
-        
+        raise
 
-def write_history_to_dynamodb(user_prompt, response_output, sql_query, response_session_id):
-    # Take in message from conversation history
-    # Augment with session id and the timestamp
-    # Write to DynamoDB
-    
-    timestamp = str(time.time())
-    
-    dynamodb_item = {
-        "id": response_session_id,
-        "timestamp": timestamp,
-        "question": user_prompt,
-        "response": response_output,
-        "sql_query": sql_query
-    }
-    
+    citations = extract_citations(response.get("citations"))
+    return response.get('output', {}).get('text', ''), citations, response.get('sessionId')
+
+
+def invoke_model_stream(user_prompt, session_id, emit=_no_events):
+    # Same as invoke_model, but reports the answer as "token" events and each SQL query the
+    # knowledge base ran as a "sql" event while the response is generated
     try:
-        config.dynamodb_table.put_item(Item=dynamodb_item)
-        config.logger.info(f"Chat history written to DynamoDB successfully.")
+        response = config.agent_client.retrieve_and_generate_stream(**_retrieve_and_generate_args(user_prompt, session_id))
 
+        text, citations = [], []
+        for event in response['stream']:
+            if 'output' in event:
+                chunk = event['output'].get('text', '')
+                text.append(chunk)
+                emit("token", {"text": chunk})
+            elif 'citation' in event:
+                # The citation is nested under "citation"; older responses carry its fields directly
+                citation = event['citation'].get('citation') or event['citation']
+                for reference in extract_citations([citation]):
+                    citations.append(reference)
+                    if reference["query"]:
+                        emit("sql", {"sql_query": reference["query"]})
+    except Exception as e:
+        config.logger.error(f"Knowledge Base query failed: {str(e)}")
+        raise
+
+    return ''.join(text), citations, response.get('sessionId')
+
+
+#### CITATIONS ####
+
+def extract_citations(citations):
+    # Flattens retrieve_and_generate citations into one entry per retrieved reference. Structured
+    # knowledge bases return the SQL they ran in an sqlLocation; other data sources (or answers
+    # generated without any retrieval) have none, so every field is optional.
+    references = []
+    for citation in citations or []:
+        for reference in (citation or {}).get("retrievedReferences") or []:
+            location = reference.get("location") or {}
+            details = next((value for key, value in location.items() if key.endswith("Location") and isinstance(value, dict)), {})
+            references.append({
+                "type": location.get("type", ""),
+                "query": (location.get("sqlLocation") or {}).get("query", ""),
+                "uri": details.get("uri") or details.get("url", ""),
+                "text": (reference.get("content") or {}).get("text", ""),
+            })
+    return references
+
+
+def sql_from_citations(references):
+    # The first SQL query behind the answer, or "" when the knowledge base did not run one
+    return next((reference["query"] for reference in references if reference["query"]), "")
+
+
+#### ANSWER CACHE ####
+
+def normalize_question(question):
+    # Lowercase, drop punctuation and collapse whitespace so trivial variations share a key
+    return " ".join(re.sub(r"[^\w\s]", " ", (question or "").lower()).split())
+
+
+class AnswerCache:
+    # Short-lived LRU of answers and citations, keyed by knowledge base ID and normalized question.
+    # Survives across warm invocations.
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, question):
+        return f"{config.KNOWLEDGE_BASE_ID}|{normalize_question(question)}"
+
+    def get(self, question):
+        if self.ttl_seconds <= 0:
+            return None
+        key = self._key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry["value"]
+
+    def put(self, question, value):
+        if self.ttl_seconds <= 0:
+            return
+        key = self._key(question)
+        with self._lock:
+            self._entries[key] = {"expires_at": time.time() + self.ttl_seconds, "value": value}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+answer_cache = AnswerCache(config.KB_CACHE_MAX_ENTRIES, config.KB_CACHE_TTL_SECONDS)
+
+
+#### STREAMING MODE ####
+
+# Used by the local SSE server (local/sse_server.py --pipeline kb), which writes each event as it
+# arrives; the Lambda behind API Gateway always answers with JSON
+
+def stream_answer(user_prompt, session_id, conversation_id=None):
+    # Answers on a worker thread and yields (event, data) tuples as they happen, ending with a
+    # "done" event carrying the full response (or an "error" event)
+    events = queue.Queue()
+
+    def run():
+        try:
+            output = answer_question(user_prompt, session_id, conversation_id, emit=lambda event, data: events.put((event, data)))
+            events.put(("done", output))
+        except Exception as e:
+            config.logger.error(f"Error: {str(e)}")
+            events.put(("error", {"answer": str(e), "sql_query": ""}))
+        events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        yield item
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def write_history(user_prompt, response_output, sql_query, conversation_id, response_session_id):
+    # Recorded with the same schema as the nlq Lambda's turns, keyed by the web app's conversation id
+    # (the knowledge base session id for direct invocations without one)
+    try:
+        history.record_turn(
+            conversation_id or response_session_id,
+            history.turn_messages(user_prompt, sql_query, response_output),
+            "nlq-kb",
+            kb_session_id=response_session_id or "",
+        )
     except Exception as e:
         config.logger.error(f"Failed to write chat history to DynamoDB: {str(e)}")
-        
\ No newline at end of file
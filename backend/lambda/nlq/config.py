@@ -1,5 +1,6 @@
 import os
 import logging
+import threading
 import boto3
 from botocore.config import Config
 
@@ -11,22 +12,156 @@ ATHENA_WORKGROUP = os.environ.get('ATHENA_WORKGROUP')
 TABLE_NAME = os.environ.get('TABLE_NAME')
 MODEL_ID = os.environ.get('MODEL_ID')
 
+# Answer cache (exact match on the normalized question, optional similarity tier)
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_BACKEND = os.environ.get('ANSWER_CACHE_BACKEND', 'memory')  # "memory" or "file"
+ANSWER_CACHE_PATH = os.environ.get('ANSWER_CACHE_PATH', '/tmp/nlq_answer_cache.json')
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '900'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '256'))
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get('ANSWER_CACHE_SIMILARITY_THRESHOLD', '0'))  # 0 disables the similarity tier
+
+# Glue metadata catalog refresh interval (the catalog is cached across warm invocations)
+METADATA_CACHE_TTL_SECONDS = int(os.environ.get('METADATA_CACHE_TTL_SECONDS', '300'))
+
+# Schema pruning: databases with more than SCHEMA_INDEX_TOP_K tables only send the most relevant ones
+SCHEMA_INDEX_TOP_K = int(os.environ.get('SCHEMA_INDEX_TOP_K', '8'))
+SCHEMA_INDEX_MAX_NEIGHBORS = int(os.environ.get('SCHEMA_INDEX_MAX_NEIGHBORS', '2'))
+SCHEMA_INDEX_SCORER = os.environ.get('SCHEMA_INDEX_SCORER', 'lexical')  # "lexical", "embedding" or "hybrid"
+SCHEMA_INDEX_SAMPLE_VALUES = int(os.environ.get('SCHEMA_INDEX_SAMPLE_VALUES', '0'))  # distinct values per column to index, 0 disables
+
+# Athena polling: jittered exponential backoff between these bounds, until the invocation deadline
+ATHENA_POLL_INITIAL_DELAY_MS = int(os.environ.get('ATHENA_POLL_INITIAL_DELAY_MS', '50'))
+ATHENA_POLL_MAX_DELAY_MS = int(os.environ.get('ATHENA_POLL_MAX_DELAY_MS', '1000'))
+DEADLINE_SAFETY_MARGIN_MS = int(os.environ.get('DEADLINE_SAFETY_MARGIN_MS', '3000'))
+
+# Athena result reading: row/byte budget
+ATHENA_RESULT_MAX_ROWS = int(os.environ.get('ATHENA_RESULT_MAX_ROWS', '10000'))
+ATHENA_RESULT_MAX_BYTES = int(os.environ.get('ATHENA_RESULT_MAX_BYTES', str(5 * 1024 * 1024)))
+
+# Query result reuse: Athena's ResultReuseConfiguration plus a local cache keyed by the canonical SQL
+# fingerprint and Glue table UpdateTimes. 0 disables both.
+ATHENA_RESULT_REUSE_MAX_AGE_MINUTES = int(os.environ.get('ATHENA_RESULT_REUSE_MAX_AGE_MINUTES', '60'))
+ATHENA_RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('ATHENA_RESULT_CACHE_MAX_ENTRIES', '512'))
+
+# Number of result rows shown to the model when summarizing (aggregates cover all rows read)
+SUMMARY_SAMPLE_ROWS = int(os.environ.get('SUMMARY_SAMPLE_ROWS', '50'))
+
+# Results within these limits are rendered locally (markdown table and templated summary) instead of
+# being summarized by Bedrock; larger or truncated results still are. LOCAL_RENDER_MAX_ROWS=0 disables it.
+LOCAL_RENDER_MAX_ROWS = int(os.environ.get('LOCAL_RENDER_MAX_ROWS', '20'))
+LOCAL_RENDER_MAX_COLUMNS = int(os.environ.get('LOCAL_RENDER_MAX_COLUMNS', '6'))
+
+# Query engine for generated SQL: "athena"; "redshift" to run it through the Redshift Data API (the
+# schema is then read from Redshift rather than Glue); or "local" to run it in-process with sqlite
+# against CSV extracts (one folder per table, as in the sample data bucket) instead of Athena and Glue.
+# QUERY_PREFLIGHT dry-runs queries on the local extract first, so ones that cannot work never reach Athena
+# (only with QUERY_ENGINE=athena: the extract holds the Glue tables, not the Redshift ones).
+QUERY_ENGINE = os.environ.get('QUERY_ENGINE', 'athena')
+QUERY_PREFLIGHT = os.environ.get('QUERY_PREFLIGHT', 'false').lower() == 'true'
+LOCAL_ENGINE_DATA = os.environ.get('LOCAL_ENGINE_DATA', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sample_data'))  # directory or s3:// prefix
+LOCAL_ENGINE_TABLE_PREFIX = os.environ.get('LOCAL_ENGINE_TABLE_PREFIX', 'sample_')  # the Glue crawler's table prefix
+LOCAL_ENGINE_SAMPLE_ROWS = int(os.environ.get('LOCAL_ENGINE_SAMPLE_ROWS', '0'))  # rows loaded per table, 0 loads them all
+LOCAL_ENGINE_TIMEOUT_MS = int(os.environ.get('LOCAL_ENGINE_TIMEOUT_MS', '2000'))
+
+# Redshift Data API: a Serverless workgroup or a provisioned cluster, with an optional Secrets Manager
+# secret (otherwise the Lambda's IAM identity). Statements are polled more eagerly than Athena queries.
+REDSHIFT_WORKGROUP = os.environ.get('REDSHIFT_WORKGROUP')
+REDSHIFT_CLUSTER_ID = os.environ.get('REDSHIFT_CLUSTER_ID')
+REDSHIFT_DATABASE = os.environ.get('REDSHIFT_DATABASE', 'dev')
+REDSHIFT_SCHEMA = os.environ.get('REDSHIFT_SCHEMA', 'public')
+REDSHIFT_SECRET_ARN = os.environ.get('REDSHIFT_SECRET_ARN')
+REDSHIFT_POLL_INITIAL_DELAY_MS = int(os.environ.get('REDSHIFT_POLL_INITIAL_DELAY_MS', '20'))
+REDSHIFT_POLL_MAX_DELAY_MS = int(os.environ.get('REDSHIFT_POLL_MAX_DELAY_MS', '500'))
+
+# Bedrock prompt caching for the static system prompt (instructions, schema, examples)
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+
+# SQL generation: number of candidate queries generated and checked concurrently per attempt, and the
+# temperatures they are sampled at (cycled). 1 keeps a single query per attempt. Every candidate that
+# starts is billed for its input tokens and the output it generates before the winner is found, so
+# SQL_CANDIDATES multiplies the generation cost of a question. SQL_CANDIDATE_STAGGER_MS delays each
+# further candidate by that much, so quick questions answered by the first one never start the others.
+SQL_CANDIDATES = int(os.environ.get('SQL_CANDIDATES', '1'))
+SQL_CANDIDATE_TEMPERATURES = [float(t) for t in os.environ.get('SQL_CANDIDATE_TEMPERATURES', '0.1,0.5,0.9').split(',')]
+SQL_CANDIDATE_STAGGER_MS = int(os.environ.get('SQL_CANDIDATE_STAGGER_MS', '0'))
+
+# Run the pipeline with concurrent I/O (Glue and history fetched together, writes after the answer)
+ASYNC_PIPELINE = os.environ.get('ASYNC_PIPELINE', 'false').lower() == 'true'
+
+# Tracing: per-stage CloudWatch EMF metrics for every request, and Server-Timing / X-NLQ-Trace response
+# headers when the request sends TRACE_REQUEST_HEADER: 1 (or always, with TRACE_HEADERS_ENABLED)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'NLQ')
+TRACE_REQUEST_HEADER = os.environ.get('TRACE_REQUEST_HEADER', 'X-NLQ-Debug')
+TRACE_HEADERS_ENABLED = os.environ.get('TRACE_HEADERS_ENABLED', 'false').lower() == 'true'
+TRACE_HEADER_MAX_BYTES = int(os.environ.get('TRACE_HEADER_MAX_BYTES', '4096'))
+
+# Questions matching a known intent run a SQL template instead of a generated query (services/intents.py).
+# Entity names must match a column value with a similarity ratio of at least INTENT_MATCH_THRESHOLD;
+# columns with more than INTENT_VALUES_MAX distinct values are not matched.
+INTENT_ROUTER_ENABLED = os.environ.get('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+INTENT_MATCH_THRESHOLD = float(os.environ.get('INTENT_MATCH_THRESHOLD', '0.85'))
+INTENT_VALUES_MAX = int(os.environ.get('INTENT_VALUES_MAX', '1000'))
+
+# Few-shot examples sent with each question: the EXAMPLES_TOP_K most similar verified question/SQL
+# pairs within EXAMPLES_TOKEN_BUDGET tokens. The store holds up to EXAMPLES_MAX pairs: the curated samples
+# plus answered questions, evicting the least recently verified when full. Those are loaded from the
+# newest items of the history table's verified-examples partition, in the background every
+# EXAMPLES_REFRESH_SECONDS. EXAMPLES_FROM_HISTORY=false keeps it to the curated samples.
+EXAMPLES_TOP_K = int(os.environ.get('EXAMPLES_TOP_K', '3'))
+EXAMPLES_TOKEN_BUDGET = int(os.environ.get('EXAMPLES_TOKEN_BUDGET', '600'))
+EXAMPLES_FROM_HISTORY = os.environ.get('EXAMPLES_FROM_HISTORY', 'true').lower() == 'true'
+EXAMPLES_MAX = int(os.environ.get('EXAMPLES_MAX', '500'))
+EXAMPLES_REFRESH_SECONDS = int(os.environ.get('EXAMPLES_REFRESH_SECONDS', '900'))
+
+# Conversation history: number of recent user/assistant turns read as context
+HISTORY_MAX_TURNS = int(os.environ.get('HISTORY_MAX_TURNS', '10'))
+# How many of those turns each Bedrock call sends: SQL generation needs recent turns to resolve
+# follow-up questions, summarization only needs the current results
+SQL_HISTORY_TURNS = int(os.environ.get('SQL_HISTORY_TURNS', '3'))
+SUMMARY_HISTORY_TURNS = int(os.environ.get('SUMMARY_HISTORY_TURNS', '0'))
+# Token budget for the history sent with each call, including the stored summary of older turns
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '2000'))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.environ.get('HISTORY_SUMMARY_MAX_TOKENS', '300'))
+
 # Logger Configuration
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())  # DEBUG also logs prompts, schemas and model output
 logger.addHandler(logging.StreamHandler())
 
 # AWS Session & Clients
-REGION = boto3.session.Session().region_name
+# Clients are created on first use and cached for the life of the container, so an invocation only
+# pays for the clients it actually needs. They all come from one session, which shares a single
+# botocore loader (and its parsed service models) between them.
 RETRY_CONFIG = Config(retries={'max_attempts': 10})
-session = boto3.Session(region_name=REGION)
 
-bedrock_client = session.client('bedrock-runtime', region_name=REGION, config=RETRY_CONFIG)
-athena_client = session.client('athena', config=RETRY_CONFIG)
-s3_client = session.client('s3', config=RETRY_CONFIG)
-glue_client = session.client('glue', config=RETRY_CONFIG)
+_CLIENT_SERVICES = {
+    "bedrock_client": "bedrock-runtime",
+    "athena_client": "athena",
+    "s3_client": "s3",
+    "glue_client": "glue",
+    "dynamodb_client": "dynamodb",
+    "redshift_data_client": "redshift-data",
+}
+
+_session = None
+_client_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
 
 
-# DynamoDB Resource
-dynamodb = boto3.resource('dynamodb')
-dynamodb_table = dynamodb.Table(TABLE_NAME)
+def __getattr__(name):
+    # Resolves config.<service>_client on first access (PEP 562); the client is then stored as a
+    # module attribute, so later lookups never come back here
+    if name not in _CLIENT_SERVICES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Client creation is not thread-safe, and SQL candidates may ask for a client concurrently
+    with _client_lock:
+        if name not in globals():
+            globals()[name] = get_session().client(_CLIENT_SERVICES[name], config=RETRY_CONFIG)
+    return globals()[name]
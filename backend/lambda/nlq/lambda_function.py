@@ -1,161 +1,455 @@
 import config
+import asyncio
 import json
 import boto3
 import logging
+import queue
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sample_queries as Samples
 
 # Add services directory to our path so we can import our service scripts
+# Services are imported by bare name, the same way they import each other, so module-level
+# state (schema catalog, caches) is shared rather than loaded twice as services.<name>
 sys.path.append(os.path.join(os.path.dirname(__file__), "services"))
-from services import dynamodb, bedrock, athena, metadata
+# history.py is shared with the other Lambdas through a layer, which the runtime puts on the path;
+# outside Lambda it is read from its source directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+import bedrock, athena, metadata, cache, examples, intents, sql_validator, poller, renderer, results, tracing
+from conversation import ConversationContext
 
-def generate_sql(user_query, id):
+# SQL dialect and curated examples for the configured query engine (the local engine runs Athena's SQL)
+if config.QUERY_ENGINE == "redshift":
+    SQL_DIALECT, SAMPLE_QUERIES = "Amazon Redshift", Samples.redshift_sample_queries
+else:
+    SQL_DIALECT, SAMPLE_QUERIES = "awsathena", Samples.sample_queries
+
+# Static prompt parts: sent as system prompt blocks so Bedrock can cache them across calls. The
+# examples are picked per question (services/examples.py), so they are sent with the question instead.
+SQL_INSTRUCTIONS = f"""
+Read database metadata inside the <database_metadata></database_metadata> tags to do the following:
+1. Create a syntactically correct {SQL_DIALECT} query to answer the question.
+2. Never query for all the columns from a specific table, only ask for a few relevant columns given the question.
+3. Pay attention to use only the column names that you can see in the schema description. 
+4. Be careful to not query for columns that do not exist.
+5. When using WHERE clauses, be careful not to search for values that do not exist in the column. 
+6. When using WHERE clauses, add the LOWER() function and search for all terms in lowercase. 
+7. If you are writing CTEs then include all the required columns. 
+8. While concatenating a non string column, make sure cast the column to string.
+9. For date columns comparing to string , please cast the string input.
+10. Return the sql query inside the <SQL></SQL> tab.
+
+Refer to the example queries in the <sample_queries></sample_queries> tags after the question for example output.
+"""
+
+SUMMARY_INSTRUCTIONS = """
+You are a helpful assistant providing users with information based on database 
+results. Your goal is to answer questions conversationally, summarizing the data
+clearly and concisely. When possible, display the results in a table using
+markdown syntax, and provide a short summary first. Avoid mentioning that the 
+data comes from a SQL query, and focus on giving direct, natural responses 
+to the user's question. 
+
+Markdown Table Format:
+- Use "|" to separate columns.
+- The first row should contain column headers, followed by a separator line with dashes ("---").
+- Each subsequent row should contain the data, also separated by "|".
+
+For example:
+
+| Column 1 | Column 2 |
+| --- | --- |
+| Data 1 | Data 2 |
+
+If a table format is not possible, return the results as a bulleted list or structured text.
+"""
+
+
+def _no_events(event, data):
+    pass
+
+
+@tracing.traced("sql_generation")
+def generate_sql(user_query, conversation, schema_details=None, emit=_no_events):
     ####################################################
     #### USE RETREIVED METADATA TO GENERATE SQL ####
     ####################################################
     
-    schema_details = metadata.get_relevant_metadata(user_query)
-    
-    details = f"""
-    Read database metadata inside the <database_metadata></database_metadata> tags to do the following:
-    1. Create a syntactically correct awsathena query to answer the question.
-    2. Never query for all the columns from a specific table, only ask for a few relevant columns given the question.
-    3. Pay attention to use only the column names that you can see in the schema description. 
-    4. Be careful to not query for columns that do not exist.
-    5. When using WHERE clauses, be careful not to search for values that do not exist in the column. 
-    6. When using WHERE clauses, add the LOWER() function and search for all terms in lowercase. 
-    7. If you are writing CTEs then include all the required columns. 
-    8. While concatenating a non string column, make sure cast the column to string.
-    9. For date columns comparing to string , please cast the string input.
-    10. Return the sql query inside the <SQL></SQL> tab.
-    
-    Refer to the example queries in the <sample_queries></sample_queries> tags for example output.
+    if schema_details is None:
+        schema_details = metadata.get_relevant_metadata(user_query)
 
-    """
-    
-    prompt = f"""\n\n{details}. <database_metadata> {schema_details} </database_metadata> <sample_queries> {Samples.sample_queries} </sample_queries> <question> {user_query} </question>"""
+    # Known intents run a SQL template directly, without a model call
+    routed = route_intent(user_query, emit)
+    if routed is not None:
+        return routed
+
+    # The instructions, examples and schema are the same for every question over this schema, so they
+    # form the (cached) system prompt; only the question and any retry feedback vary per call
+    system = [SQL_INSTRUCTIONS, f"<database_metadata> {metadata.render_schema(schema_details)} </database_metadata>"]
+
+    # Verified examples similar to this question go with the question, after the cached system prompt
+    with tracing.span("examples"):
+        sample_queries = examples.examples_for(user_query, SAMPLE_QUERIES)
+    prompt = f"""<question> {user_query} </question>
+<sample_queries> {sample_queries} </sample_queries>"""
 
     attempt = 0
     max_attempts = 3
-    query = ''
+
+    # Recent turns let the model resolve follow-up questions; the same window is reused on every retry
+    history = conversation.messages(config.SQL_HISTORY_TURNS)
 
     while attempt < max_attempts:
-        # Generate a SQL query and test the quality against athena
-        try: 
-            config.logger.info(f'Attempt {attempt+1}: Generating SQL')
-                        
-            # Pass user input to bedrock which generates sql 
-            output_message, response = bedrock.call_bedrock(prompt, id)
-                        
-            # Extract the query out of the model response
-            query = response.split('<SQL>')[1].split('</SQL>')[0]
-            query = ' '.join(query.split())
-            
-            config.logger.info(f"Generated Query #{attempt +1}: {query}")
-            
-            # check the quality of the SQL query
-            syntaxcheckmsg=athena.syntax_checker(query)
-            
-            state = syntaxcheckmsg.get('state')
-            output = syntaxcheckmsg.get('output')
-            
-            config.logger.info(f"Syntax Checker: {syntaxcheckmsg}")
-            
-            if state =='PASSED':
-                config.logger.info(f'Syntax check passed on attempt {attempt+1}')
-                return query, output
-            else: 
-                
-                # If the original query failed, augment the prompt to generate new SQL building off the failure reasons of the previous query
-                
-                prompt += f"""
-                This a syntax error from the originally generated SQL: {output}. 
-                To correct this, please generate an alternative SQL query which will correct the syntax error.
-                The updated query should take care of all the syntax issues encountered.
-                Follow the instructions mentioned above to remediate the error. 
-                Update the below SQL query to resolve the issue:
-                {query}
-                Make sure the updated SQL query aligns with the requirements provided in the user's question"""
-                
-                attempt +=1 
-                
-        except Exception as e:
-            config.logger.error(f"SQL Generation Failed: {str(e)}")
-            attempt +=1 
+        # Generate SQL query candidates and test their quality against athena
+        config.logger.info(f'Attempt {attempt+1}: Generating SQL')
+        emit("status", {"stage": "generating_sql", "attempt": attempt + 1})
+
+        query, output, failures = generate_candidates(prompt, history, system, attempt + 1, emit)
+
+        if query is not None:
+            config.logger.info(f'Syntax check passed on attempt {attempt+1}')
+            emit("rows", {"row_count": output["row_count"], "truncated": output["truncated"]})
+            # A new verified example is written with this turn's history, in the same batch
+            conversation.add_item(examples.add_verified(user_query, query))
+            return query, output
+
+        # If the generated queries failed, augment the prompt to generate new SQL building off the failure reasons of the previous queries
+        for failed_query, reason in failures:
+            prompt += f"""
+            This a syntax error from the originally generated SQL: {reason}. 
+            To correct this, please generate an alternative SQL query which will correct the syntax error.
+            The updated query should take care of all the syntax issues encountered.
+            Follow the instructions mentioned above to remediate the error. 
+            Update the below SQL query to resolve the issue:
+            {failed_query}
+            Make sure the updated SQL query aligns with the requirements provided in the user's question"""
+
+        attempt +=1 
     
     raise Exception("SQL query generation failed after maximum retries. Please try a different question.")
 
 
-def final_output(user_query, id):
+def route_intent(user_query, emit=_no_events):
+    # (query, result_set) when the question matches a known intent and its template query succeeds;
+    # None leaves the question to the model, including when routing itself fails
+    try:
+        with tracing.span("intent_router") as attributes:
+            routed = intents.route(user_query)
+            attributes["intent"] = routed and routed["intent"]
+        if routed is None:
+            return None
+
+        query = routed["sql"]
+        config.logger.info(f"Intent {routed['intent']} matched with {routed['slots']}: {query}")
+        emit("sql", {"sql_query": query, "intent": routed["intent"]})
+        emit("status", {"stage": "query_running", "intent": routed["intent"]})
+
+        check = athena.syntax_checker(query)
+    except Exception as e:
+        config.logger.error(f"Intent routing failed, generating SQL instead: {str(e)}")
+        return None
+
+    if check.get("state") != "PASSED":
+        config.logger.info(f"Intent query did not pass ({check.get('output')}), generating SQL instead")
+        return None
+
+    output = check["output"]
+    emit("rows", {"row_count": output["row_count"], "truncated": output["truncated"]})
+    return query, output
+
+
+def generate_candidates(prompt, history, system, attempt, emit=_no_events):
+    # Asks for config.SQL_CANDIDATES queries concurrently, at varied temperatures, and checks each one
+    # as soon as it is generated. The first query that passes wins and the others are cancelled
+    # (running Athena executions are stopped). Returns (query, result_set, failures) where failures
+    # lists (query, reason) for every candidate that was checked and failed; query is None if none passed.
+    count = max(config.SQL_CANDIDATES, 1)
+    cancel_event = threading.Event()
+    lock = threading.Lock()
+    claimed = set()
+    # Candidates that finished without passing; the first one releases any staggered candidates
+    progress = threading.Condition()
+    settled = [0]
+
+    def settle():
+        with progress:
+            settled[0] += 1
+            progress.notify_all()
+
+    def candidate(index):
+        temperature = config.SQL_CANDIDATE_TEMPERATURES[index % len(config.SQL_CANDIDATE_TEMPERATURES)] if count > 1 else None
+
+        # Later candidates start SQL_CANDIDATE_STAGGER_MS apart (or as soon as one fails), and never
+        # start once a winner is found
+        with progress:
+            progress.wait_for(lambda: cancel_event.is_set() or index == 0 or settled[0] > 0, index * config.SQL_CANDIDATE_STAGGER_MS / 1000)
+        if cancel_event.is_set():
+            return None, {"state": "CANCELLED", "output": "Another candidate passed"}
+
+        # Pass user input to bedrock which generates sql. With several candidates the call is
+        # cancellable, so losing candidates stop generating as soon as a winner is found.
+        try:
+            output_message, response = bedrock.call_bedrock(prompt, history, system, temperature, cancel_event if count > 1 else None)
+        except bedrock.GenerationCancelled:
+            return None, {"state": "CANCELLED", "output": "Another candidate passed"}
+                    
+        # Extract the query out of the model response
+        query = response.split('<SQL>')[1].split('</SQL>')[0]
+        query = ' '.join(query.split())
+        
+        config.logger.info(f"Generated Query #{attempt}.{index + 1}: {query}")
+        emit("sql", {"sql_query": query, "attempt": attempt, "candidate": index + 1})
+        
+        # Validate the query locally against the cached schema first, so queries that cannot
+        # parse or reference unknown tables/columns never cost an Athena execution
+        validation = sql_validator.validate_sql(query, metadata.get_full_metadata())
+        if not validation['valid']:
+            return query, {"state": "FAILED", "output": sql_validator.format_errors(validation['errors'])}
+
+        # Equivalent candidates are only executed once, and nothing starts after a winner is found
+        with lock:
+            if cancel_event.is_set():
+                return query, {"state": "CANCELLED", "output": "Another candidate passed"}
+            fingerprint = athena.fingerprint_sql(query)
+            if fingerprint in claimed:
+                return query, {"state": "DUPLICATE", "output": "Equivalent to another candidate"}
+            claimed.add(fingerprint)
+
+        # check the quality of the SQL query
+        emit("status", {"stage": "query_running", "attempt": attempt, "candidate": index + 1})
+        return query, athena.syntax_checker(query, cancel_event=cancel_event)
+
+    failures = []
+    executor = ThreadPoolExecutor(max_workers=count)
+    futures = [executor.submit(candidate, index) for index in range(count)]
+    try:
+        for future in as_completed(futures):
+            try:
+                query, syntaxcheckmsg = future.result()
+            except Exception as e:
+                config.logger.error(f"SQL Generation Failed: {str(e)}")
+                settle()
+                continue
+
+            config.logger.info(f"Syntax Checker: {syntaxcheckmsg.get('state')}, statistics: {syntaxcheckmsg.get('statistics')}")
+
+            if syntaxcheckmsg.get('state') == 'PASSED':
+                return query, syntaxcheckmsg.get('output'), failures
+            if syntaxcheckmsg.get('state') == 'FAILED':
+                failures.append((query, syntaxcheckmsg.get('output')))
+            settle()
+
+        return None, None, failures
+    finally:
+        # Losing candidates close their Bedrock stream at its next event (or stop before starting)
+        # and stop any Athena execution they started, in the background
+        cancel_event.set()
+        with progress:
+            progress.notify_all()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def final_output(user_query, id, emit=_no_events):
     ######################################################
     #### SHOWCASE THE SQL RESULTS IN NATURAL LANGUAGE ####
     ######################################################
+    # emit(event, data) receives progress events; when streaming, the answer is also
+    # emitted token by token as Bedrock generates it
+
+    # Session history is read at most once for the whole request
+    conversation = ConversationContext(id)
      
+    schema_details = metadata.get_relevant_metadata(user_query)
+    schema_version = metadata.get_schema_version()
+
+    # Serve repeated questions from the answer cache, skipping SQL generation and summarization.
+    # Only questions asked without earlier turns are cached: a follow-up ("what about 2024?") is
+    # resolved against its own session's history.
+    standalone = not conversation.has_history()
+    cached = cache.lookup_answer(user_query, schema_version) if standalone else None
+    if cached is not None:
+        config.logger.info("Answer cache hit")
+        conversation.add_turn(user_query, cached["sql_query"], cached["answer"])
+        return dict(cached)
+
     # Generate SQL from the user's question
-    final_query, results = generate_sql(user_query, id)
+    final_query, result_set = generate_sql(user_query, conversation, schema_details, emit)
 
     config.logger.info(f"FINAL GENERATED QUERY: {final_query}")
 
-    prompt = f"""
-    You are a helpful assistant providing users with information based on database 
-    results. Your goal is to answer questions conversationally, summarizing the data
-    clearly and concisely. When possible, display the results in a table using
-    markdown syntax, and provide a short summary first. Avoid mentioning that the 
-    data comes from a SQL query, and focus on giving direct, natural responses 
-    to the user's question. 
-    
-    Markdown Table Format:
-    - Use "|" to separate columns.
-    - The first row should contain column headers, followed by a separator line with dashes ("---").
-    - Each subsequent row should contain the data, also separated by "|".
-    
-    For example:
-    
-    | Column 1 | Column 2 |
-    | --- | --- |
-    | Data 1 | Data 2 |
+    output = summarize_results(user_query, result_set, conversation, emit)
     
-    If a table format is not possible, return the results as a bulleted list or structured text.
+    conversation.add_turn(user_query, final_query, output)
+
+    resp_json = {"answer": output, "sql_query": final_query}
+
+    if standalone:
+        cache.store_answer(user_query, schema_version, resp_json)
     
+    return resp_json
+
+
+def summarize_results(user_query, result_set, conversation, emit=_no_events):
+    # Small results are rendered locally; the rest are summarized by Bedrock
+    reason = renderer.exceeds_threshold(result_set)
+    if reason is None:
+        with tracing.span("render", rows=result_set["row_count"]):
+            output = renderer.render(result_set)
+        emit("token", {"text": output})
+        return output
+
+    config.logger.info(f"Summarizing with Bedrock: {reason}")
+    return summarize_with_bedrock(user_query, result_set, conversation, emit)
+
+
+@tracing.traced("summarization")
+def summarize_with_bedrock(user_query, result_set, conversation, emit=_no_events):
+    # Synthesize the SQL results in a natural language response
+
+    prompt = f"""
     Question: {user_query}
     
-    Results: {results}
+    Results: {results.summarize_for_prompt(result_set)}
     """
     
-    # Synthesize the SQL results in a natural language response
-    output_message, output = bedrock.call_bedrock(prompt, id)
-    
-    config.logger.info(f"OUTPUT FROM BEDROCK: {output}")
+    history = conversation.messages(config.SUMMARY_HISTORY_TURNS)
+    if emit is _no_events:
+        output_message, output = bedrock.call_bedrock(prompt, history, [SUMMARY_INSTRUCTIONS])
+    else:
+        emit("status", {"stage": "summarizing"})
+        chunks = []
+        for text in bedrock.call_bedrock_stream(prompt, history, [SUMMARY_INSTRUCTIONS]):
+            chunks.append(text)
+            emit("token", {"text": text})
+        output = ''.join(chunks)
     
-    # Write our key conversation history to DynamoDB for future chats to read as context 
-    
-    messages = [
-    {
-        "role": "user",
-        "content": [
-            {"text": user_query}
-        ]
-    },
-    {
-        "role": "assistant",
-        "content": [
-            {"text": json.dumps({
-                "sql_query": final_query, 
-                "results": output
-            })}
-        ]
-    }
-]
-    
-    dynamodb.write_history_to_dynamodb(messages, id)
+    config.logger.debug(f"OUTPUT FROM BEDROCK: {output}")
+
+    return output
+
+
+#### ASYNC PIPELINE ####
+
+# The same steps as final_output with the independent I/O overlapped: the Glue catalog and the
+# session history are fetched concurrently, and so are the history write and the answer cache store.
+# Both writes finish before the answer is returned, since a Lambda invocation must not return with
+# work still running. boto3 is synchronous, so blocking calls are bridged onto worker threads with
+# asyncio.to_thread.
+
+async def _persist(*writes):
+    # Runs (function, *args) writes concurrently; a failed write is logged, not raised
+    results = await asyncio.gather(*(asyncio.to_thread(*write) for write in writes), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            config.logger.error(f"Persisting the turn failed: {str(result)}")
+
+
+async def final_output_async(user_query, id, emit=_no_events):
+    conversation = ConversationContext(id)
+
+    schema_details, _ = await asyncio.gather(
+        asyncio.to_thread(metadata.get_relevant_metadata, user_query),
+        asyncio.to_thread(conversation.load),
+    )
+    schema_version = metadata.get_schema_version()
+
+    # Serve repeated questions from the answer cache, skipping SQL generation and summarization.
+    # As in final_output, only for questions without earlier turns.
+    standalone = not conversation.has_history()
+    cached = cache.lookup_answer(user_query, schema_version) if standalone else None
+    if cached is not None:
+        config.logger.info("Answer cache hit")
+        await _persist((conversation.add_turn, user_query, cached["sql_query"], cached["answer"]))
+        return dict(cached)
+
+    final_query, result_set = await asyncio.to_thread(generate_sql, user_query, conversation, schema_details, emit)
+
+    config.logger.info(f"FINAL GENERATED QUERY: {final_query}")
+
+    output = await asyncio.to_thread(summarize_results, user_query, result_set, conversation, emit)
 
     resp_json = {"answer": output, "sql_query": final_query}
-    
+
+    writes = [(conversation.add_turn, user_query, final_query, output)]
+    if standalone:
+        writes.append((cache.store_answer, user_query, schema_version, resp_json))
+    await _persist(*writes)
+
     return resp_json
 
+
+def run_pipeline(user_query, id, emit=_no_events):
+    # Runs the configured pipeline
+    if config.ASYNC_PIPELINE:
+        return asyncio.run(final_output_async(user_query, id, emit))
+    return final_output(user_query, id, emit)
+
+
+#### STREAMING MODE ####
+
+# Used by the local SSE server (backend/lambda/local). The managed Python runtime cannot stream an
+# HTTP response, so the Lambda itself always answers with JSON.
+
+def stream_final_output(user_query, id):
+    # Runs the pipeline on a worker thread and yields (event, data) tuples as they happen,
+    # ending with a "done" event carrying the full response (or an "error" event)
+    events = queue.Queue()
+
+    def run():
+        try:
+            output = run_pipeline(user_query, id, emit=lambda event, data: events.put((event, data)))
+            events.put(("done", output))
+        except Exception as e:
+            config.logger.error(f"Error: {str(e)}")
+            events.put(("error", {"answer": str(e), "sql_query": ""}))
+        events.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        yield item
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _request_header(event, name):
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    return headers.get(name.lower()) or ''
+
+
+def wants_trace(event):
+    # Per-request span summary, on request (debug header) or for every response (TRACE_HEADERS_ENABLED)
+    return config.TRACE_HEADERS_ENABLED or _request_header(event, config.TRACE_REQUEST_HEADER).lower() in ('1', 'true')
+
+
 def lambda_handler(event, context):
     
+    # Bound every wait in this invocation by the time Lambda has left
+    poller.set_request_deadline(context, config.DEADLINE_SAFETY_MARGIN_MS)
+    trace = tracing.start_request(getattr(context, 'aws_request_id', None))
+
+    response = handle_request(event)
+
+    tracing.emit_metrics(trace)
+    if wants_trace(event):
+        response['headers'].update({
+            'Server-Timing': tracing.server_timing(trace),
+            'X-NLQ-Trace': tracing.debug_summary(trace),
+            'Access-Control-Expose-Headers': 'Server-Timing,X-NLQ-Trace',
+        })
+
+    return response
+
+
+def handle_request(event):
+
     body = event.get('body', {})
     
     # If body is a string (e.g., from API Gateway), parse it
@@ -167,7 +461,7 @@ def lambda_handler(event, context):
     generated_uuid = body.get('id')
     
     try:
-        output = final_output(prompt, generated_uuid)
+        output = run_pipeline(prompt, generated_uuid)
 
         # Return the response expected by API Gateway
         return {
@@ -1,15 +1,72 @@
-sample_queries = """
-Example SQL Queries:
-1. Query: What was the total donation amount for the March Miracle Makers campaign??
-
-    SELECT SUM(d.donationamount) AS total_donation_amount 
-    FROM sample_donations d 
-    JOIN sample_campaigns c ON d.campaignkey = c.campaignkey 
+# Curated question/SQL pairs that seed the few-shot example store (services/examples.py). The
+# examples sent with each question are picked from these and the questions answered before.
+sample_queries = [
+    {
+        "question": "What was the total donation amount for the March Miracle Makers campaign??",
+        "sql": """
+    SELECT SUM(d.donationamount) AS total_donation_amount
+    FROM sample_donations d
+    JOIN sample_campaigns c ON d.campaignkey = c.campaignkey
     WHERE LOWER(c.campaignname) LIKE '%march miracle makers%'
-     
-   Expected Result:
-   | total_donation_amount |
-   |-----------------------|
-   | 9855                  | 
+""",
+    },
+    {
+        "question": "How much was donated with each payment method?",
+        "sql": """
+    SELECT p.paymentmethodname, SUM(d.donationamount) AS total_donation_amount
+    FROM sample_donations d
+    JOIN sample_payment p ON d.paymentmethodkey = p.paymentmethodkey
+    GROUP BY p.paymentmethodname
+    ORDER BY total_donation_amount DESC
+""",
+    },
+    {
+        "question": "Who were the top 5 donors in 2024?",
+        "sql": """
+    SELECT dn.firstname, dn.lastname, SUM(d.donationamount) AS total_donation_amount
+    FROM sample_donations d
+    JOIN sample_donors dn ON d.donorkey = dn.donorkey
+    JOIN sample_date dt ON d.datekey = dt.datekey
+    WHERE dt.year = 2024
+    GROUP BY dn.firstname, dn.lastname
+    ORDER BY total_donation_amount DESC
+    LIMIT 5
+""",
+    },
+]
 
-"""
+# The same examples against the tables redshiftLoader creates, used when QUERY_ENGINE is redshift
+redshift_sample_queries = [
+    {
+        "question": "What was the total donation amount for the March Miracle Makers campaign??",
+        "sql": """
+    SELECT SUM(d.donationamount) AS total_donation_amount
+    FROM donationfact d
+    JOIN campaigndim c ON d.campaignkey = c.campaignkey
+    WHERE LOWER(c.campaignname) LIKE '%march miracle makers%'
+""",
+    },
+    {
+        "question": "How much was donated with each payment method?",
+        "sql": """
+    SELECT p.paymentmethodname, SUM(d.donationamount) AS total_donation_amount
+    FROM donationfact d
+    JOIN paymentmethoddim p ON d.paymentmethodkey = p.paymentmethodkey
+    GROUP BY p.paymentmethodname
+    ORDER BY total_donation_amount DESC
+""",
+    },
+    {
+        "question": "Who were the top 5 donors in 2024?",
+        "sql": """
+    SELECT dn.firstname, dn.lastname, SUM(d.donationamount) AS total_donation_amount
+    FROM donationfact d
+    JOIN donordim dn ON d.donorkey = dn.donorkey
+    JOIN datedim dt ON d.datekey = dt.datekey
+    WHERE dt.year = 2024
+    GROUP BY dn.firstname, dn.lastname
+    ORDER BY total_donation_amount DESC
+    LIMIT 5
+""",
+    },
+]
@@ -1,63 +1,231 @@
 import config
-import time
+import hashlib
+import cache
+import local_engine
+import metadata
+import poller
+import redshift
+import results
+import sql_validator
+import tracing
 
-#### HELPER FUNCTION TO CHECK THE SYNTAX OF THE GENERATED SQL  ####        
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+#### SQL FINGERPRINTS ####
+
+def canonicalize_sql(query):
+    # Normalizes whitespace, keyword/identifier casing and table alias names so queries that differ
+    # only cosmetically share a fingerprint. String literals are kept byte for byte: a different
+    # literal can select different rows.
+    tokens = sql_validator.tokenize(query)
+    while tokens and tokens[-1].text == ';':
+        tokens.pop()
+
+    # Aliases are renamed where they are defined and where they qualify a column, never elsewhere: a
+    # column that happens to share an alias's name is left alone
+    aliases, definitions = {}, set()
+    for table_name, alias, position, is_base, alias_position in sql_validator.table_references(tokens):
+        if alias:
+            aliases.setdefault(alias, f"t{len(aliases) + 1}")
+            definitions.add(alias_position)
+
+    canonical = []
+    for i, token in enumerate(tokens):
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        previous = tokens[i - 1] if i > 0 else None
+
+        if token.kind == 'ident':
+            if token.is_keyword:
+                # "FROM t AS d" and "FROM t d" are the same query
+                if token.value == 'as' and following is not None and following.position in definitions:
+                    continue
+                canonical.append(token.value.upper())
+            elif token.value in aliases and (token.position in definitions or (following is not None and following.text == '.' and (previous is None or previous.text != '.'))):
+                canonical.append(aliases[token.value])
+            else:
+                canonical.append(token.value)
+        else:
+            canonical.append(token.text)
+
+    return ' '.join(canonical)
+
+
+def fingerprint_sql(query):
+    try:
+        canonical = canonicalize_sql(query)
+    except sql_validator.SqlValidationError:
+        canonical = ' '.join(query.split())
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+#### RESULT CACHE ####
+
+# Fingerprint + data freshness -> QueryExecutionId of a previous successful run. Hits re-read
+# that execution's stored results instead of scanning the data again.
+_result_cache = None
 
-def syntax_checker(query):
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = cache.MemoryBackend(config.ATHENA_RESULT_CACHE_MAX_ENTRIES, config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES * 60)
+    return _result_cache
+
+
+def _result_cache_key(query):
+    return f"{metadata.get_data_version()}|{fingerprint_sql(query)}"
+
+#### QUERY RUNNER ####
+
+def get_statistics(query_execution):
+    # Timing and cost figures Athena reports for a finished execution
+    statistics = query_execution.get('Statistics', {})
+    return {
+        "engine_ms": statistics.get('EngineExecutionTimeInMillis'),
+        "queue_ms": statistics.get('QueryQueueTimeInMillis'),
+        "planning_ms": statistics.get('QueryPlanningTimeInMillis'),
+        "total_ms": statistics.get('TotalExecutionTimeInMillis'),
+        "bytes_scanned": statistics.get('DataScannedInBytes'),
+        "reused": statistics.get('ResultReuseInformation', {}).get('ReusedPreviousResult', False),
+    }
+
+
+def run_query(query, deadline=None, cancel_event=None):
+    # Start a query and wait for it with adaptive polling. The wait is bounded by the
+    # invocation deadline; a query that would outlive it is stopped rather than left running.
     
     query_config = {"OutputLocation": config.ATHENA_RESULTS_S3 }
     query_execution_context = {
         "Catalog": config.GLUE_CATALOG,
         "Database": config.GLUE_DB_NAME
     }
-    
+
+    if deadline is None:
+        deadline = poller.get_request_deadline()
+
+    request = {
+        "QueryString": query,
+        "ResultConfiguration": query_config,
+        "QueryExecutionContext": query_execution_context,
+        "WorkGroup": config.ATHENA_WORKGROUP
+    }
+
+    # Let Athena serve identical queries from a recent previous execution's results
+    if config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES:
+        request["ResultReuseConfiguration"] = {
+            "ResultReuseByAgeConfiguration": {
+                "Enabled": True,
+                "MaxAgeInMinutes": config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES
+            }
+        }
+
+    response = config.athena_client.start_query_execution(**request)
+
+    execution_id = response["QueryExecutionId"]
+
+    config.logger.info(f"Query execution ID: {execution_id}")
+
     try:
-        response = config.athena_client.start_query_execution(
-            QueryString=query,
-            ResultConfiguration=query_config,
-            QueryExecutionContext=query_execution_context,
-            WorkGroup=config.ATHENA_WORKGROUP
+        response_wait, polls = poller.poll(
+            lambda: config.athena_client.get_query_execution(QueryExecutionId=execution_id),
+            lambda r: r['QueryExecution']['Status']['State'] in TERMINAL_STATES,
+            deadline=deadline,
+            cancel_event=cancel_event,
+            initial_delay=config.ATHENA_POLL_INITIAL_DELAY_MS / 1000,
+            max_delay=config.ATHENA_POLL_MAX_DELAY_MS / 1000,
         )
+    except (poller.PollTimeout, poller.PollCancelled) as e:
+        config.logger.error(f"Stopping query {execution_id}: {str(e)}")
+        config.athena_client.stop_query_execution(QueryExecutionId=execution_id)
+        raise
+
+    query_execution = response_wait['QueryExecution']
+    statistics = get_statistics(query_execution)
+
+    config.logger.info(f"Query finished with state: {query_execution['Status']['State']} after {polls} polls, statistics: {statistics}")
+
+    return query_execution, statistics
+
+
+#### HELPER FUNCTION TO CHECK THE SYNTAX OF THE GENERATED SQL  ####        
+
+def syntax_checker(query, cancel_event=None):
+    # Runs (or reuses) the query and reads its results, recording queue/engine time,
+    # bytes scanned and rows read on the request trace
+    with tracing.span("athena_query", engine=config.QUERY_ENGINE) as attributes:
+        check = _preflight(query, cancel_event) or ENGINES[config.QUERY_ENGINE](query, cancel_event)
+        attributes["preflight"] = check.get("preflight")
+        attributes["state"] = check["state"]
+        attributes["reused"] = check["statistics"].get("reused")
+        if not attributes["reused"]:
+            # A reused execution costs no new queue/engine time or scanning
+            attributes.update({key: check["statistics"].get(key) for key in ("queue_ms", "engine_ms", "bytes_scanned")})
+        if check["state"] == "PASSED":
+            attributes["rows"] = check["output"]["row_count"]
+            attributes["source"] = check["output"]["source"]
+    return check
+
+
+def _preflight(query, cancel_event=None):
+    # With QUERY_PREFLIGHT, a query sent to Athena is first dry-run on the local extract. Only a
+    # definite failure there is returned (as the check result); otherwise Athena runs the query.
+    if not config.QUERY_PREFLIGHT or config.QUERY_ENGINE != "athena":
+        return None
+    with tracing.span("preflight") as attributes:
+        error = local_engine.dry_run(query, cancel_event)
+        attributes["state"] = "FAILED" if error else "PASSED"
+    if error is None:
+        return None
+    config.logger.info(f"Query failed the pre-flight dry run: {error}")
+    return {"state": "FAILED", "output": error, "statistics": {"reused": False}, "preflight": True}
+
+
+def _check_query(query, cancel_event=None):
     
-        execution_id = response["QueryExecutionId"]
+    try:
+        cache_key = _result_cache_key(query) if config.ATHENA_RESULT_REUSE_MAX_AGE_MINUTES else None
+        cached_execution_id = get_result_cache().get(cache_key) if cache_key else None
 
-        config.logger.info(f"Query execution ID: {execution_id}")
+        query_execution = None
+
+        if cached_execution_id:
+            # Reuse a previous execution of an equivalent query against unchanged data
+            try:
+                query_execution = config.athena_client.get_query_execution(QueryExecutionId=cached_execution_id)['QueryExecution']
+                statistics = dict(get_statistics(query_execution), reused=True)
+                config.logger.info(f"Result cache hit, reusing execution {cached_execution_id}")
+            except Exception as e:
+                config.logger.error(f"Cached execution {cached_execution_id} unavailable, running the query: {str(e)}")
+                query_execution = None
+
+        if query_execution is None:
+            query_execution, statistics = run_query(query, cancel_event=cancel_event)
         
-        # Wait for the query to complete
-        while True:
-            response_wait = config.athena_client.get_query_execution(QueryExecutionId=execution_id)
-            state = response_wait['QueryExecution']['Status']['State']
-            
-            if state in ['QUEUED', 'RUNNING']:
-                config.logger.info("Query is still running...")
-                time.sleep(1)  # Add small delay
-                continue
-            break
-            
-        config.logger.info(f"Query finished with state: {state}")
+        state = query_execution['Status']['State']
     
         # Check if the query completed successfully
         if state == 'SUCCEEDED':
-            # Fetch query results
-            results_response = config.athena_client.get_query_results(QueryExecutionId=execution_id)
-            
-            # Extract results
-            result_data = []
-            rows = results_response.get("ResultSet", {}).get("Rows", [])
-            for row in rows:
-                result_data.append([col.get("VarCharValue", "") for col in row.get("Data", [])])
+            # Fetch query results as typed rows, bounded by the configured row/byte budget
+            result_data = results.read_results(query_execution)
+
+            config.logger.info(f"Read {result_data['row_count']} rows from {result_data['source']} (truncated: {result_data['truncated']})")
+
+            if cache_key:
+                get_result_cache().put(cache_key, query_execution['QueryExecutionId'])
             
             return {
                "state": "PASSED",
-               "output": result_data 
+               "output": result_data,
+               "statistics": statistics
             }
         else:
             config.logger.error(f"Query failed syntax check")
-            message = response_wait['QueryExecution']['Status']['StateChangeReason']
+            message = query_execution['Status'].get('StateChangeReason', state)
 
             return {
                 "state": "FAILED",
-                "output": message
+                "output": message,
+                "statistics": statistics
             }
             
     except Exception as e:
@@ -65,6 +233,13 @@ def syntax_checker(query):
         config.logger.error(errorMessage)
         raise Exception(errorMessage)
 
-    return message
-    
 
+#### QUERY ENGINES ####
+
+# Engines generated SQL can run on, selected by QUERY_ENGINE. Each takes (query, cancel_event) and
+# returns {"state": "PASSED"|"FAILED", "output": result set or error message, "statistics"}.
+ENGINES = {
+    "athena": _check_query,
+    "local": local_engine.check_query,
+    "redshift": redshift.check_query,
+}
@@ -1,47 +1,158 @@
 import config
-import dynamodb
+import tracing
 
-#### HELPER FUNCTION TO CALL BEDROCK
-def call_bedrock(prompt, id):
-    
-    # Get the latest conversation history from DynamoDB
-    conversation_history = dynamodb.read_history_from_dynamodb(id)
+# Set the temperature for the model inference, controlling the randomness of the responses.
+TEMPERATURE = 0.1
+
+# Set the top_k parameter for the model inference, determining how many of the top predictions to consider.
+TOP_K = 200
+
+# Base system prompt, sent ahead of any request-specific static instructions
+SYSTEM_PROMPT = "You are a helpful assistant. Keep your answers short and succinct."
+
+# Bedrock prompt caching: static system blocks are each followed by a cachePoint so the prefix is
+# processed once and reused by later calls. Models without prompt caching reject cachePoint; the
+# first rejection turns caching off for the rest of this container's life.
+_prompt_cache_supported = config.PROMPT_CACHE_ENABLED
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def build_request(prompt, history=None, system=None, cache=False, temperature=None):
+    # history is the list of prior messages to send as context (see conversation.ConversationContext)
+    # system is a list of static texts (instructions, schema, examples), ordered from most to least stable
+    conversation_history = list(history or [])
     
     # Define the system prompts to guide the model's behavior and role.
-    system_prompts = [{"text": "You are a helpful assistant. Keep your answers short and succinct."}]
+    system_prompts = [{"text": SYSTEM_PROMPT}]
+    for text in system or []:
+        system_prompts.append({"text": text})
+        if cache:
+            system_prompts.append(CACHE_POINT)
 
     # payload with model paramters
     message = {"role": "user", "content": [{"text": prompt}]}  
     
     conversation_history.append(message)
-    
-    # Set the temperature for the model inference, controlling the randomness of the responses.
-    temperature = 0.1
 
-    # Set the top_k parameter for the model inference, determining how many of the top predictions to consider.
-    top_k = 200
+    return {
+        "modelId": config.MODEL_ID, # Amazon Bedrock model ID loaded in from the environment variables
+        "messages": conversation_history,
+        "system": system_prompts,
+        "inferenceConfig": {"temperature": TEMPERATURE if temperature is None else temperature},
+        "additionalModelRequestFields": {"top_k": TOP_K}
+    }
+
+
+def _is_cache_rejection(error):
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    return code == "ValidationException" and "cach" in str(error).lower()
+
+
+def _send(operation, prompt, history, system, temperature=None):
+    # Calls converse/converse_stream, retrying once without cache checkpoints if the model rejects them
+    global _prompt_cache_supported
+
+    cache = _prompt_cache_supported and bool(system)
+    try:
+        return operation(**build_request(prompt, history, system, cache, temperature))
+    except Exception as e:
+        if not (cache and _is_cache_rejection(e)):
+            raise
+        config.logger.warning(f"Prompt caching is not supported by {config.MODEL_ID}, sending without cache checkpoints: {str(e)}")
+        _prompt_cache_supported = False
+        return operation(**build_request(prompt, history, system, False, temperature))
+
+
+def _usage_attributes(response):
+    # Token usage and model latency from a converse response or converse_stream metadata event
+    usage = response.get('usage', {})
+    return {
+        "input_tokens": usage.get('inputTokens'),
+        "output_tokens": usage.get('outputTokens'),
+        "cache_read_tokens": usage.get('cacheReadInputTokens'),
+        "cache_write_tokens": usage.get('cacheWriteInputTokens'),
+        "model_latency_ms": response.get('metrics', {}).get('latencyMs'),
+    }
+
+
+def _converse_cancellable(prompt, history, system, temperature, cancel_event, attributes):
+    # Streams the response so it can be abandoned part way: once cancel_event is set the stream is
+    # closed, which ends the generation (and its output token cost) instead of waiting it out
+    response = _send(config.bedrock_client.converse_stream, prompt, history, system, temperature)
+    stream = response['stream']
+    parts = []
+    try:
+        for event in stream:
+            if cancel_event.is_set():
+                attributes["cancelled"] = True
+                raise GenerationCancelled("Generation cancelled")
+            if 'contentBlockDelta' in event:
+                parts.append(event['contentBlockDelta']['delta'].get('text') or '')
+            elif 'metadata' in event:
+                attributes.update(_usage_attributes(event['metadata']))
+    finally:
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+    return {'output': {'message': {'role': 'assistant', 'content': [{'text': ''.join(parts)}]}}}
+
+
+#### HELPER FUNCTION TO CALL BEDROCK
+def call_bedrock(prompt, history=None, system=None, temperature=None, cancel_event=None):
+    # With a cancel_event, the call stops early (raising GenerationCancelled) once the event is set
 
     try:
-        # Call the converse method of the Bedrock client object to get a response from the model.
-        response = config.bedrock_client.converse(
-            modelId = config.MODEL_ID, # Amazon Bedrock model ID loaded in from the environment variables
-            messages=conversation_history,
-            system=system_prompts,
-            inferenceConfig={"temperature": temperature},
-            additionalModelRequestFields={"top_k": top_k}
-        )
+        with tracing.span("bedrock", temperature=temperature) as attributes:
+            if cancel_event is not None:
+                response = _converse_cancellable(prompt, history, system, temperature, cancel_event, attributes)
+            else:
+                # Call the converse method of the Bedrock client object to get a response from the model.
+                response = _send(config.bedrock_client.converse, prompt, history, system, temperature)
+                attributes.update(_usage_attributes(response))
     
         # Extract the output message from the response.
         output_message = response['output']['message']
         
         answer = output_message['content'][0]['text']
         
-        config.logger.info(f"BEDROCK OUTPUT: {answer}")
+        config.logger.debug(f"BEDROCK OUTPUT: {answer}")
     
+    except GenerationCancelled:
+        raise
+
     except Exception as e:
 
         errorMessage = f"An error occurred calling Amazon Bedrock: {str(e)}"
         config.logger.error(errorMessage)
         raise Exception(errorMessage)
         
-    return output_message, answer
\ No newline at end of file
+    return output_message, answer
+
+
+#### HELPER FUNCTION TO STREAM A BEDROCK RESPONSE
+def call_bedrock_stream(prompt, history=None, system=None):
+    # Yields the answer text as it is generated (converse_stream content deltas)
+
+    try:
+        with tracing.span("bedrock", streamed=True) as attributes:
+            response = _send(config.bedrock_client.converse_stream, prompt, history, system)
+
+            for event in response['stream']:
+                if 'contentBlockDelta' in event:
+                    text = event['contentBlockDelta']['delta'].get('text')
+                    if text:
+                        yield text
+                elif 'metadata' in event:
+                    attributes.update(_usage_attributes(event['metadata']))
+
+    except Exception as e:
+
+        errorMessage = f"An error occurred calling Amazon Bedrock: {str(e)}"
+        config.logger.error(errorMessage)
+        raise Exception(errorMessage)
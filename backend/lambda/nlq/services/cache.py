@@ -0,0 +1,179 @@
+import config
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+################ ANSWER CACHE ################
+
+# Answers are keyed by a normalized form of the question plus the Glue schema version,
+# so any change to the catalog automatically invalidates previously cached answers.
+
+def normalize_question(question):
+    # Lowercase, drop punctuation and collapse whitespace so trivial variations share a key
+    text = re.sub(r"[^\w\s]", " ", (question or "").lower())
+    return " ".join(text.split())
+
+
+def make_key(question, schema_version):
+    return f"{schema_version}|{normalize_question(question)}"
+
+
+class MemoryBackend:
+    # In-memory LRU store with a per-entry TTL. Survives across warm Lambda invocations.
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry["value"]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = {"expires_at": time.time() + self.ttl_seconds, "value": value}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._persist()
+
+    def items(self):
+        # Snapshot of the live entries, used by the similarity tier
+        now = time.time()
+        with self._lock:
+            return [(key, entry["value"]) for key, entry in self._entries.items() if entry["expires_at"] >= now]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._persist()
+
+    def _persist(self):
+        pass
+
+
+class FileBackend(MemoryBackend):
+    # Same LRU/TTL semantics as the memory backend, mirrored to a JSON file so the cache
+    # can be inspected and reused offline (or across containers sharing /tmp in local runs)
+
+    def __init__(self, max_entries, ttl_seconds, path):
+        super().__init__(max_entries, ttl_seconds)
+        self.path = path
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, entry in stored:
+                if entry["expires_at"] >= now:
+                    self._entries[key] = entry
+        except Exception as e:
+            config.logger.error(f"Answer cache file could not be loaded: {str(e)}")
+
+    def _persist(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._entries.items()), f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            config.logger.error(f"Answer cache file could not be written: {str(e)}")
+
+
+def _cosine(a, b):
+    dot = sum(count * b.get(token, 0) for token, count in a.items())
+    if not dot:
+        return 0.0
+    norm_a = math.sqrt(sum(c * c for c in a.values()))
+    norm_b = math.sqrt(sum(c * c for c in b.values()))
+    return dot / (norm_a * norm_b)
+
+
+def _numbers(tokens):
+    return {token for token in tokens if any(ch.isdigit() for ch in token)}
+
+
+class AnswerCache:
+
+    def __init__(self, backend, similarity_threshold=0.0):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+
+    def lookup(self, question, schema_version):
+        # Exact tier: identical normalized question against the same schema version
+        hit = self.backend.get(make_key(question, schema_version))
+        if hit is not None:
+            return hit
+
+        if not self.similarity_threshold:
+            return None
+
+        # Similarity tier: cosine similarity over the normalized question tokens. Questions that
+        # mention different numbers (years, amounts, ids) never match each other.
+        tokens = normalize_question(question).split()
+        query_vector = Counter(tokens)
+        best_score, best_value = 0.0, None
+        prefix = f"{schema_version}|"
+
+        for key, value in self.backend.items():
+            if not key.startswith(prefix):
+                continue
+            candidate_tokens = key[len(prefix):].split()
+            if _numbers(candidate_tokens) != _numbers(tokens):
+                continue
+            score = _cosine(query_vector, Counter(candidate_tokens))
+            if score > best_score:
+                best_score, best_value = score, value
+
+        if best_score >= self.similarity_threshold:
+            config.logger.info(f"Answer cache similarity hit (score {best_score:.2f})")
+            return best_value
+        return None
+
+    def store(self, question, schema_version, response):
+        self.backend.put(make_key(question, schema_version), response)
+
+
+_answer_cache = None
+
+
+def get_answer_cache():
+    global _answer_cache
+
+    if _answer_cache is None:
+        if config.ANSWER_CACHE_BACKEND == "file":
+            backend = FileBackend(config.ANSWER_CACHE_MAX_ENTRIES, config.ANSWER_CACHE_TTL_SECONDS, config.ANSWER_CACHE_PATH)
+        else:
+            backend = MemoryBackend(config.ANSWER_CACHE_MAX_ENTRIES, config.ANSWER_CACHE_TTL_SECONDS)
+        _answer_cache = AnswerCache(backend, config.ANSWER_CACHE_SIMILARITY_THRESHOLD)
+
+    return _answer_cache
+
+
+def lookup_answer(question, schema_version):
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    return get_answer_cache().lookup(question, schema_version)
+
+
+def store_answer(question, schema_version, response):
+    if not config.ANSWER_CACHE_ENABLED:
+        return
+    get_answer_cache().store(question, schema_version, response)
@@ -0,0 +1,88 @@
+import json
+from tokens import estimate_tokens
+
+#### HISTORY COMPACTION ####
+
+# Keeps the conversation sent to Bedrock within a token budget. Assistant turns are stored with the
+# full markdown answer; in the context window they are reduced to the SQL plus a short digest of the
+# prose. Turns that still do not fit are folded into a summary of one line per turn, itself bounded.
+
+DIGEST_MAX_CHARS = 300
+
+
+def digest_answer(answer):
+    # The prose of an answer without its markdown table, shortened to DIGEST_MAX_CHARS
+    lines = [line.strip() for line in str(answer).splitlines() if line.strip()]
+    table_rows = [line for line in lines if line.startswith("|")]
+    prose = " ".join(line for line in lines if not line.startswith("|"))
+
+    if len(prose) > DIGEST_MAX_CHARS:
+        prose = prose[:DIGEST_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+
+    # Header and separator rows are not data
+    data_rows = len(table_rows) - 2
+    if data_rows > 0:
+        prose += f" [table with {data_rows} rows omitted]"
+    return prose
+
+
+def _assistant_payload(message):
+    # Assistant turns are written as JSON {"sql_query", "results"}; anything else is treated as plain text
+    text = message["content"][0].get("text", "")
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return {"sql_query": "", "results": text}
+    return payload
+
+
+def compact_message(message):
+    if message.get("role") != "assistant":
+        return message
+    payload = _assistant_payload(message)
+    return {
+        "role": "assistant",
+        "content": [
+            {"text": json.dumps({
+                "sql_query": payload.get("sql_query", ""),
+                "results": digest_answer(payload.get("results", ""))
+            })}
+        ]
+    }
+
+
+def summary_line(turn):
+    question = " ".join(turn["user"]["content"][0].get("text", "").split())
+    sql = _assistant_payload(turn["assistant"]).get("sql_query", "")
+    return f"- {question} (SQL: {sql})" if sql else f"- {question}"
+
+
+def fit_summary(lines, max_tokens):
+    # Drops the oldest lines until the summary fits
+    lines = list(lines)
+    while lines and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return lines
+
+
+def message_tokens(message):
+    return sum(estimate_tokens(block.get("text")) for block in message.get("content", []))
+
+
+def turn_tokens(turn):
+    return message_tokens(turn["user"]) + message_tokens(turn["assistant"])
+
+
+def split_to_budget(turns, budget, max_turns):
+    # Returns (folded, kept): the newest turns are kept while they fit the token budget, at most max_turns
+    used = 0
+    index = len(turns)
+    while index > 0 and len(turns) - index < max_turns:
+        tokens = turn_tokens(turns[index - 1])
+        if used + tokens > budget:
+            break
+        used += tokens
+        index -= 1
+    return turns[:index], turns[index:]
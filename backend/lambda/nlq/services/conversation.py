@@ -0,0 +1,124 @@
+import config
+import copy
+import compaction
+import dynamodb
+import history
+import tracing
+
+#### REQUEST-SCOPED CONVERSATION CONTEXT ####
+
+# One ConversationContext is created per request. The session history is read from DynamoDB
+# the first time a Bedrock call needs it and kept in memory from then on, so SQL retries and
+# summarization share a single read. Each call picks how much of the history it sends.
+#
+# The history is kept within HISTORY_TOKEN_BUDGET tokens: assistant turns are compacted to their
+# SQL and a short digest, and turns that do not fit (or fall outside HISTORY_MAX_TURNS) are folded
+# into a summary that is stored back in the table, so each turn is only folded once.
+
+SUMMARY_PREFIX = "Summary of earlier questions in this conversation:\n"
+
+
+def _sort_key(timestamp):
+    # Message sort keys are "<time.time()>_<index>"
+    seconds, _, index = timestamp.partition("_")
+    return (float(seconds), int(index or 0))
+
+
+class ConversationContext:
+
+    def __init__(self, id, max_turns=None, token_budget=None):
+        self.id = id
+        self.max_turns = config.HISTORY_MAX_TURNS if max_turns is None else max_turns
+        self.token_budget = config.HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+        self._turns = None
+        self._summary = None
+        self._items = []
+
+    def load(self):
+        # Reads the session history and its summary; later calls are no-ops
+        if self._turns is not None:
+            return
+        self._read()
+
+    @tracing.traced("history_read")
+    def _read(self):
+        self._summary = dynamodb.read_summary(self.id) or {"summary": "", "through": ""}
+        through = _sort_key(self._summary["through"]) if self._summary["through"] else None
+
+        items = dynamodb.read_history_items(self.id, self.max_turns)
+        self._turns = []
+        for first, second in zip(items, items[1:]):
+            if first["message"].get("role") != "user" or second["message"].get("role") != "assistant":
+                continue
+            # Turns already folded into the summary are not sent again
+            if through is not None and _sort_key(second["timestamp"]) <= through:
+                continue
+            self._turns.append({
+                "timestamp": second["timestamp"],
+                "user": first["message"],
+                "assistant": compaction.compact_message(second["message"]),
+            })
+
+        self._compact()
+
+    def _compact(self):
+        # Fold the turns that do not fit into the summary; the summary has its own share of the budget
+        turn_budget = self.token_budget - config.HISTORY_SUMMARY_MAX_TOKENS
+        folded, kept = compaction.split_to_budget(self._turns, turn_budget, self.max_turns)
+        if not folded:
+            return
+
+        lines = self._summary["summary"].splitlines() + [compaction.summary_line(turn) for turn in folded]
+        summary = "\n".join(compaction.fit_summary(lines, config.HISTORY_SUMMARY_MAX_TOKENS))
+        self._summary = {"summary": summary, "through": folded[-1]["timestamp"]}
+        self._turns = kept
+
+        try:
+            dynamodb.write_summary(self.id, summary, folded[-1]["timestamp"])
+        except Exception as e:
+            # The next request folds the same turns again
+            config.logger.error(f"Could not store the history summary: {str(e)}")
+
+    def has_history(self):
+        # Whether the session has earlier turns (kept or summarized) that a question may refer to
+        self.load()
+        return bool(self._turns) or bool(self._summary["summary"])
+
+    def messages(self, turns=None):
+        # The last `turns` user/assistant turns, oldest first (all kept turns when None, none when 0),
+        # with the summary of older turns in front of the first user message.
+        # Callers append the new prompt to the returned list, so it is always a copy.
+        if turns == 0:
+            return []
+
+        self.load()
+        selected = self._turns if turns is None else self._turns[-turns:]
+        messages = [message for turn in selected for message in (turn["user"], turn["assistant"])]
+
+        if messages and self._summary["summary"]:
+            first = messages[0]
+            messages[0] = {"role": "user", "content": [{"text": SUMMARY_PREFIX + self._summary["summary"]}] + first["content"]}
+
+        return copy.deepcopy(messages)
+
+    def add_item(self, item):
+        # An item (e.g. a verified example) written with the next turn, in the same batch; None is ignored
+        if item is not None:
+            self._items.append(item)
+
+    @tracing.traced("history_write")
+    def add_turn(self, user_query, final_query, output):
+        # Record our key conversation history for future chats to read as context, and keep the
+        # in-memory copy current for any later call in this request
+        messages = history.turn_messages(user_query, final_query, output)
+        items, self._items = self._items, []
+        timestamps = history.record_turn(self.id, messages, "nlq", extra_items=items)
+
+        # When nothing was loaded (an answer cache hit) the next request compacts instead
+        if self._turns is not None:
+            self._turns.append({
+                "timestamp": timestamps[-1],
+                "user": messages[0],
+                "assistant": compaction.compact_message(messages[1]),
+            })
+            self._compact()
@@ -1,46 +1,145 @@
 import config
 import time
-import boto3
-import json
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
 
 ################ DYNAMO DB CONVO HISTORY ################
 
-def write_history_to_dynamodb(history, id):
-    # Take in message from conversation history
-    # Augment with session id and the timestamp
-    # Write to DynamoDB
+# Uses the low-level DynamoDB client (the resource layer costs noticeably more to load on a cold
+# start); items are converted to and from DynamoDB's attribute value format here. Turns are written
+# by history.py.
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _serialize(item):
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def _deserialize(item):
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
+
+def read_history_items(id, max_turns=None):
+    # The most recent max_turns user/assistant turns of the session, oldest first, as
+    # {"timestamp", "message"} entries
     
-    timestamp = str(time.time())
+    if max_turns is None:
+        max_turns = config.HISTORY_MAX_TURNS
+
+    return_items = _query_recent_items(id, max_turns * 2)
+
+    # The conversation passed to Bedrock must start with a user message
+    while return_items and return_items[0]["message"].get("role") != "user":
+        return_items.pop(0)
+
+    return return_items
+
+
+def _query_recent_items(id, max_messages):
     
-    # Add an index to differentiate messages written at the same time (avoid overwrites)
-    for idx, item in enumerate(history):
+    return_items = []
+
+    if max_messages <= 0:
+        return return_items
+
+    query_args = {
+        "TableName": config.TABLE_NAME,
+        # Message timestamps all sort after the summary item's sort key
+        "KeyConditionExpression": "#id = :id AND #timestamp > :summary",
+        "ExpressionAttributeNames": {"#id": "id", "#message": "message", "#timestamp": "timestamp"},
+        "ExpressionAttributeValues": {":id": {"S": id}, ":summary": {"S": SUMMARY_TIMESTAMP}},
+        "ScanIndexForward": False,  # newest first
+        "ProjectionExpression": "#message, #timestamp",
+        "Limit": max_messages,
+    }
+
+    # Retrieve the most recent conversation history for the current session ID, following pagination
+    while len(return_items) < max_messages:
+        response = config.dynamodb_client.query(**query_args)
         
-        dynamodb_item = {
-            "id": id,
-            "timestamp": f"{timestamp}_{idx}",
-            "message": item  
-        }
+        items = response.get('Items', []) # get the items from the response, or an empty list if none
         
-        config.dynamodb_table.put_item(Item=dynamodb_item)
+        for item in map(_deserialize, items):
+            # Add message to our items list
+            return_items.append({"timestamp": item["timestamp"], "message": item.get("message", {})})
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_args["ExclusiveStartKey"] = last_key
+        query_args["Limit"] = max_messages - len(return_items)
+
+    return_items = return_items[:max_messages]
+    return_items.reverse()
         
-        config.logger.info(f"\n\nItem with ID {id} and timestamp {timestamp} written to table {config.dynamodb_table}\n\n")
+    return return_items
 
-def read_history_from_dynamodb(id):
-    
-    return_items = []
 
-    # Retrieve all the conversation history for the current session ID
-    response = config.dynamodb_table.query(
-        KeyConditionExpression=boto3.dynamodb.conditions.Key('id').eq(id),
+#### VERIFIED EXAMPLES ####
+
+# Question -> SQL pairs the nlq pipeline answered successfully, under a partition of their own so the
+# example store reads them with a Query rather than scanning sessions. Sort keys start with the time the
+# pair was verified, so the newest pairs are read first.
+EXAMPLES_ID = "examples#nlq"
+
+
+def example_item(fingerprint, question, sql):
+    # The item for a verified pair, written by history.write_items along with the turn that verified it
+    return {
+        "id": EXAMPLES_ID,
+        "timestamp": f"{time.time():.6f}_{fingerprint[:16]}",
+        "question": question,
+        "sql": sql,
+    }
+
+
+def read_examples(max_items):
+    # The newest max_items {"question", "sql"} pairs, newest first. A pair verified more than once has
+    # an item per verification; the example store keeps one.
+    items = []
+    query_args = {
+        "TableName": config.TABLE_NAME,
+        "KeyConditionExpression": "#id = :id",
+        "ExpressionAttributeNames": {"#id": "id", "#question": "question", "#sql": "sql"},
+        "ExpressionAttributeValues": {":id": {"S": EXAMPLES_ID}},
+        "ProjectionExpression": "#question, #sql",
+        "ScanIndexForward": False,  # newest first
+        "Limit": max_items,
+    }
+    while len(items) < max_items:
+        response = config.dynamodb_client.query(**query_args)
+        items.extend(map(_deserialize, response.get("Items", [])))
+        if not response.get("LastEvaluatedKey"):
+            break
+        query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        query_args["Limit"] = max_items - len(items)
+    return items[:max_items]
+
+
+#### COMPACTED HISTORY SUMMARY ####
+
+# One item per session holds the digest of turns that were compacted out of the context window.
+# Its sort key sorts before every message timestamp (time.time() values), so history queries skip it.
+SUMMARY_TIMESTAMP = "0_summary"
+
+
+def read_summary(id):
+    # Returns {"summary": str, "through": timestamp of the newest folded message} or None
+    response = config.dynamodb_client.get_item(
+        TableName=config.TABLE_NAME,
+        Key=_serialize({"id": id, "timestamp": SUMMARY_TIMESTAMP}),
     )
-    
-    items = response.get('Items', []) # get the items from the response, or an empty list if none
-    
-    for item in items:
-        message_data = item.get("message", "{}")
-        
-        # Add message to our items list
-        # The final list will contain the full session conversation history
-        return_items.append(message_data)
-        
-    return return_items
\ No newline at end of file
+    if not response.get("Item"):
+        return None
+    item = _deserialize(response["Item"])
+    return {"summary": item.get("summary", ""), "through": item.get("through", "")}
+
+
+def write_summary(id, summary, through):
+    config.dynamodb_client.put_item(TableName=config.TABLE_NAME, Item=_serialize({
+        "id": id,
+        "timestamp": SUMMARY_TIMESTAMP,
+        "summary": summary,
+        "through": through,
+    }))
+    config.logger.info(f"History summary for ID {id} updated through {through}")
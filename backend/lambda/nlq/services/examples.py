@@ -0,0 +1,182 @@
+import config
+import math
+import threading
+import time
+from collections import Counter
+import athena
+import dynamodb
+import metadata
+import sql_validator
+from schema_index import tokenize
+from tokens import estimate_tokens
+
+#### FEW-SHOT EXAMPLE STORE ####
+
+# Verified question -> SQL pairs, of which the most similar to each question are sent to the model
+# as examples. The store starts from the curated examples in sample_queries.py and adds the questions
+# the pipeline has answered: each SQL that ran successfully is written to the verified-examples
+# partition of the history table, which is loaded in the background and kept only if it still
+# validates against the current schema. Pairs are ranked by TF-IDF cosine similarity over the
+# question terms (and the identifiers in their SQL), and the top EXAMPLES_TOP_K are sent, within
+# EXAMPLES_TOKEN_BUDGET tokens.
+
+# Weight of a term found in an example's SQL relative to one in its question
+SQL_TERM_WEIGHT = 0.5
+
+
+def _terms(question, sql):
+    # Question terms, plus the tables and columns the SQL uses at a lower weight
+    terms = Counter(tokenize(question))
+    for token in tokenize(sql):
+        terms[token] += SQL_TERM_WEIGHT
+    return terms
+
+
+class ExampleStore:
+
+    def __init__(self, examples=()):
+        self.examples = []
+        self._fingerprints = set()
+        self._idf = None
+        self._lock = threading.Lock()
+        for example in examples:
+            self.add(example["question"], example["sql"], example.get("source", "sample"))
+
+    def add(self, question, sql, source="verified"):
+        # Equivalent SQL is only kept once; returns the fingerprint if the pair was added, else None.
+        # A full store makes room by evicting its least recently verified pair (curated samples stay).
+        sql = " ".join(sql.split())
+        fingerprint = athena.fingerprint_sql(sql)
+        with self._lock:
+            if fingerprint in self._fingerprints:
+                # Verified again: now the most recent
+                index = next(i for i, example in enumerate(self.examples) if example["fingerprint"] == fingerprint)
+                if self.examples[index]["source"] != "sample":
+                    self.examples.append(self.examples.pop(index))
+                return None
+            if len(self.examples) >= config.EXAMPLES_MAX:
+                index = next((i for i, example in enumerate(self.examples) if example["source"] != "sample"), None)
+                if index is None:
+                    return None
+                self._fingerprints.discard(self.examples.pop(index)["fingerprint"])
+            self._fingerprints.add(fingerprint)
+            self.examples.append({"question": question, "sql": sql, "source": source, "fingerprint": fingerprint,
+                                  "terms": _terms(question, sql)})
+            self._idf = None
+        return fingerprint
+
+    def _weights(self):
+        with self._lock:
+            if self._idf is None:
+                document_frequency = Counter(term for example in self.examples for term in example["terms"])
+                total = len(self.examples)
+                self._idf = {term: math.log(1 + total / count) for term, count in document_frequency.items()}
+            return self._idf, list(self.examples)
+
+    def search(self, question, top_k=None, token_budget=None):
+        # The most similar examples, best first, that fit in token_budget. Curated samples stand in
+        # when nothing is similar, so the model always sees the expected output format.
+        top_k = config.EXAMPLES_TOP_K if top_k is None else top_k
+        token_budget = config.EXAMPLES_TOKEN_BUDGET if token_budget is None else token_budget
+        idf, examples = self._weights()
+
+        query = {term: count * idf.get(term, 0.0) for term, count in Counter(tokenize(question)).items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+
+        scored = []
+        for example in examples:
+            vector = {term: count * idf[term] for term, count in example["terms"].items()}
+            dot = sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+            if dot and query_norm:
+                scored.append((dot / (query_norm * math.sqrt(sum(w * w for w in vector.values()))), example))
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        ranked = [example for _, example in scored]
+        if not ranked:
+            ranked = [example for example in examples if example["source"] == "sample"]
+
+        selected, used = [], 0
+        for example in ranked:
+            if len(selected) >= top_k:
+                break
+            cost = estimate_tokens(render_example(len(selected) + 1, example))
+            if used + cost > token_budget:
+                continue
+            selected.append(example)
+            used += cost
+        return selected
+
+
+def render_example(number, example):
+    return f"""{number}. Query: {example['question']}
+
+    {example['sql']}
+"""
+
+
+def render_examples(examples):
+    return "Example SQL Queries:\n" + "\n".join(render_example(i + 1, example) for i, example in enumerate(examples))
+
+
+#### SEEDING ####
+
+_store = None
+_loaded_at = 0.0
+_loading = False
+_seed_lock = threading.Lock()
+
+
+def get_store(samples):
+    # Never reads the table on the request path: the verified examples are loaded on a background
+    # thread every EXAMPLES_REFRESH_SECONDS and swapped in once validated
+    global _store, _loading
+
+    with _seed_lock:
+        if _store is None:
+            _store = ExampleStore(samples)
+        if config.EXAMPLES_FROM_HISTORY and not _loading and time.time() - _loaded_at >= config.EXAMPLES_REFRESH_SECONDS:
+            _loading = True
+            threading.Thread(target=_load_verified, args=(samples,), daemon=True).start()
+        return _store
+
+
+def _load_verified(samples):
+    global _store, _loaded_at, _loading
+
+    store = ExampleStore(samples)
+    try:
+        verified = dynamodb.read_examples(config.EXAMPLES_MAX)
+        schema_details = metadata.get_full_metadata()
+        # Oldest first, so the store's order (and eviction) follows verification time
+        added = sum(1 for example in reversed(verified)
+                    if sql_validator.validate_sql(example["sql"], schema_details)["valid"]
+                    and store.add(example["question"], example["sql"]))
+        config.logger.info(f"Example store loaded {added} of {len(verified)} verified examples")
+    except Exception as e:
+        config.logger.error(f"Could not load verified examples: {str(e)}")
+        store = None
+
+    with _seed_lock:
+        if store is not None:
+            # Pairs verified while loading are kept
+            for example in list(_store.examples):
+                if example["fingerprint"] not in store._fingerprints:
+                    store.add(example["question"], example["sql"], example["source"])
+            _store = store
+        _loaded_at, _loading = time.time(), False
+
+
+def examples_for(question, samples):
+    # The rendered examples to send with a question
+    return render_examples(get_store(samples).search(question))
+
+
+def add_verified(question, sql):
+    # A question answered by SQL that ran successfully becomes an example for later questions. Returns
+    # the item that shares it with every other Lambda instance, to be written with the turn (None when
+    # the pair is not new)
+    if _store is None:
+        return None
+    fingerprint = _store.add(question, sql)
+    if fingerprint is None or not config.EXAMPLES_FROM_HISTORY:
+        return None
+    return dynamodb.example_item(fingerprint, question, " ".join(sql.split()))
@@ -0,0 +1,246 @@
+import config
+import difflib
+import re
+import threading
+import athena
+import cache
+import metadata
+
+#### INTENT ROUTER ####
+
+# Questions that match a known intent over the donations star schema are answered from a
+# parameterized SQL template instead of a generated query, so they cost one query and no model call.
+# Entity slots (campaign names, ...) must name one of the column's distinct values as a whole, matched
+# fuzzily; the values are read in the background once per data version. Numbers, months and years come
+# from the question itself. Anything that does not match an intent (or a known value) is left to the
+# model, as is any question the router fails on.
+
+# Logical tables, by their name in each engine: the Glue sample tables (Athena and the local engine)
+# and the tables redshiftLoader creates
+TABLES = {
+    "donations": ["sample_donations", "donationfact"],
+    "campaigns": ["sample_campaigns", "campaigndim"],
+    "donors": ["sample_donors", "donordim"],
+    "payment": ["sample_payment", "paymentmethoddim"],
+    "date": ["sample_date", "datedim"],
+}
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july", "august",
+          "september", "october", "november", "december"]
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "twenty": 20}
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 100
+
+_MONTH = "(?P<month>" + "|".join(MONTHS) + ")"
+_LIMIT = r"(?P<limit>\d+|" + "|".join(NUMBER_WORDS) + ")"
+
+# Patterns run against the normalized question (lowercase, no punctuation); the first intent whose
+# pattern matches and whose slots resolve wins
+INTENTS = [
+    {
+        "name": "donations_by_payment_method",
+        "tables": ["donations", "payment"],
+        "patterns": [
+            r"^(what (is|was|are|were) )?(the )?(total )?(donations|donation amounts?|amount donated|amount raised) (by|per|for each) payment (method|type)s?$",
+            r"^how much (money )?(was|has been) (donated|given|raised) (with|by|per|through|using) (each|every) payment (method|type)$",
+        ],
+        "sql": """SELECT p.paymentmethodname, SUM(d.donationamount) AS total_donation_amount
+FROM {donations} d
+JOIN {payment} p ON d.paymentmethodkey = p.paymentmethodkey
+GROUP BY p.paymentmethodname
+ORDER BY total_donation_amount DESC""",
+    },
+    {
+        "name": "campaign_total",
+        "tables": ["donations", "campaigns"],
+        "patterns": [
+            r"^(what (is|was) )?(the )?total (donation amount|donations|amount donated|amount raised) (for|to|from|in) (the )?(?P<campaign>.+?)( campaign)?$",
+            r"^how much (money )?(was|has been) (donated|given|raised) (for|to|in|by) (the )?(?P<campaign>.+?)( campaign)?$",
+        ],
+        "entities": {"campaign": ("campaigns", "campaignname")},
+        "sql": """SELECT SUM(d.donationamount) AS total_donation_amount
+FROM {donations} d
+JOIN {campaigns} c ON d.campaignkey = c.campaignkey
+WHERE c.campaignname = {campaign}""",
+    },
+    {
+        "name": "top_donors",
+        "tables": ["donations", "donors", "date"],
+        "patterns": [
+            rf"^(who (is|was|are|were) )?(the )?(our )?top {_LIMIT}? ?donors( by (total )?(donations|donation amount|amount donated))?( (in|for|during) {_MONTH}? ?(?P<year>\d{{4}})?)?$",
+        ],
+        "sql": """SELECT dn.firstname, dn.lastname, SUM(d.donationamount) AS total_donation_amount
+FROM {donations} d
+JOIN {donors} dn ON d.donorkey = dn.donorkey
+JOIN {date} dt ON d.datekey = dt.datekey
+{period}
+GROUP BY dn.firstname, dn.lastname
+ORDER BY total_donation_amount DESC
+LIMIT {limit}""",
+    },
+]
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _normalize(text):
+    return cache.normalize_question(text)
+
+
+def match_value(text, values, threshold=None):
+    # The value that the whole of text names: an exact match, or the closest value by similarity ratio
+    # at or above threshold with as many words as text, so misspellings match but extra words ("... in
+    # 2023", "... by payment method") do not. None when nothing (or more than one value) fits.
+    threshold = config.INTENT_MATCH_THRESHOLD if threshold is None else threshold
+    text = _normalize(text)
+    if not text or not values:
+        return None
+
+    normalized = {}
+    for value in values:
+        normalized.setdefault(_normalize(value), value)
+    if text in normalized:
+        return normalized[text]
+
+    words = len(text.split())
+    candidates = [key for key in normalized if len(key.split()) == words]
+    close = difflib.get_close_matches(text, candidates, n=2, cutoff=threshold)
+    if not close:
+        return None
+    # Two near-identical candidates are ambiguous; the model can ask or choose
+    if len(close) > 1 and difflib.SequenceMatcher(None, text, close[1]).ratio() == difflib.SequenceMatcher(None, text, close[0]).ratio():
+        return None
+    return normalized[close[0]]
+
+
+#### COLUMN VALUE DICTIONARY ####
+
+# Values are loaded on a background thread, never on the request path: until a column's values are
+# loaded for the current data version, questions that need them go to the model.
+_values = {}
+_loading = set()
+_values_lock = threading.Lock()
+
+
+def column_values(table, column):
+    # Distinct values of a column for the current data version, or None if they are not loaded (a
+    # load is started) or cannot be read in full
+    key = (metadata.get_data_version(), table, column)
+    with _values_lock:
+        if key in _values:
+            return _values[key]
+        if key in _loading:
+            return None
+        _loading.add(key)
+    threading.Thread(target=_load_values, args=(key,), daemon=True).start()
+    return None
+
+
+def load_column_values(table, column):
+    # Reads the values now and keeps them for the current data version
+    return _load_values((metadata.get_data_version(), table, column))
+
+
+def load_all_values():
+    # Reads the values of every intent's entity columns now, as the background loads would
+    for intent in INTENTS:
+        tables = _resolve_tables(intent["tables"])
+        if tables is None:
+            continue
+        for table, column in intent.get("entities", {}).values():
+            load_column_values(tables[table], column)
+
+
+def _load_values(key):
+    _, table, column = key
+    try:
+        check = athena.syntax_checker(
+            f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT {config.INTENT_VALUES_MAX + 1}"
+        )
+    except Exception as e:
+        # Not kept, so a later question retries the load
+        config.logger.error(f"Could not read the values of {table}.{column}: {str(e)}")
+        with _values_lock:
+            _loading.discard(key)
+        return None
+
+    values = None
+    if check.get("state") == "PASSED" and check["output"]["row_count"] <= config.INTENT_VALUES_MAX:
+        values = [row[0] for row in check["output"]["rows"] if row[0] is not None]
+    else:
+        config.logger.info(f"Values of {table}.{column} are not available for intent matching")
+
+    with _values_lock:
+        # Values of earlier data versions are dropped
+        for stale in [stale for stale in _values if stale[0] != key[0]]:
+            del _values[stale]
+        _values[key] = values
+        _loading.discard(key)
+    return values
+
+
+#### ROUTING ####
+
+def _resolve_tables(names):
+    # {logical name: table name in the catalog}, or None if one of them is missing
+    catalog = {name.lower(): name for name in metadata.get_full_metadata()}
+    tables = {}
+    for name in names:
+        table = next((catalog[candidate] for candidate in TABLES[name] if candidate in catalog), None)
+        if table is None:
+            return None
+        tables[name] = table
+    return tables
+
+
+def _fill_slots(intent, slots, tables):
+    # Template parameters from the matched slots, or None if one cannot be resolved
+    parameters = dict(tables)
+
+    for slot, (table, column) in intent.get("entities", {}).items():
+        value = match_value(slots.get(slot) or "", column_values(tables[table], column))
+        if value is None:
+            return None
+        parameters[slot] = _literal(value)
+
+    if "{limit}" in intent["sql"]:
+        limit = slots.get("limit")
+        limit = (NUMBER_WORDS.get(limit) or int(limit)) if limit else DEFAULT_LIMIT
+        parameters["limit"] = max(1, min(limit, MAX_LIMIT))
+
+    if "{period}" in intent["sql"]:
+        conditions = []
+        if slots.get("month"):
+            conditions.append(f"dt.month = {MONTHS.index(slots['month']) + 1}")
+        if slots.get("year"):
+            conditions.append(f"dt.year = {int(slots['year'])}")
+        parameters["period"] = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    return parameters
+
+
+def route(question):
+    # {"intent", "sql", "slots"} for a question answered by a template, or None
+    if not config.INTENT_ROUTER_ENABLED or not question:
+        return None
+
+    text = _normalize(question)
+    for intent in INTENTS:
+        for pattern in intent["patterns"]:
+            found = re.match(pattern, text)
+            if found is None:
+                continue
+            tables = _resolve_tables(intent["tables"])
+            if tables is None:
+                break
+            slots = {name: value for name, value in found.groupdict().items() if value}
+            parameters = _fill_slots(intent, slots, tables)
+            if parameters is None:
+                continue
+            sql = intent["sql"].format(**parameters)
+            return {"intent": intent["name"], "sql": " ".join(sql.split()), "slots": slots}
+    return None
@@ -0,0 +1,325 @@
+import config
+import csv
+import io
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import results
+
+#### LOCAL QUERY ENGINE ####
+
+# Runs generated SQL in-process with sqlite against CSV extracts laid out like the sample data bucket
+# the Glue crawler reads: one folder of CSV files per table, named <LOCAL_ENGINE_TABLE_PREFIX><folder>.
+# The extract is loaded once per container, from a local directory or an s3:// prefix.
+#
+# It serves two purposes: QUERY_ENGINE=local replaces Athena (and the Glue catalog) for development,
+# and QUERY_PREFLIGHT dry-runs each query on the extract before Athena sees it, so queries that
+# cannot work fail in milliseconds instead of after an Athena round trip.
+
+# sqlite errors that mean the query cannot run on Athena either. Anything else (a Trino function
+# or syntax sqlite lacks, a timeout) leaves the dry run inconclusive.
+DEFINITE_ERRORS = (
+    "no such table",
+    "no such column",
+    "ambiguous column name",
+    "misuse of aggregate",
+    "do not have the same number of result columns",
+    "sub-select returns",
+)
+
+SQLITE_TYPES = {"bigint": "INTEGER", "double": "REAL", "string": "TEXT"}
+
+# MySQL-style format specifiers used by Trino's date_parse/date_format -> strptime/strftime
+_DATE_FORMATS = {
+    "%c": "%m", "%e": "%d", "%i": "%M", "%s": "%S", "%T": "%H:%M:%S", "%k": "%H", "%h": "%I",
+    "%M": "%B", "%W": "%A", "%r": "%I:%M:%S %p", "%f": "%f",
+}
+
+
+class LocalQueryError(Exception):
+    pass
+
+
+class LocalEngineUnavailable(Exception):
+    # LOCAL_ENGINE_DATA is missing or holds no tables, e.g. the default path inside a deployed asset
+    pass
+
+
+#### TRINO COMPATIBILITY ####
+
+# The functions generated SQL most often uses that sqlite does not have (or has with other semantics)
+
+def _python_format(mysql_format):
+    output, i = [], 0
+    while i < len(mysql_format):
+        piece = mysql_format[i:i + 2]
+        if piece in _DATE_FORMATS:
+            output.append(_DATE_FORMATS[piece])
+            i += 2
+        else:
+            output.append(mysql_format[i])
+            i += 1
+    return "".join(output)
+
+
+def _to_datetime(value):
+    if value is None:
+        return None
+    text = str(value)
+    for pattern in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(text, pattern)
+        except ValueError:
+            continue
+    return None
+
+
+def _date_parse(value, mysql_format):
+    if value is None:
+        return None
+    # Rendered the way Athena renders timestamps
+    return datetime.strptime(str(value), _python_format(mysql_format)).strftime("%Y-%m-%d %H:%M:%S.000")
+
+
+def _date_format(value, mysql_format):
+    parsed = _to_datetime(value)
+    return parsed.strftime(_python_format(mysql_format)) if parsed else None
+
+
+def _date_part(attribute):
+    def part(value):
+        parsed = _to_datetime(value)
+        if parsed is None:
+            return None
+        return (parsed.month - 1) // 3 + 1 if attribute == "quarter" else getattr(parsed, attribute)
+    return part
+
+
+def _concat(*values):
+    # Trino returns NULL when any argument is NULL
+    return None if any(value is None for value in values) else "".join(str(value) for value in values)
+
+
+class _ApproxDistinct:
+
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+def _register_functions(connection):
+    connection.create_function("date_parse", 2, _date_parse, deterministic=True)
+    connection.create_function("date_format", 2, _date_format, deterministic=True)
+    for attribute in ("year", "month", "day", "quarter"):
+        connection.create_function(attribute, 1, _date_part(attribute), deterministic=True)
+    connection.create_function("concat", -1, _concat, deterministic=True)
+    connection.create_aggregate("approx_distinct", 1, _ApproxDistinct)
+
+
+#### LOADING ####
+
+def _column_type(values):
+    # The types the Glue crawler infers for CSV columns: bigint, double or string
+    present = [value for value in values if value != ""]
+    if not present:
+        return "string"
+    for cast, column_type in ((int, "bigint"), (float, "double")):
+        try:
+            for value in present:
+                cast(value)
+            return column_type
+        except ValueError:
+            continue
+    return "string"
+
+
+def _result_type(values):
+    # sqlite does not report result column types, so they are taken from the first non-null value
+    for value in values:
+        if isinstance(value, int):
+            return "bigint"
+        if isinstance(value, float):
+            return "double"
+        if value is not None:
+            return "varchar"
+    return "varchar"
+
+
+def _read_local(source):
+    # {folder: [CSV text, ...]} from a directory
+    tables = {}
+    for folder in sorted(os.listdir(source)):
+        path = os.path.join(source, folder)
+        if not os.path.isdir(path):
+            continue
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(".csv"):
+                with open(os.path.join(path, name), encoding="utf-8-sig") as f:
+                    tables.setdefault(folder, []).append(f.read())
+    return tables
+
+
+def _read_s3(source):
+    # {folder: [CSV text, ...]} from an s3://bucket/prefix/ holding <folder>/<file>.csv objects
+    bucket, _, prefix = source.replace("s3://", "", 1).partition("/")
+    prefix = prefix.rstrip("/") + "/" if prefix else ""
+    tables = {}
+    paginator = config.s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            folder, _, name = item["Key"][len(prefix):].partition("/")
+            if name and name.lower().endswith(".csv"):
+                body = config.s3_client.get_object(Bucket=bucket, Key=item["Key"])["Body"].read()
+                tables.setdefault(folder, []).append(body.decode("utf-8-sig"))
+    return tables
+
+
+class LocalEngine:
+
+    def __init__(self, source, table_prefix="", sample_rows=0):
+        self.source = source
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        _register_functions(self.connection)
+
+        self.tables = {}  # {table_name: [{"Name": ..., "Type": ...}]}, in Glue's format
+        if not source.startswith("s3://") and not os.path.isdir(source):
+            raise LocalEngineUnavailable(f"LOCAL_ENGINE_DATA {source} is not a directory")
+        files = _read_s3(source) if source.startswith("s3://") else _read_local(source)
+        for folder, texts in files.items():
+            self._load_table(f"{table_prefix}{folder}", texts, sample_rows)
+        if not self.tables:
+            # An empty catalog would fail every query as "no such table"
+            raise LocalEngineUnavailable(f"No CSV tables found in LOCAL_ENGINE_DATA {source}")
+        self.loaded_at = time.time()
+
+        config.logger.info(f"Local query engine loaded {len(self.tables)} tables from {source}")
+
+    def _load_table(self, table_name, texts, sample_rows):
+        header, rows = None, []
+        for text in texts:
+            reader = csv.reader(io.StringIO(text))
+            header = [name.strip().lower() for name in next(reader, [])] or header
+            rows.extend(row for row in reader if row)
+        if not header:
+            return
+        if sample_rows:
+            rows = rows[:sample_rows]
+
+        columns = [{"Name": name, "Type": _column_type([row[i] if i < len(row) else "" for row in rows])} for i, name in enumerate(header)]
+        self.tables[table_name] = columns
+
+        column_list = ", ".join(f'"{col["Name"]}" {SQLITE_TYPES[col["Type"]]}' for col in columns)
+        self.connection.execute(f'CREATE TABLE "{table_name}" ({column_list})')
+        placeholders = ", ".join("?" for _ in columns)
+        # Empty fields are NULLs, as Athena reads them for numeric columns
+        self.connection.executemany(
+            f'INSERT INTO "{table_name}" VALUES ({placeholders})',
+            ([(row[i] if i < len(row) and row[i] != "" else None) for i in range(len(columns))] for row in rows),
+        )
+
+    def glue_tables(self):
+        # The loaded tables as a Glue get_tables TableList, so the catalog can be served locally
+        update_time = datetime.fromtimestamp(self.loaded_at).isoformat()
+        return [{"Name": name, "UpdateTime": update_time, "StorageDescriptor": {"Columns": columns}}
+                for name, columns in self.tables.items()]
+
+    def execute(self, query, timeout_ms=None, cancel_event=None, max_rows=None, max_bytes=None):
+        # Returns the result in the format of results.read_results. Raises LocalQueryError, or
+        # sqlite3.OperationalError("interrupted") when timed out or cancelled.
+        deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+
+        def interrupt():
+            return (deadline is not None and time.monotonic() > deadline) or (cancel_event is not None and cancel_event.is_set())
+
+        with self._lock:
+            self.connection.set_progress_handler(interrupt, 10000)
+            try:
+                cursor = self.connection.execute(query)
+                rows, truncated = results.collect_rows(cursor, max_rows, max_bytes)
+                names = [column[0] for column in cursor.description or []]
+            except sqlite3.OperationalError as e:
+                if str(e) == "interrupted":
+                    raise
+                raise LocalQueryError(str(e)) from e
+            except sqlite3.Error as e:
+                raise LocalQueryError(str(e)) from e
+            finally:
+                self.connection.set_progress_handler(None, 0)
+
+        columns = [{"name": name, "type": _result_type(row[i] for row in rows)} for i, name in enumerate(names)]
+        return {
+            "columns": columns,
+            "rows": [list(row) for row in rows],
+            "row_count": len(rows),
+            "truncated": truncated,
+            "source": "local",
+        }
+
+
+_engine = None
+_engine_error = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    # Loaded on first use and kept for the life of the container. Raises LocalEngineUnavailable when
+    # there is no extract to load; the failure is kept too, so it is not retried on every request.
+    global _engine, _engine_error
+    with _engine_lock:
+        if _engine is None and _engine_error is None:
+            try:
+                _engine = LocalEngine(config.LOCAL_ENGINE_DATA, config.LOCAL_ENGINE_TABLE_PREFIX, config.LOCAL_ENGINE_SAMPLE_ROWS)
+            except LocalEngineUnavailable as e:
+                config.logger.error(f"Local query engine unavailable: {str(e)}")
+                _engine_error = e
+        if _engine_error is not None:
+            raise _engine_error
+    return _engine
+
+
+#### QUERY CHECKS ####
+
+def check_query(query, cancel_event=None):
+    # Same contract as athena._check_query: {"state": "PASSED"|"FAILED", "output", "statistics"}
+    start = time.perf_counter()
+    try:
+        output = get_engine().execute(query, config.LOCAL_ENGINE_TIMEOUT_MS, cancel_event)
+        state = "PASSED"
+    except LocalQueryError as e:
+        output, state = str(e), "FAILED"
+    except sqlite3.OperationalError:
+        if cancel_event is not None and cancel_event.is_set():
+            output = "Query was cancelled"
+        else:
+            output = f"Query did not finish within {config.LOCAL_ENGINE_TIMEOUT_MS} ms"
+        state = "FAILED"
+
+    statistics = {"engine_ms": round((time.perf_counter() - start) * 1000, 1), "queue_ms": 0, "bytes_scanned": 0, "reused": False}
+    return {"state": state, "output": output, "statistics": statistics}
+
+
+def dry_run(query, cancel_event=None):
+    # Runs the query on the extract, reading a single row. Returns the error when the query
+    # definitely fails, None when it ran or the result is inconclusive.
+    try:
+        get_engine().execute(query, config.LOCAL_ENGINE_TIMEOUT_MS, cancel_event, max_rows=1)
+    except LocalQueryError as e:
+        message = str(e)
+        if any(error in message for error in DEFINITE_ERRORS):
+            return message
+        config.logger.info(f"Pre-flight inconclusive: {message}")
+    except LocalEngineUnavailable:
+        # Logged once by get_engine; Athena runs every query unchecked
+        pass
+    except Exception as e:
+        config.logger.info(f"Pre-flight skipped: {str(e)}")
+    return None
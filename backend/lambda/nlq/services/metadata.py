@@ -1,26 +1,171 @@
 import config
+import hashlib
+import json
+import threading
+import time
+import athena
+import local_engine
+import redshift
+import schema_index
+import tracing
+from concurrent.futures import ThreadPoolExecutor
 
+#### SCHEMA CATALOG ####
 
+# The catalog lives at module scope so it survives across warm Lambda invocations.
+# It is refreshed lazily: nothing is fetched until the TTL expires, and after a refresh
+# the schema is only rebuilt (and the prompt text re-rendered) when a table's UpdateTime changed.
+_catalog = {
+    "tables": None,        # {table_name: [{"Name": ..., "Type": ...}]}
+    "update_times": None,  # {table_name: UpdateTime} used for change detection
+    "version": None,       # fingerprint of the table/column layout
+    "table_text": None,    # {table_name: pre-rendered prompt line}
+    "sample_values": None, # {table_name: {column: [values]}} for the schema index, when enabled
+    "checked_at": 0.0,
+}
+_catalog_lock = threading.Lock()
+_sample_values_lock = threading.Lock()
+
+
+def _fetch_tables():
+    # Page through every table in the database (get_tables returns at most 100 per call)
+    if config.QUERY_ENGINE == "local":
+        # Queries run against the local extract, so its tables are the catalog
+        return local_engine.get_engine().glue_tables()
+    if config.QUERY_ENGINE == "redshift":
+        return redshift.glue_tables()
+    paginator = config.glue_client.get_paginator("get_tables")
+    tables = []
+    for page in paginator.paginate(DatabaseName=config.GLUE_DB_NAME):
+        tables.extend(page.get("TableList", []))
+    return tables
+
+
+def _render_table(table_name, columns):
+    column_text = ", ".join(f"{col['Name']} {col['Type']}" for col in columns)
+    return f"{table_name} ({column_text})"
+
+
+def _build_catalog(tables, update_times):
+    schema_details = {}
+
+    for table in tables:
+        table_name = table["Name"]
+        # Partition columns are queryable like any other column
+        columns = table.get("StorageDescriptor", {}).get("Columns", []) + table.get("PartitionKeys", [])
+
+        # Extract column details
+        schema_details[table_name] = [
+            {"Name": col["Name"], "Type": col["Type"]} for col in columns
+        ]
+
+    serialized = json.dumps(schema_details, sort_keys=True)
+
+    _catalog["tables"] = schema_details
+    _catalog["update_times"] = update_times
+    _catalog["version"] = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+    _catalog["table_text"] = {name: _render_table(name, columns) for name, columns in schema_details.items()}
+    _catalog["sample_values"] = None
+
+    config.logger.info(f"Metadata catalog rebuilt: {len(schema_details)} tables, version {_catalog['version']}")
+
+
+def refresh_catalog(force=False):
+    with _catalog_lock:
+        now = time.time()
+        if not force and _catalog["tables"] is not None and now - _catalog["checked_at"] < config.METADATA_CACHE_TTL_SECONDS:
+            return _catalog
+
+        try:
+            tables = _fetch_tables()
+        except Exception as e:
+            # Serve the last known schema rather than failing the request on a Glue throttle
+            if _catalog["tables"] is not None:
+                config.logger.error(f"Metadata refresh failed, serving cached catalog: {str(e)}")
+                _catalog["checked_at"] = now
+                return _catalog
+            raise
+
+        update_times = {table["Name"]: str(table.get("UpdateTime") or table.get("CreateTime")) for table in tables}
+
+        if update_times != _catalog["update_times"]:
+            _build_catalog(tables, update_times)
+        else:
+            config.logger.info("Metadata catalog unchanged")
+
+        _catalog["checked_at"] = now
+        return _catalog
+
+
+def _fetch_table_samples(table_name, columns):
+    # Up to SCHEMA_INDEX_SAMPLE_VALUES distinct values of each string column. DISTINCT over all the
+    # columns together would count value combinations, so each column is sampled on its own, in one query.
+    string_columns = [col["Name"] for col in columns if col["Type"].lower().startswith(("string", "varchar", "char"))]
+    if not string_columns:
+        return {}
+
+    query = "\nUNION ALL\n".join(
+        f'SELECT {index} AS column_index, CAST(value AS varchar) AS value FROM '
+        f'(SELECT DISTINCT "{name}" AS value FROM "{table_name}" WHERE "{name}" IS NOT NULL LIMIT {config.SCHEMA_INDEX_SAMPLE_VALUES}) t{index}'
+        for index, name in enumerate(string_columns)
+    )
+    check = athena.syntax_checker(query)
+    if check.get("state") != "PASSED":
+        return {}
+
+    sample_values = {name: set() for name in string_columns}
+    for column_index, value in check["output"]["rows"]:
+        if value:
+            sample_values[string_columns[int(column_index)]].add(value)
+    return {name: sorted(values) for name, values in sample_values.items()}
+
+
+def get_sample_values(catalog):
+    # Sample column values make entity names (campaign names, cities, ...) searchable. They cost
+    # one Athena query per table, so they are opt-in and fetched once per schema version.
+    if not config.SCHEMA_INDEX_SAMPLE_VALUES:
+        return None
+
+    # Held while sampling, so concurrent requests wait for one set of queries instead of each
+    # running their own. A separate lock from _catalog_lock: the queries read the data version.
+    with _sample_values_lock:
+        if catalog["sample_values"] is None:
+            version, tables = catalog["version"], catalog["tables"]
+            sample_values = {}
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = {name: executor.submit(_fetch_table_samples, name, columns) for name, columns in tables.items()}
+                for name, future in futures.items():
+                    try:
+                        sample_values[name] = future.result()
+                    except Exception as e:
+                        config.logger.error(f"Sample values for {name} could not be fetched: {str(e)}")
+            with _catalog_lock:
+                # A rebuild while sampling resets the values for the new schema
+                if catalog["version"] == version:
+                    catalog["sample_values"] = sample_values
+            return sample_values
+
+        return catalog["sample_values"]
+
+
+@tracing.traced("metadata")
 def get_relevant_metadata(user_query):
 
     try:
-        # Get all tables in the database
-        response = config.glue_client.get_tables(DatabaseName=config.GLUE_DB_NAME)
-        tables = response.get("TableList", [])
-        
-        schema_details = {}
-
-        for table in tables:
-            table_name = table["Name"]
-            columns = table.get("StorageDescriptor", {}).get("Columns", [])
-
-            # Extract column details
-            schema_details[table_name] = [
-                {"Name": col["Name"], "Type": col["Type"]} for col in columns
-            ]
- 
-        config.logger.info(f"Metadata retrieved: {schema_details}")
-        
+        catalog = refresh_catalog()
+
+        schema_details = catalog["tables"]
+
+        # Prune large databases down to the tables relevant to the question (plus their join neighbors)
+        if user_query and len(schema_details) > config.SCHEMA_INDEX_TOP_K:
+            index = schema_index.get_index(catalog["version"], schema_details, get_sample_values(catalog))
+            selected = index.select(user_query, config.SCHEMA_INDEX_TOP_K, config.SCHEMA_INDEX_MAX_NEIGHBORS, config.SCHEMA_INDEX_SCORER)
+            schema_details = {name: schema_details[name] for name in selected}
+
+            config.logger.info(f"Schema pruned to {len(schema_details)} of {len(catalog['tables'])} tables: {selected}")
+
+        config.logger.debug(f"Metadata retrieved: {schema_details}")
+
         return schema_details
 
     except Exception as e:
@@ -29,4 +174,27 @@ def get_relevant_metadata(user_query):
         config.logger.error(errorMessage)
         raise Exception(errorMessage)
 
-    return schema_details
\ No newline at end of file
+
+def get_full_metadata():
+    # Every table in the catalog, regardless of the question (used to validate generated SQL)
+    return refresh_catalog()["tables"]
+
+
+def get_data_version():
+    # Changes whenever a crawler run updates any table, used to expire cached query results
+    update_times = refresh_catalog()["update_times"]
+    serialized = json.dumps(update_times, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+def get_schema_version():
+    # Stable fingerprint of the table/column layout, used to key caches on the schema
+    return refresh_catalog()["version"]
+
+
+def render_schema(schema_details):
+    # Join the pre-rendered lines for the requested tables, rendering only tables the catalog doesn't know
+    table_text = refresh_catalog()["table_text"]
+    return "\n".join(
+        table_text.get(name) or _render_table(name, columns) for name, columns in schema_details.items()
+    )
@@ -0,0 +1,170 @@
+import config
+import hashlib
+import json
+import poller
+import results
+
+#### REDSHIFT DATA API QUERY ENGINE ####
+
+# Runs generated SQL on Redshift (Serverless workgroup or provisioned cluster) through the Data API:
+# execute_statement, adaptive polling of describe_statement, then the paged get_statement_result.
+# Selected with QUERY_ENGINE=redshift; the schema catalog is then read from Redshift instead of Glue.
+
+TERMINAL_STATES = ('FINISHED', 'FAILED', 'ABORTED')
+
+# Redshift type names -> the Athena type names results.py understands
+TYPE_NAMES = {
+    "int2": "smallint", "int4": "integer", "int8": "bigint", "smallint": "smallint", "integer": "integer", "bigint": "bigint",
+    "float4": "real", "float8": "double", "real": "real", "double precision": "double",
+    "numeric": "decimal", "bool": "boolean", "boolean": "boolean",
+}
+
+CATALOG_QUERY = """
+SELECT table_name, column_name, data_type
+FROM svv_columns
+WHERE table_schema = :schema
+ORDER BY table_name, ordinal_position
+"""
+
+
+def _connection():
+    # Serverless workgroups and provisioned clusters are addressed differently; a secret is optional
+    # (without one the Lambda's IAM identity is used)
+    connection = {"Database": config.REDSHIFT_DATABASE}
+    if config.REDSHIFT_WORKGROUP:
+        connection["WorkgroupName"] = config.REDSHIFT_WORKGROUP
+    else:
+        connection["ClusterIdentifier"] = config.REDSHIFT_CLUSTER_ID
+    if config.REDSHIFT_SECRET_ARN:
+        connection["SecretArn"] = config.REDSHIFT_SECRET_ARN
+    return connection
+
+
+def _column_type(type_name):
+    base_type = type_name.split("(")[0].lower()
+    return TYPE_NAMES.get(base_type, "varchar")
+
+
+def _field_value(field):
+    if field.get("isNull"):
+        return None
+    for key in ("longValue", "doubleValue", "booleanValue", "stringValue"):
+        if key in field:
+            return field[key]
+    return None
+
+
+def run_statement(query, parameters=None, deadline=None, cancel_event=None):
+    # Start a statement and wait for it with adaptive polling, bounded by the invocation deadline.
+    # A statement that would outlive it (or is cancelled) is cancelled on Redshift too.
+    if deadline is None:
+        deadline = poller.get_request_deadline()
+
+    request = dict(_connection(), Sql=query)
+    if parameters:
+        request["Parameters"] = [{"name": name, "value": str(value)} for name, value in parameters.items()]
+
+    statement_id = config.redshift_data_client.execute_statement(**request)["Id"]
+    config.logger.info(f"Redshift statement ID: {statement_id}")
+
+    try:
+        statement, polls = poller.poll(
+            lambda: config.redshift_data_client.describe_statement(Id=statement_id),
+            lambda r: r['Status'] in TERMINAL_STATES,
+            deadline=deadline,
+            cancel_event=cancel_event,
+            initial_delay=config.REDSHIFT_POLL_INITIAL_DELAY_MS / 1000,
+            max_delay=config.REDSHIFT_POLL_MAX_DELAY_MS / 1000,
+        )
+    except (poller.PollTimeout, poller.PollCancelled) as e:
+        config.logger.error(f"Cancelling statement {statement_id}: {str(e)}")
+        config.redshift_data_client.cancel_statement(Id=statement_id)
+        raise
+
+    statistics = get_statistics(statement)
+    config.logger.info(f"Statement finished with status: {statement['Status']} after {polls} polls, statistics: {statistics}")
+    return statement, statistics
+
+
+def get_statistics(statement):
+    # Redshift reports the statement's elapsed time in nanoseconds; it has no queue/scan split
+    duration = statement.get('Duration')
+    return {
+        "engine_ms": round(duration / 1e6, 1) if duration and duration > 0 else None,
+        "queue_ms": None,
+        "bytes_scanned": None,
+        "result_rows": statement.get('ResultRows'),
+        "result_bytes": statement.get('ResultSize'),
+        "reused": False,
+    }
+
+
+def iter_statement_rows(statement_id, columns):
+    # Typed rows from the paged get_statement_result (following NextToken). columns is filled in
+    # from the first page's ColumnMetadata.
+    request = {"Id": statement_id}
+    while True:
+        page = config.redshift_data_client.get_statement_result(**request)
+        if not columns:
+            columns.extend({"name": col["name"], "type": _column_type(col.get("typeName", "varchar"))} for col in page.get("ColumnMetadata", []))
+        for record in page.get("Records", []):
+            # NUMERIC values arrive as strings
+            yield [results.cast_value(value, column["type"]) if isinstance(value, str) else value
+                   for value, column in zip(map(_field_value, record), columns)]
+        if not page.get("NextToken"):
+            return
+        request["NextToken"] = page["NextToken"]
+
+
+def read_results(statement, max_rows=None, max_bytes=None):
+    # Same shape as results.read_results, bounded by the same row/byte budget
+    columns = []
+    if not statement.get('HasResultSet', True):
+        return {"columns": columns, "rows": [], "row_count": 0, "truncated": False, "source": "redshift"}
+    rows, truncated = results.collect_rows(iter_statement_rows(statement['Id'], columns), max_rows, max_bytes)
+    return {
+        "columns": columns,
+        "rows": rows,
+        "row_count": len(rows),
+        "truncated": truncated,
+        "source": "redshift",
+    }
+
+
+def check_query(query, cancel_event=None):
+    # Same contract as athena._check_query: {"state": "PASSED"|"FAILED", "output", "statistics"}
+    try:
+        statement, statistics = run_statement(query, cancel_event=cancel_event)
+
+        if statement['Status'] == 'FINISHED':
+            result_data = read_results(statement)
+            config.logger.info(f"Read {result_data['row_count']} rows from Redshift (truncated: {result_data['truncated']})")
+            return {"state": "PASSED", "output": result_data, "statistics": statistics}
+
+        config.logger.error(f"Query failed syntax check")
+        return {"state": "FAILED", "output": statement.get('Error', statement['Status']), "statistics": statistics}
+
+    except Exception as e:
+        errorMessage = f"An error occurred checking the SQL query syntax: {str(e)}"
+        config.logger.error(errorMessage)
+        raise Exception(errorMessage)
+
+
+#### SCHEMA CATALOG ####
+
+def glue_tables():
+    # The tables of REDSHIFT_SCHEMA as a Glue get_tables TableList, so metadata.py can build its catalog
+    # the same way. Redshift has no UpdateTime, so each table's column layout stands in for it.
+    statement, _ = run_statement(CATALOG_QUERY, {"schema": config.REDSHIFT_SCHEMA})
+    if statement['Status'] != 'FINISHED':
+        raise Exception(f"Reading the Redshift catalog failed: {statement.get('Error', statement['Status'])}")
+
+    tables = {}
+    for table_name, column_name, data_type in iter_statement_rows(statement['Id'], []):
+        tables.setdefault(table_name, []).append({"Name": column_name, "Type": data_type})
+
+    return [{
+        "Name": name,
+        "UpdateTime": hashlib.sha256(json.dumps(columns).encode("utf-8")).hexdigest()[:16],
+        "StorageDescriptor": {"Columns": columns},
+    } for name, columns in tables.items()]
@@ -0,0 +1,132 @@
+import config
+import re
+import results
+
+#### LOCAL RESULT RENDERER ####
+
+# Most answers are a single value or a small grid, which the summarization call turns into a sentence
+# and a markdown table. Results within LOCAL_RENDER_MAX_ROWS x LOCAL_RENDER_MAX_COLUMNS are rendered
+# here instead, from the typed result set: the table, plus a templated summary built from column
+# stats (total, range, top entries). Larger or truncated results are still summarized by Bedrock.
+
+# Numeric columns that label rows rather than measure something (keys, ids, date parts). The name
+# must end in one of these words (amount_paid is a measure); "key" may also close a run-together
+# name, like the star schema's donorkey and datekey.
+IDENTIFIER_COLUMN = re.compile(r"(^|_)(id|key|year|month|day|quarter|week|code|number)$|key$")
+# Measures whose total is meaningless, so only their range is given. The word must stand alone
+# between underscores (generated_amount has no rate, admin_count no min); "avg" and "average" may
+# also open a run-together name, like avgdonation.
+NON_ADDITIVE_COLUMN = re.compile(r"(^|_)(avg|average|mean|rate|ratio|pct|percent|percentage|median|min|max)(_|$)|^(avg|average)")
+
+TOP_ENTRIES = 3
+
+
+def _is_numeric(column):
+    return column["type"].split("(")[0].lower() in results.NUMERIC_TYPES
+
+
+def _is_identifier(column):
+    return IDENTIFIER_COLUMN.search(column["name"].lower()) is not None
+
+
+def _label(name):
+    # total_donation_amount -> total donation amount
+    return re.sub(r"[_\s]+", " ", name).strip()
+
+
+def _has_fraction(column):
+    # double/real columns and decimals with a scale are shown with two decimals throughout, so
+    # whole values in them (which decimals are cast to ints as) line up with the rest
+    column_type = column["type"].lower().replace(" ", "")
+    base_type = column_type.split("(")[0]
+    if base_type in results.FLOAT_TYPES:
+        return True
+    return base_type == "decimal" and "," in column_type and not column_type.endswith(",0)")
+
+
+def format_value(value, column):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if not isinstance(value, (int, float)) or not _is_numeric(column):
+        return str(value)
+    if _is_identifier(column):
+        return str(value)
+    if isinstance(value, float) or _has_fraction(column):
+        return f"{value:,.2f}"
+    return f"{value:,}"
+
+
+def markdown_table(result_set):
+    columns = result_set["columns"]
+    lines = [
+        "| " + " | ".join(col["name"] for col in columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in result_set["rows"]:
+        cells = (format_value(value, column).replace("|", "\\|").replace("\n", " ") for value, column in zip(row, columns))
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def summary_sentence(result_set):
+    columns = result_set["columns"]
+    rows = result_set["rows"]
+
+    if not rows:
+        return "No matching results were found."
+
+    if len(columns) == 1 and len(rows) == 1:
+        column = columns[0]
+        return f"The {_label(column['name'])} is **{format_value(rows[0][0], column)}**."
+
+    if len(rows) == 1:
+        return "Here is the matching result:"
+
+    summary = [f"There are {len(rows)} results."]
+
+    # The first numeric column that is not a key or date part is the measure; the first other
+    # column names the rows
+    stats = results.column_stats(result_set)
+    measure = next((i for i, col in enumerate(columns) if _is_numeric(col) and not _is_identifier(col) and col["name"] in stats), None)
+    if measure is None:
+        return summary[0]
+    label = next((i for i, col in enumerate(columns) if i != measure and (not _is_numeric(col) or _is_identifier(col))), None)
+
+    column = columns[measure]
+    name = _label(column["name"])
+    values = {key: format_value(value, column) for key, value in stats[column["name"]].items()}
+    if NON_ADDITIVE_COLUMN.search(column["name"].lower()):
+        summary.append(f"The {name} ranges from {values['min']} to {values['max']}.")
+    else:
+        summary.append(f"The {name} adds up to **{values['sum']}**, ranging from {values['min']} to {values['max']}.")
+
+    if label is not None and len(rows) > TOP_ENTRIES:
+        ranked = sorted((row for row in rows if isinstance(row[measure], (int, float))), key=lambda row: row[measure], reverse=True)
+        top = ", ".join(f"{format_value(row[label], columns[label])} ({format_value(row[measure], column)})" for row in ranked[:TOP_ENTRIES])
+        summary.append(f"Highest {name}: {top}.")
+
+    return " ".join(summary)
+
+
+def exceeds_threshold(result_set):
+    # Reasons the result needs the summarization model, or None when it can be rendered here
+    if config.LOCAL_RENDER_MAX_ROWS <= 0:
+        return "local rendering is disabled"
+    if result_set["truncated"]:
+        return "the result was truncated"
+    if result_set["row_count"] > config.LOCAL_RENDER_MAX_ROWS:
+        return f"more than {config.LOCAL_RENDER_MAX_ROWS} rows"
+    if len(result_set["columns"]) > config.LOCAL_RENDER_MAX_COLUMNS:
+        return f"more than {config.LOCAL_RENDER_MAX_COLUMNS} columns"
+    return None
+
+
+def render(result_set):
+    # The answer for a result within the thresholds: a summary sentence and, unless the result is a
+    # single value (or empty), the table
+    sentence = summary_sentence(result_set)
+    if not result_set["rows"] or (len(result_set["columns"]) == 1 and len(result_set["rows"]) == 1):
+        return sentence
+    return f"{sentence}\n\n{markdown_table(result_set)}"
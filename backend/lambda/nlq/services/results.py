@@ -0,0 +1,169 @@
+import config
+import codecs
+import csv
+import itertools
+from decimal import Decimal, InvalidOperation
+
+#### ATHENA RESULT READER ####
+
+# Results are read as a stream of typed rows, bounded by a row and byte budget. The first
+# GetQueryResults page holds the whole result for most questions. When its NextToken shows there
+# is more, the rest is read straight from the CSV object Athena writes to S3, which avoids further
+# 1000-row round trips (or from further pages, when the output location is not known).
+
+# The most rows GetQueryResults returns per call
+RESULTS_PAGE_SIZE = 1000
+
+INTEGER_TYPES = {"tinyint", "smallint", "integer", "int", "bigint"}
+FLOAT_TYPES = {"double", "float", "real"}
+NUMERIC_TYPES = INTEGER_TYPES | FLOAT_TYPES | {"decimal"}
+
+
+def cast_value(value, column_type):
+    # Athena omits VarCharValue for NULLs; CSV output writes them as empty fields
+    if value is None:
+        return None
+    base_type = column_type.split("(")[0].lower()
+    if value == "" and base_type not in ("varchar", "char", "string"):
+        return None
+    try:
+        if base_type in INTEGER_TYPES:
+            return int(value)
+        if base_type in FLOAT_TYPES:
+            return float(value)
+        if base_type == "decimal":
+            number = Decimal(value)
+            return int(number) if number == number.to_integral_value() else float(number)
+        if base_type == "boolean":
+            return value.lower() == "true"
+    except (ValueError, InvalidOperation):
+        return value
+    # Strings, dates and timestamps stay as Athena renders them (ISO formats)
+    return value
+
+
+def _columns(result_set_metadata):
+    return [{"name": col["Name"], "type": col["Type"]} for col in result_set_metadata.get("ColumnInfo", [])]
+
+
+def _typed_rows(rows, columns):
+    for row in rows:
+        values = [col.get("VarCharValue") for col in row.get("Data", [])]
+        yield [cast_value(value, column["type"]) for value, column in zip(values, columns)]
+
+
+def iter_api_rows(execution_id, columns, next_token):
+    # Typed rows from the GetQueryResults pages that follow next_token (none of which has a header)
+    while next_token:
+        page = config.athena_client.get_query_results(QueryExecutionId=execution_id, MaxResults=RESULTS_PAGE_SIZE, NextToken=next_token)
+        yield from _typed_rows(page.get("ResultSet", {}).get("Rows", []), columns)
+        next_token = page.get("NextToken")
+
+
+def _split_s3_uri(uri):
+    bucket, _, key = uri.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+def iter_s3_rows(output_location, columns):
+    # Typed rows streamed from the CSV result object (header row first)
+    bucket, key = _split_s3_uri(output_location)
+    body = config.s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    lines = codecs.iterdecode(body.iter_lines(keepends=True), "utf-8")
+    reader = csv.reader(lines)
+    next(reader, None)
+    for row in reader:
+        yield [cast_value(value, column["type"]) for value, column in zip(row, columns)]
+
+
+def collect_rows(rows_iter, max_rows=None, max_bytes=None):
+    # Reads rows until the row/byte budget is used up; returns (rows, truncated)
+    max_rows = max_rows or config.ATHENA_RESULT_MAX_ROWS
+    max_bytes = max_bytes or config.ATHENA_RESULT_MAX_BYTES
+
+    rows, used_bytes = [], 0
+    for row in rows_iter:
+        used_bytes += sum(len(str(value)) for value in row if value is not None)
+        if len(rows) >= max_rows or used_bytes > max_bytes:
+            return rows, True
+        rows.append(row)
+    return rows, False
+
+
+def read_results(query_execution, max_rows=None, max_bytes=None):
+    # Returns {"columns", "rows", "row_count", "truncated", "source"}
+    execution_id = query_execution["QueryExecutionId"]
+    output_location = query_execution.get("ResultConfiguration", {}).get("OutputLocation")
+
+    first_page = config.athena_client.get_query_results(QueryExecutionId=execution_id, MaxResults=RESULTS_PAGE_SIZE)
+    result_set = first_page.get("ResultSet", {})
+    columns = _columns(result_set.get("ResultSetMetadata", {}))
+    # The first row of the first page is the header
+    first_rows = list(_typed_rows(result_set.get("Rows", [])[1:], columns))
+    next_token = first_page.get("NextToken")
+
+    if next_token and output_location:
+        # The CSV object holds every row, header first; the ones already read are skipped
+        rows_iter = itertools.chain(first_rows, itertools.islice(iter_s3_rows(output_location, columns), len(first_rows), None))
+        source = "s3"
+    else:
+        rows_iter = itertools.chain(first_rows, iter_api_rows(execution_id, columns, next_token))
+        source = "api"
+
+    rows, truncated = collect_rows(rows_iter, max_rows, max_bytes)
+
+    return {
+        "columns": columns,
+        "rows": rows,
+        "row_count": len(rows),
+        "truncated": truncated,
+        "source": source,
+    }
+
+
+#### RESULT SUMMARIES FOR THE MODEL ####
+
+def column_stats(result_set):
+    # Aggregates over every row that was read, per numeric column
+    stats = {}
+    for index, column in enumerate(result_set["columns"]):
+        if column["type"].split("(")[0].lower() not in NUMERIC_TYPES:
+            continue
+        values = [row[index] for row in result_set["rows"] if isinstance(row[index], (int, float))]
+        if not values:
+            continue
+        stats[column["name"]] = {
+            "sum": sum(values),
+            "min": min(values),
+            "max": max(values),
+            "avg": round(sum(values) / len(values), 4),
+        }
+    return stats
+
+
+def summarize_for_prompt(result_set, sample_rows=None):
+    # A bounded, typed view of the results: column types, a sample of rows and column aggregates
+    sample_rows = sample_rows or config.SUMMARY_SAMPLE_ROWS
+    columns = result_set["columns"]
+    rows = result_set["rows"]
+
+    lines = ["Columns: " + ", ".join(f"{col['name']} ({col['type']})" for col in columns)]
+
+    row_note = f"Rows: {result_set['row_count']}"
+    if result_set["truncated"]:
+        row_note += " (result was truncated, more rows exist)"
+    if len(rows) > sample_rows:
+        row_note += f", first {sample_rows} shown"
+    lines.append(row_note)
+
+    lines.append("| " + " | ".join(col["name"] for col in columns) + " |")
+    for row in rows[:sample_rows]:
+        lines.append("| " + " | ".join("" if value is None else str(value) for value in row) + " |")
+
+    stats = column_stats(result_set)
+    if stats and len(rows) > 1:
+        lines.append("Column aggregates over all rows read:")
+        for name, values in stats.items():
+            lines.append(f"- {name}: " + ", ".join(f"{key}={value}" for key, value in values.items()))
+
+    return "\n".join(lines)
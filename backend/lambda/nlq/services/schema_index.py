@@ -0,0 +1,172 @@
+import config
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+#### SCHEMA RETRIEVAL INDEX ####
+
+# Ranks tables against the user's question so large Glue databases only send the
+# relevant part of the schema to the model. The index is built once per schema version
+# from table names, column names and (optionally) sample column values.
+
+# Weight of a match depending on where the term was found
+FIELD_WEIGHTS = {"table": 3.0, "column": 1.5, "value": 1.0}
+
+# Partial matches (e.g. "campaign" inside "campaignkey") count for less than whole terms
+PARTIAL_MATCH_WEIGHT = 0.5
+
+EMBEDDING_DIMENSIONS = 512
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "did", "do", "does", "for", "from", "how", "in",
+    "is", "it", "me", "of", "on", "or", "show", "the", "to", "was", "were", "what", "which",
+    "who", "with", "give", "list", "many", "much", "tell", "all", "each", "per", "there",
+}
+
+
+def tokenize(text):
+    tokens = []
+    for token in re.split(r"[^a-z0-9]+", str(text).lower()):
+        if not token or token in STOPWORDS:
+            continue
+        # Light stemming so "donations" matches "donation"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def embed(text):
+    # Local hashed character-trigram embedding. No model download or network call is needed,
+    # and it still scores misspellings and compound identifiers ("donoramount") sensibly.
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for token in tokenize(text):
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % EMBEDDING_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def key_columns(columns):
+    # Surrogate key columns (campaignkey, donorkey, ...) are how the star schema joins
+    return {col["Name"].lower() for col in columns if col["Name"].lower().endswith("key")}
+
+
+class SchemaIndex:
+
+    def __init__(self, schema_details, sample_values=None):
+        sample_values = sample_values or {}
+
+        self.tables = list(schema_details)
+        self.postings = defaultdict(dict)  # term -> {table_name: weight}
+        self.embeddings = {}
+        self.keys = {}
+
+        for table_name, columns in schema_details.items():
+            terms = Counter()
+            for token in tokenize(table_name):
+                terms[token] += FIELD_WEIGHTS["table"]
+            for col in columns:
+                for token in tokenize(col["Name"]):
+                    terms[token] += FIELD_WEIGHTS["column"]
+            for values in sample_values.get(table_name, {}).values():
+                for value in values:
+                    for token in tokenize(value):
+                        terms[token] += FIELD_WEIGHTS["value"]
+
+            for term, weight in terms.items():
+                self.postings[term][table_name] = weight
+
+            document = " ".join([table_name] + [col["Name"] for col in columns])
+            self.embeddings[table_name] = embed(document)
+            self.keys[table_name] = key_columns(columns)
+
+        self.vocabulary = list(self.postings)
+        total = len(self.tables) or 1
+        self.idf = {term: math.log(1 + total / len(tables)) for term, tables in self.postings.items()}
+
+        # Tables that share a *key column can be joined together
+        self.neighbors = defaultdict(set)
+        for key in {key for keys in self.keys.values() for key in keys}:
+            sharing = [name for name, keys in self.keys.items() if key in keys]
+            for name in sharing:
+                self.neighbors[name].update(other for other in sharing if other != name)
+
+    def _matching_terms(self, token):
+        if token in self.postings:
+            yield token, 1.0
+        if len(token) < 4:
+            return
+        for term in self.vocabulary:
+            if term != token and token in term:
+                yield term, PARTIAL_MATCH_WEIGHT
+
+    def lexical_scores(self, question):
+        scores = Counter()
+        for token in set(tokenize(question)):
+            for term, match_weight in self._matching_terms(token):
+                idf = self.idf[term]
+                for table_name, weight in self.postings[term].items():
+                    scores[table_name] += idf * weight * match_weight
+        return scores
+
+    def embedding_scores(self, question):
+        query_vector = embed(question)
+        return Counter({name: _cosine(query_vector, vector) for name, vector in self.embeddings.items()})
+
+    def score(self, question, scorer="lexical"):
+        if scorer == "embedding":
+            return self.embedding_scores(question)
+
+        scores = self.lexical_scores(question)
+        if scorer == "hybrid":
+            top = max(scores.values(), default=0.0) or 1.0
+            for name, similarity in self.embedding_scores(question).items():
+                scores[name] = scores[name] / top + similarity
+        return scores
+
+    def select(self, question, top_k, max_neighbors, scorer="lexical"):
+        scores = self.score(question, scorer)
+        ranked = [name for name, score in scores.most_common() if score > 0]
+
+        if not ranked:
+            # Nothing in the question matched the schema, fall back to the whole catalog
+            config.logger.info("Schema index found no relevant tables, using full schema")
+            return list(self.tables)
+
+        selected = ranked[:top_k]
+
+        # Add the best scoring join neighbors of each selected table so the model can write the joins
+        for table_name in list(selected):
+            candidates = sorted(
+                (name for name in self.neighbors[table_name] if name not in selected),
+                key=lambda name: (-scores.get(name, 0.0), -len(self.keys[name] & self.keys[table_name]), name),
+            )
+            selected.extend(candidates[:max_neighbors])
+
+        # Preserve catalog order so the rendered prompt is stable for a given selection
+        return [name for name in self.tables if name in selected]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(schema_version, schema_details, sample_values=None):
+    # One index per schema version; older versions are dropped when the catalog changes
+    with _indexes_lock:
+        index = _indexes.get(schema_version)
+        if index is None:
+            index = SchemaIndex(schema_details, sample_values)
+            _indexes.clear()
+            _indexes[schema_version] = index
+            config.logger.info(f"Schema index built for version {schema_version} ({len(index.vocabulary)} terms)")
+        return index
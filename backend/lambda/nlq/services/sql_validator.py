@@ -0,0 +1,383 @@
+import re
+
+#### LOCAL SQL VALIDATION ####
+
+# Pre-validates generated SQL before it is sent to Athena. This is a lightweight
+# Presto/Trino (Athena engine v3) tokenizer plus a structural pass that resolves
+# table and column references against the cached Glue schema. It is deliberately
+# lenient: anything it cannot resolve with certainty is left for Athena to judge,
+# so valid queries are never rejected locally. The few Redshift forms the model
+# produces when QUERY_ENGINE is redshift (:: casts, TOP, ILIKE) are accepted too.
+
+KEYWORDS = {
+    "all", "and", "any", "array", "as", "asc", "at", "between", "bigint", "boolean", "both", "by", "case",
+    "cast", "char", "cross", "cube", "current", "current_date", "current_time", "current_timestamp", "date",
+    "day", "decimal", "desc", "distinct", "double", "dow", "doy", "else", "end", "escape", "except", "exists",
+    "extract", "false", "fetch", "filter", "first", "following", "for", "from", "full", "group", "grouping",
+    "having", "hour", "if", "ignore", "ilike", "in", "inner", "int", "integer", "intersect", "interval", "into", "ipaddress",
+    "is", "join", "json", "last", "lateral", "leading", "left", "like", "limit", "localtime", "localtimestamp",
+    "map", "millisecond", "minute", "month", "natural", "next", "not", "null", "nulls", "offset", "on", "only",
+    "or", "order", "ordinality", "outer", "over", "partition", "position", "preceding", "precision", "quarter",
+    "range", "real", "recursive", "respect", "right", "rollup", "row", "rows", "second", "select", "sets",
+    "similar", "smallint", "some", "string", "substring", "tablesample", "then", "ties", "time", "timestamp",
+    "tinyint", "to", "top", "trailing", "trim", "true", "try_cast", "unbounded", "union", "unnest", "using", "uuid",
+    "values", "varbinary", "varchar", "week", "when", "where", "window", "with", "within", "year", "year_of_week",
+    "zone",
+}
+
+# Keywords that take a parenthesized argument list like a function (FROM inside them is not a table source)
+FUNCTION_KEYWORDS = {"cast", "try_cast", "extract", "position", "substring", "trim", "array", "map", "row", "filter", "over", "within"}
+
+READ_ONLY_STARTS = {"select", "with", "values"}
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<line_comment>--[^\n]*)
+  | (?P<block_comment>/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<bident>`[^`]*`)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||->|=>|[-+*/%=<>])
+  | (?P<punct>[(),.;\[\]])
+""", re.VERBOSE | re.DOTALL)
+
+
+class Token:
+    __slots__ = ("kind", "text", "value", "position")
+
+    def __init__(self, kind, text, position):
+        self.kind = kind
+        self.text = text
+        self.position = position
+        if kind == "ident":
+            self.value = text.lower()
+        elif kind in ("qident", "bident"):
+            # Athena identifiers are case-insensitive even when quoted
+            self.value = text[1:-1].replace('""', '"').lower()
+            self.kind = "ident"
+        else:
+            self.value = text
+
+    @property
+    def is_keyword(self):
+        return self.kind == "ident" and self.text[0] not in '"`' and self.value in KEYWORDS
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r})"
+
+
+class SqlValidationError(Exception):
+
+    def __init__(self, code, message, position=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.position = position
+
+
+def _error(code, message, position=None):
+    return {"code": code, "message": message, "position": position}
+
+
+def tokenize(sql):
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = _TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            char = sql[position]
+            if char == "'":
+                raise SqlValidationError("UNTERMINATED_STRING", "String literal is not closed", position)
+            if char in '"`':
+                raise SqlValidationError("UNTERMINATED_IDENTIFIER", "Quoted identifier is not closed", position)
+            if sql.startswith("/*", position):
+                raise SqlValidationError("UNTERMINATED_COMMENT", "Block comment is not closed", position)
+            raise SqlValidationError("UNEXPECTED_CHARACTER", f"Unexpected character '{char}'", position)
+
+        kind = match.lastgroup
+        if kind not in ("space", "line_comment", "block_comment"):
+            tokens.append(Token(kind, match.group(), position))
+        position = match.end()
+    return tokens
+
+
+def _check_structure(tokens):
+    errors = []
+
+    depth = 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+            if depth < 0:
+                errors.append(_error("UNBALANCED_PARENTHESES", "Closing parenthesis without a matching opening parenthesis", token.position))
+                depth = 0
+    if depth > 0:
+        errors.append(_error("UNBALANCED_PARENTHESES", f"{depth} opening parenthesis not closed"))
+
+    # Only a single statement may be sent; a trailing semicolon is fine
+    for i, token in enumerate(tokens):
+        if token.text == ";" and i < len(tokens) - 1:
+            errors.append(_error("MULTIPLE_STATEMENTS", "Only a single SQL statement is allowed", token.position))
+            break
+
+    first = next((token for token in tokens if token.text != "("), None)
+    if first is None or first.value not in READ_ONLY_STARTS:
+        errors.append(_error("NOT_A_QUERY", "The statement must be a read-only SELECT or WITH query", first.position if first else None))
+
+    # Common structural slips that Athena would reject with a cryptic message
+    for previous, token in zip(tokens, tokens[1:]):
+        if previous.text == "," and token.value in ("from", "where", "group", "order", "having", "limit") and token.is_keyword:
+            errors.append(_error("TRAILING_COMMA", f"Unexpected ',' before {token.value.upper()}", previous.position))
+
+    return errors
+
+
+def _cte_names(tokens):
+    # Names defined by WITH name [(columns)] AS (...) at any nesting level
+    names = set()
+    for i, token in enumerate(tokens):
+        if token.value != "with" or not token.is_keyword:
+            continue
+        j = i + 1
+        if j < len(tokens) and tokens[j].value == "recursive":
+            j += 1
+        while j < len(tokens) and tokens[j].kind == "ident":
+            names.add(tokens[j].value)
+            j += 1
+            if j < len(tokens) and tokens[j].text == "(":
+                j = _skip_parentheses(tokens, j)
+            if j < len(tokens) and tokens[j].value == "as":
+                j += 1
+            if j < len(tokens) and tokens[j].text == "(":
+                j = _skip_parentheses(tokens, j)
+            if j < len(tokens) and tokens[j].text == ",":
+                j += 1
+                continue
+            break
+    return names
+
+
+def _expression_depths(tokens):
+    # For each token, whether its innermost enclosing parenthesis is a function/expression call
+    # (as opposed to a subquery or parenthesized join), e.g. the FROM in EXTRACT(year FROM d)
+    inside_expression = []
+    stack = []
+    for i, token in enumerate(tokens):
+        inside_expression.append(bool(stack) and stack[-1])
+        if token.text == "(":
+            previous = tokens[i - 1] if i > 0 else None
+            is_call = previous is not None and previous.kind == "ident" and (not previous.is_keyword or previous.value in FUNCTION_KEYWORDS)
+            stack.append(is_call)
+        elif token.text == ")" and stack:
+            stack.pop()
+    return inside_expression
+
+
+def _skip_parentheses(tokens, start):
+    # Returns the index just past the parenthesis group that opens at start
+    depth = 0
+    for j in range(start, len(tokens)):
+        if tokens[j].text == "(":
+            depth += 1
+        elif tokens[j].text == ")":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(tokens)
+
+
+def table_references(tokens):
+    # Returns (table_name, alias, position, is_base_table, alias_position) for each FROM/JOIN source
+    references = []
+    inside_expression = _expression_depths(tokens)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if not (token.is_keyword and token.value in ("from", "join")) or inside_expression[i]:
+            i += 1
+            continue
+        if token.value == "from" and i > 0 and tokens[i - 1].value == "distinct":
+            # a IS [NOT] DISTINCT FROM b
+            i += 1
+            continue
+
+        i += 1
+        while i < len(tokens):
+            start = tokens[i]
+
+            if start.text == "(":
+                # Derived table: its columns are unknown here, but its alias must be recorded
+                i = _skip_parentheses(tokens, i)
+                alias, alias_position, i = _read_alias(tokens, i)
+                references.append((None, alias, start.position, False, alias_position))
+            elif start.value in ("unnest", "lateral") and start.is_keyword:
+                i += 1
+                if i < len(tokens) and tokens[i].text == "(":
+                    i = _skip_parentheses(tokens, i)
+                if i < len(tokens) and tokens[i].value == "with":
+                    i += 2
+                alias, alias_position, i = _read_alias(tokens, i)
+                references.append((None, alias, start.position, False, alias_position))
+            elif start.kind == "ident" and not start.is_keyword:
+                # Possibly qualified: catalog.database.table
+                parts = [start.value]
+                i += 1
+                while i + 1 < len(tokens) and tokens[i].text == "." and tokens[i + 1].kind == "ident":
+                    parts.append(tokens[i + 1].value)
+                    i += 2
+                if i < len(tokens) and tokens[i].text == "(":
+                    # Table function
+                    i = _skip_parentheses(tokens, i)
+                    alias, alias_position, i = _read_alias(tokens, i)
+                    references.append((None, alias, start.position, False, alias_position))
+                else:
+                    alias, alias_position, i = _read_alias(tokens, i)
+                    references.append((parts[-1], alias, start.position, True, alias_position))
+            else:
+                break
+
+            # Comma separated sources in the same FROM clause
+            if i < len(tokens) and tokens[i].text == ",":
+                i += 1
+                continue
+            break
+    return references
+
+
+def _read_alias(tokens, i):
+    # (alias, position of the alias token, index past it); alias and position are None without one
+    if i < len(tokens) and tokens[i].value == "as" and tokens[i].is_keyword:
+        i += 1
+    if i < len(tokens) and tokens[i].kind == "ident" and not tokens[i].is_keyword:
+        alias, position = tokens[i].value, tokens[i].position
+        i += 1
+        # Optional column alias list: t (a, b)
+        if i < len(tokens) and tokens[i].text == "(":
+            i = _skip_parentheses(tokens, i)
+        return alias, position, i
+    return None, None, i
+
+
+def _declared_names(tokens):
+    # Output column aliases (explicit "AS name" and implicit "expr name"), lambda parameters
+    # and CTE column lists: identifiers the query defines itself
+    declared = set()
+    for i, token in enumerate(tokens):
+        # Parameters of a multi-argument lambda: (s, x) -> s + x
+        if token.text == "->" and i > 0 and tokens[i - 1].text == ")":
+            j = i - 2
+            while j >= 0 and tokens[j].text != "(":
+                if tokens[j].kind == "ident":
+                    declared.add(tokens[j].value)
+                j -= 1
+        if token.kind != "ident" or token.is_keyword:
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if previous is None:
+            continue
+        if previous.is_keyword and previous.value in ("as", "over", "window"):
+            declared.add(token.value)
+        elif previous.text == ")" or previous.kind in ("string", "number") or (previous.kind == "ident" and not previous.is_keyword):
+            declared.add(token.value)
+        elif following is not None and following.text == "->":
+            declared.add(token.value)
+    return declared
+
+
+def validate_sql(query, schema_details):
+    # Returns {"valid": bool, "errors": [{"code", "message", "position"}]}
+    try:
+        tokens = tokenize(query or "")
+    except SqlValidationError as e:
+        return {"valid": False, "errors": [_error(e.code, e.message, e.position)]}
+
+    if not tokens:
+        return {"valid": False, "errors": [_error("EMPTY_QUERY", "The query is empty")]}
+
+    errors = _check_structure(tokens)
+    if any(error["code"] == "NOT_A_QUERY" for error in errors):
+        return {"valid": False, "errors": errors}
+
+    tables = {name.lower(): {col["Name"].lower() for col in columns} for name, columns in schema_details.items()}
+    ctes = _cte_names(tokens)
+    references = table_references(tokens)
+
+    aliases = {}           # alias or table name -> base table name (None when columns are unknown)
+    open_sources = False   # True when a CTE, subquery or table function supplies columns
+    referenced_columns = set()
+
+    for table_name, alias, position, is_base, _ in references:
+        if is_base and table_name in ctes:
+            open_sources = True
+            aliases[table_name] = None
+            if alias:
+                aliases[alias] = None
+            continue
+        if is_base:
+            if table_name not in tables:
+                errors.append(_error("TABLE_NOT_FOUND", f"Table '{table_name}' does not exist. Available tables: {', '.join(sorted(tables))}", position))
+                open_sources = True
+                aliases[table_name] = None
+                if alias:
+                    aliases[alias] = None
+                continue
+            aliases[table_name] = table_name
+            if alias:
+                aliases[alias] = table_name
+            referenced_columns |= tables[table_name]
+        else:
+            open_sources = True
+            if alias:
+                aliases[alias] = None
+
+    declared = _declared_names(tokens) | ctes | set(aliases)
+
+    for i, token in enumerate(tokens):
+        if token.kind != "ident" or token.is_keyword:
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        # Function calls and parts of dotted names are handled separately
+        if following is not None and following.text == "(":
+            continue
+        if previous is not None and previous.text == ".":
+            continue
+
+        if following is not None and following.text == "." and i + 2 < len(tokens):
+            column = tokens[i + 2]
+            if token.value in aliases:
+                base = aliases[token.value]
+                if base is not None and column.kind == "ident" and column.value not in tables[base]:
+                    errors.append(_error("COLUMN_NOT_FOUND", f"Column '{column.value}' does not exist in table '{base}'. Available columns: {', '.join(sorted(tables[base]))}", column.position))
+            elif token.value not in tables and not open_sources and not (i + 3 < len(tokens) and tokens[i + 3].text == "."):
+                # Qualified by something that is neither a table nor an alias in this query
+                errors.append(_error("UNKNOWN_ALIAS", f"'{token.value}' is not a table or alias referenced in the FROM clause", token.position))
+            continue
+
+        # Unqualified column: only checked when every source has known columns
+        if open_sources or not references:
+            continue
+        if token.value in referenced_columns or token.value in declared or token.value in tables:
+            continue
+        errors.append(_error("COLUMN_NOT_FOUND", f"Column '{token.value}' does not exist in the referenced tables", token.position))
+
+    # Report each problem once
+    unique, seen = [], set()
+    for error in errors:
+        key = (error["code"], error["message"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(error)
+
+    return {"valid": not unique, "errors": unique}
+
+
+def format_errors(errors):
+    # Human readable form for the retry prompt
+    return "; ".join(f"{error['code']}: {error['message']}" for error in errors)
@@ -0,0 +1,14 @@
+import math
+import re
+
+#### TOKEN ESTIMATION ####
+
+# Rough model-agnostic token count: punctuation is one token each and words are split
+# into ~4 character pieces, which tracks Claude/Titan tokenizers closely enough for budgeting.
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECES.findall(str(text)))
@@ -0,0 +1,162 @@
+import config
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+#### REQUEST TRACING ####
+
+# Each invocation records a flat list of timed spans (metadata fetch, history read/write, Bedrock
+# calls, Athena queries...) with attributes such as token usage and bytes scanned. At the end of the
+# request the spans are aggregated per stage and written as CloudWatch Embedded Metric Format log
+# lines, and can be returned to the caller as Server-Timing and debug headers.
+#
+# Like the request deadline in poller.py, the current trace is module-level rather than a context
+# variable, so spans recorded on worker threads (SQL candidates, the async pipeline) are included.
+
+# Span attributes published as metrics, with their CloudWatch units
+METRIC_UNITS = {
+    "duration_ms": "Milliseconds",
+    "input_tokens": "Count",
+    "output_tokens": "Count",
+    "cache_read_tokens": "Count",
+    "cache_write_tokens": "Count",
+    "model_latency_ms": "Milliseconds",
+    "queue_ms": "Milliseconds",
+    "engine_ms": "Milliseconds",
+    "bytes_scanned": "Bytes",
+    "rows": "Count",
+}
+
+
+class Trace:
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration_ms, attributes):
+        span = {
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round(duration_ms, 1),
+        }
+        span.update({key: value for key, value in attributes.items() if value is not None})
+        with self._lock:
+            self.spans.append(span)
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def stage_totals(self):
+        # {stage: {"calls": n, <metric>: sum, ...}} in order of first appearance
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = totals.setdefault(span["name"], {"calls": 0})
+            stage["calls"] += 1
+            for key in METRIC_UNITS:
+                value = span.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[key] = round(stage.get(key, 0) + value, 1)
+        return totals
+
+
+_current = Trace()
+
+
+def start_request(request_id=None):
+    global _current
+    _current = Trace(request_id)
+    return _current
+
+
+def current():
+    return _current
+
+
+@contextmanager
+def span(name, **attributes):
+    # Times the block. The yielded dict can be filled in along the way (token usage, bytes scanned...);
+    # a failing block is recorded with the exception type.
+    trace = _current
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace.add(name, start, (time.perf_counter() - start) * 1000, attributes)
+
+
+def traced(name):
+    # Decorator form of span() for functions whose whole call is one stage
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+#### OUTPUT ####
+
+def emit_metrics(trace=None):
+    # One EMF document per stage, dimensioned by stage, plus the end-to-end request duration.
+    # Lambda ships stdout to CloudWatch Logs, which extracts the metrics.
+    if not config.METRICS_ENABLED:
+        return
+    trace = trace or _current
+    timestamp = int(time.time() * 1000)
+
+    stages = trace.stage_totals()
+    stages["request"] = {"calls": 1, "duration_ms": trace.elapsed_ms()}
+
+    for stage, values in stages.items():
+        metrics = [{"Name": key, "Unit": METRIC_UNITS[key]} for key in METRIC_UNITS if key in values]
+        metrics.append({"Name": "calls", "Unit": "Count"})
+        document = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [{
+                    "Namespace": config.METRICS_NAMESPACE,
+                    "Dimensions": [["Stage"]],
+                    "Metrics": metrics,
+                }],
+            },
+            "Stage": stage,
+            "RequestId": trace.request_id,
+        }
+        document.update(values)
+        print(json.dumps(document), flush=True)
+
+
+def server_timing(trace=None):
+    # Server-Timing header value: total time per stage, e.g. "metadata;dur=12.5, bedrock;dur=812.0"
+    trace = trace or _current
+    entries = [f"{stage};dur={values.get('duration_ms', 0)}" for stage, values in trace.stage_totals().items()]
+    entries.append(f"total;dur={trace.elapsed_ms()}")
+    return ", ".join(entries)
+
+
+def debug_summary(trace=None, max_bytes=None):
+    # Compact JSON of every span for the debug header; the latest spans are dropped to fit max_bytes
+    trace = trace or _current
+    max_bytes = max_bytes or config.TRACE_HEADER_MAX_BYTES
+    with trace._lock:
+        spans = list(trace.spans)
+    spans.sort(key=lambda span: span["start_ms"])
+
+    summary = {"request_id": trace.request_id, "total_ms": trace.elapsed_ms(), "spans": spans}
+    text = json.dumps(summary, separators=(",", ":"), default=str)
+    while len(text) > max_bytes and summary["spans"]:
+        summary["spans"] = summary["spans"][:-1]
+        summary["truncated"] = True
+        text = json.dumps(summary, separators=(",", ":"), default=str)
+    return text
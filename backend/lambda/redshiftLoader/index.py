@@ -1,56 +1,217 @@
 import boto3
+import json
 import os
-import cfnresponse
 import time
+from concurrent.futures import ThreadPoolExecutor
+import cfnresponse
+import poller
+
+#### TABLES ####
+
+# Columns, distribution/sort keys and the default source (in the sample data bucket) of each table
+TABLES = {
+  "DonationFact": {
+    "columns": "DonationKey BIGINT PRIMARY KEY, DonorKey INTEGER NOT NULL, CampaignKey INTEGER NOT NULL, EventKey INTEGER, DateKey INTEGER NOT NULL, DonationAmount DECIMAL(10,2) NOT NULL, PaymentMethodKey INTEGER NOT NULL",
+    "attributes": "DISTKEY(DateKey) SORTKEY(DateKey, CampaignKey)",
+    "source": "donations/DonationFact.csv",
+  },
+  "DonorDim": {
+    "columns": "DonorKey INTEGER PRIMARY KEY, DonorID VARCHAR(10) NOT NULL, FirstName VARCHAR(50) NOT NULL, LastName VARCHAR(50) NOT NULL, Email VARCHAR(100), Phone VARCHAR(20), Address VARCHAR(200), JoinDate VARCHAR(100) NOT NULL, DonorStatus VARCHAR(100) NOT NULL",
+    "attributes": "DISTSTYLE ALL",
+    "source": "donors/DonorDim.csv",
+  },
+  "CampaignDim": {
+    "columns": "CampaignKey INTEGER PRIMARY KEY, CampaignID VARCHAR(10) NOT NULL, CampaignName VARCHAR(100) NOT NULL, StartDate VARCHAR(100) NOT NULL, EndDate VARCHAR(100) NOT NULL, CampaignType VARCHAR(200) NOT NULL, TargetAmount DECIMAL(12,2) NOT NULL",
+    "attributes": "DISTSTYLE ALL",
+    "source": "campaigns/CampaignDim.csv",
+  },
+  "EventDim": {
+    "columns": "EventKey INTEGER PRIMARY KEY, EventID VARCHAR(10) NOT NULL, EventName VARCHAR(100) NOT NULL, EventDate VARCHAR(100) NOT NULL, EventLocation VARCHAR(100) NOT NULL, EventType VARCHAR(200) NOT NULL",
+    "attributes": "DISTSTYLE ALL",
+    "source": "events/EventDim.csv",
+  },
+  "DateDim": {
+    "columns": "DateKey INTEGER PRIMARY KEY, Date VARCHAR(100) NOT NULL, Day INTEGER NOT NULL, Month INTEGER NOT NULL, Year INTEGER NOT NULL, Quarter INTEGER NOT NULL, IsHoliday BOOLEAN NOT NULL",
+    "attributes": "DISTSTYLE ALL SORTKEY(Date)",
+    "source": "date/DateDim.csv",
+  },
+  "PaymentMethodDim": {
+    "columns": "PaymentMethodKey INTEGER PRIMARY KEY, PaymentMethodName VARCHAR(50) NOT NULL",
+    "attributes": "DISTSTYLE ALL",
+    "source": "payment/PaymentMethodDim.csv",
+  },
+}
+
+# COPY options per source format, and the compressions COPY can read CSV in
+FORMAT_OPTIONS = {"csv": "CSV IGNOREHEADER 1", "parquet": "FORMAT AS PARQUET"}
+COMPRESSIONS = {"gzip": "GZIP", "bzip2": "BZIP2", "zstd": "ZSTD", "lzop": "LZOP"}
+
+# Number of tables loaded at the same time
+LOAD_CONCURRENCY = int(os.environ.get('LOAD_CONCURRENCY', '6'))
+
+client = boto3.client('redshift-data')
+s3 = boto3.client('s3')
+
+
+#### SOURCES ####
+
+def source_specs(properties):
+  # Every table loads from the sample data bucket as CSV unless the custom resource's Sources
+  # property overrides it, e.g. {"DonationFact": {"uri": "s3://bucket/donations/", "format": "parquet"}}.
+  # uri is an S3 prefix, or a manifest file with "manifest": true; "compression" applies to CSV.
+  overrides = properties.get('Sources') or {}
+  if isinstance(overrides, str):
+    overrides = json.loads(overrides)
+
+  specs = {}
+  for name, table in TABLES.items():
+    spec = {"uri": f"s3://{os.environ['BUCKET_NAME']}/{table['source']}", "format": "csv", "manifest": False, "compression": None}
+    spec.update(overrides.get(name) or {})
+    # CloudFormation passes property values as strings
+    spec["manifest"] = str(spec["manifest"]).lower() == "true"
+    spec["format"] = spec["format"].lower()
+    if spec["format"] not in FORMAT_OPTIONS:
+      raise ValueError(f"{name}: unsupported format {spec['format']!r}")
+    if spec["compression"] and (spec["format"] != "csv" or spec["compression"].lower() not in COMPRESSIONS):
+      raise ValueError(f"{name}: unsupported compression {spec['compression']!r} for {spec['format']}")
+    specs[name] = spec
+  return specs
+
+
+def copy_statement(target, spec):
+  options = [FORMAT_OPTIONS[spec["format"]]]
+  if spec["compression"]:
+    options.append(COMPRESSIONS[spec["compression"].lower()])
+  if spec["manifest"]:
+    options.append("MANIFEST")
+  return f"COPY {target} FROM '{spec['uri']}' IAM_ROLE '{os.environ['IAM_ROLE']}' {' '.join(options)};"
+
+
+def _split_s3_uri(uri):
+  bucket, _, key = uri.replace("s3://", "", 1).partition("/")
+  return bucket, key
+
+
+def source_bytes(spec):
+  # Size of the files COPY reads: the manifest's entries, or every object under the prefix
+  try:
+    bucket, key = _split_s3_uri(spec["uri"])
+    if spec["manifest"]:
+      manifest = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+      total = 0
+      for entry in manifest.get("entries", []):
+        length = entry.get("meta", {}).get("content_length")
+        if length is None:
+          entry_bucket, entry_key = _split_s3_uri(entry["url"])
+          length = s3.head_object(Bucket=entry_bucket, Key=entry_key)["ContentLength"]
+        total += length
+      return total
+
+    total = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key):
+      total += sum(item["Size"] for item in page.get("Contents", []))
+    return total
+  except Exception as e:
+    print(f"Could not size source {spec['uri']}: {str(e)}")
+    return None
+
+
+#### STATEMENTS ####
+
+def run_batch(sqls, deadline):
+  # Runs the statements as one batch (a single transaction) and waits for it with backoff.
+  # Returns the finished describe_statement response, whose SubStatements hold each statement's rows.
+  response = client.batch_execute_statement(
+    WorkgroupName=os.environ['WORKGROUP_NAME'],
+    Database=os.environ['DATABASE_NAME'],
+    Sqls=sqls
+  )
+  statement_id = response['Id']
+
+  try:
+    status_response, polls = poller.poll(
+      lambda: client.describe_statement(Id=statement_id),
+      lambda r: r['Status'] in ['FINISHED', 'FAILED', 'ABORTED'],
+      deadline=deadline,
+      initial_delay=0.1,
+      max_delay=5.0
+    )
+  except poller.PollTimeout:
+    client.cancel_statement(Id=statement_id)
+    raise Exception(f"Statement {statement_id} did not finish before the Lambda timeout and was cancelled")
+
+  status = status_response['Status']
+  print(f"Statement {statement_id} status: {status} after {polls} polls, duration {status_response.get('Duration', 0) / 1e9:.2f}s")
+  if status != 'FINISHED':
+    raise Exception(f"Statement {statement_id} failed with status {status}: {status_response.get('Error')}")
+  return status_response
+
+
+def create_tables(deadline):
+  # All DDL in one batch; existing tables are kept, so Create and Update both work
+  run_batch([f"CREATE TABLE IF NOT EXISTS {name} ({table['columns']}) {table['attributes']};" for name, table in TABLES.items()], deadline)
+
+
+def load_table(name, spec, deadline):
+  # Loads into a staging copy and swaps it in within the same transaction. Readers keep seeing the
+  # old rows until the swap commits, and a failed COPY leaves the live table untouched.
+  table = TABLES[name]
+  staging, previous = f"{name}_staging", f"{name}_previous"
+  sqls = [
+    f"DROP TABLE IF EXISTS {staging};",
+    f"CREATE TABLE {staging} ({table['columns']}) {table['attributes']};",
+    copy_statement(staging, spec),
+    f"DROP TABLE IF EXISTS {previous};",
+    f"ALTER TABLE {name} RENAME TO {previous};",
+    f"ALTER TABLE {staging} RENAME TO {name};",
+    f"DROP TABLE {previous};",
+  ]
+  print(f"Loading {name} from {spec['uri']}: {sqls[2]}")
+
+  start = time.monotonic()
+  status_response = run_batch(sqls, deadline)
+  seconds = time.monotonic() - start
+
+  copy = status_response.get('SubStatements', [])[2:3]
+  rows = copy[0].get('ResultRows') if copy else None
+  return {"table": name, "rows": rows, "bytes": source_bytes(spec), "seconds": seconds}
+
+
+def report_throughput(loads, seconds):
+  # Per table and overall rows/s and MB/s; the overall rate is against wall-clock time, so it shows
+  # the gain from loading concurrently
+  for load in loads:
+    rows, megabytes, elapsed = load["rows"] or 0, (load["bytes"] or 0) / 1e6, max(load["seconds"], 1e-3)
+    print(f"{load['table']}: {rows} rows, {megabytes:.1f} MB in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s, {megabytes / elapsed:.2f} MB/s)")
+
+  rows = sum(load["rows"] or 0 for load in loads)
+  megabytes = sum(load["bytes"] or 0 for load in loads) / 1e6
+  seconds = max(seconds, 1e-3)
+  print(f"Loaded {rows} rows, {megabytes:.1f} MB in {seconds:.1f}s ({rows / seconds:.0f} rows/s, {megabytes / seconds:.2f} MB/s); "
+        f"one at a time the loads would take {sum(load['seconds'] for load in loads):.1f}s")
+  return {"RowsLoaded": str(rows), "MegabytesLoaded": f"{megabytes:.1f}", "Seconds": f"{seconds:.1f}"}
+
 
 def lambda_handler(event, context):
-  client = boto3.client('redshift-data')
   print("EVENT DATA: ", event)
   request = event.get('RequestType')
   print("REQUEST TYPE: ", request)
   response_data = {}
-  sql_statements = [
-      "CREATE TABLE DonationFact (DonationKey BIGINT PRIMARY KEY, DonorKey INTEGER NOT NULL, CampaignKey INTEGER NOT NULL, EventKey INTEGER, DateKey INTEGER NOT NULL, DonationAmount DECIMAL(10,2) NOT NULL, PaymentMethodKey INTEGER NOT NULL) DISTKEY(DateKey) SORTKEY(DateKey, CampaignKey);",
-      "CREATE TABLE DonorDim (DonorKey INTEGER PRIMARY KEY, DonorID VARCHAR(10) NOT NULL, FirstName VARCHAR(50) NOT NULL, LastName VARCHAR(50) NOT NULL, Email VARCHAR(100), Phone VARCHAR(20), Address VARCHAR(200), JoinDate VARCHAR(100) NOT NULL, DonorStatus VARCHAR(100) NOT NULL) DISTSTYLE ALL;",
-      "CREATE TABLE CampaignDim (CampaignKey INTEGER PRIMARY KEY, CampaignID VARCHAR(10) NOT NULL, CampaignName VARCHAR(100) NOT NULL, StartDate VARCHAR(100) NOT NULL, EndDate VARCHAR(100) NOT NULL, CampaignType VARCHAR(200) NOT NULL, TargetAmount DECIMAL(12,2) NOT NULL) DISTSTYLE ALL;",
-      "CREATE TABLE EventDim (EventKey INTEGER PRIMARY KEY, EventID VARCHAR(10) NOT NULL, EventName VARCHAR(100) NOT NULL, EventDate VARCHAR(100) NOT NULL, EventLocation VARCHAR(100) NOT NULL, EventType VARCHAR(200) NOT NULL) DISTSTYLE ALL;",
-      "CREATE TABLE DateDim (DateKey INTEGER PRIMARY KEY, Date VARCHAR(100) NOT NULL, Day INTEGER NOT NULL, Month INTEGER NOT NULL, Year INTEGER NOT NULL, Quarter INTEGER NOT NULL, IsHoliday BOOLEAN NOT NULL) DISTSTYLE ALL SORTKEY(Date);",
-      "CREATE TABLE PaymentMethodDim (PaymentMethodKey INTEGER PRIMARY KEY, PaymentMethodName VARCHAR(50) NOT NULL) DISTSTYLE ALL;",
-      f"COPY DonationFact FROM 's3://{os.environ['BUCKET_NAME']}/donations/DonationFact.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;",
-      f"COPY DonorDim FROM 's3://{os.environ['BUCKET_NAME']}/donors/DonorDim.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;",
-      f"COPY CampaignDim FROM 's3://{os.environ['BUCKET_NAME']}/campaigns/CampaignDim.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;",
-      f"COPY EventDim FROM 's3://{os.environ['BUCKET_NAME']}/events/EventDim.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;",
-      f"COPY DateDim FROM 's3://{os.environ['BUCKET_NAME']}/date/DateDim.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;",
-      f"COPY PaymentMethodDim FROM 's3://{os.environ['BUCKET_NAME']}/payment/PaymentMethodDim.csv' IAM_ROLE '{os.environ['IAM_ROLE']}' CSV IGNOREHEADER 1;"
-  ]
 
-  def wait_for_statement_to_finish(statement_id):
-      while True:
-          status_response = client.describe_statement(Id=statement_id)
-          status = status_response['Status']
-          print(f"Statement {statement_id} status: {status}")
-          if status in ['FINISHED', 'FAILED', 'ABORTED']:
-              return status
-          time.sleep(2)  # Wait before polling again
+  # Stop waiting early enough to report back to CloudFormation before the Lambda times out
+  deadline = poller.deadline_from_context(context, safety_margin_ms=10000)
 
   if request in ['Create', 'Update']:
       try:
-          for statement in sql_statements:
-              print("SQL STATEMENT: ", statement)
-              response = client.execute_statement(
-                  WorkgroupName=os.environ['WORKGROUP_NAME'],
-                  Database=os.environ['DATABASE_NAME'],
-                  Sql=statement
-              )
-              statement_id = response['Id']
+          specs = source_specs(event.get('ResourceProperties') or {})
 
-              # Wait for the statement to finish
-              status = wait_for_statement_to_finish(statement_id)
+          create_tables(deadline)
 
-              if status != 'FINISHED':
-                  raise Exception(f"SQL statement failed with status: {status}")
+          start = time.monotonic()
+          with ThreadPoolExecutor(max_workers=LOAD_CONCURRENCY) as executor:
+              loads = list(executor.map(lambda name: load_table(name, specs[name], deadline), TABLES))
 
-          response_data = {'Message': 'Tables created and data loaded successfully'}
+          response_data = dict(report_throughput(loads, time.monotonic() - start), Message='Tables created and data loaded successfully')
 
           cfnresponse.send(event, context, cfnresponse.SUCCESS, response_data)
 
@@ -63,4 +224,4 @@ def lambda_handler(event, context):
 
           return {'statusCode': 500, 'body': f'Error: {str(e)}'}
   else:
-      cfnresponse.send(event, context, cfnresponse.SUCCESS, response_data)
\ No newline at end of file
+      cfnresponse.send(event, context, cfnresponse.SUCCESS, response_data)
@@ -0,0 +1,73 @@
+import random
+import time
+
+#### POLLING WITH BACKOFF AND DEADLINES ####
+
+# Shared by the nlq Lambda (Athena queries) and the redshiftLoader custom resource (Redshift Data API).
+# Each Lambda asset ships its own copy of this file, like cfnresponse.py.
+
+class PollTimeout(Exception):
+    pass
+
+
+class PollCancelled(Exception):
+    pass
+
+
+# Deadline for the current invocation, derived from the Lambda context
+_request_deadline = None
+
+
+def deadline_from_context(context, safety_margin_ms=3000):
+    # Leave a safety margin so there is still time to cancel work and return a response
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - safety_margin_ms
+    return time.monotonic() + max(remaining_ms, 0) / 1000
+
+
+def set_request_deadline(context, safety_margin_ms=3000):
+    global _request_deadline
+    _request_deadline = deadline_from_context(context, safety_margin_ms)
+    return _request_deadline
+
+
+def get_request_deadline():
+    return _request_deadline
+
+
+def remaining_seconds(deadline):
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def backoff_delays(initial_delay=0.05, max_delay=1.0, multiplier=2.0):
+    # Exponential backoff with "equal jitter": half the delay is fixed, half is random
+    delay = initial_delay
+    while True:
+        yield delay / 2 + random.uniform(0, delay / 2)
+        delay = min(delay * multiplier, max_delay)
+
+
+def poll(fetch, is_done, deadline=None, cancel_event=None, initial_delay=0.05, max_delay=1.0):
+    # Calls fetch() until is_done(response) is true, sleeping with jittered exponential backoff.
+    # Raises PollTimeout when the next sleep would cross the deadline and PollCancelled when
+    # cancel_event is set; the caller is responsible for stopping the remote work in both cases.
+    # Returns (response, number_of_polls).
+    polls = 0
+    for delay in backoff_delays(initial_delay, max_delay):
+        response = fetch()
+        polls += 1
+        if is_done(response):
+            return response, polls
+
+        remaining = remaining_seconds(deadline)
+        if remaining is not None and remaining <= delay:
+            raise PollTimeout(f"Deadline reached after {polls} polls")
+
+        if cancel_event is not None:
+            if cancel_event.wait(delay):
+                raise PollCancelled(f"Cancelled after {polls} polls")
+        else:
+            time.sleep(delay)
@@ -0,0 +1,89 @@
+import config
+import json
+import time
+import uuid
+from boto3.dynamodb.types import TypeSerializer
+
+#### CONVERSATION HISTORY WRITES ####
+
+# Shared by the nlq and nlq-kb Lambdas, so every turn lands in the chat history table with the same
+# schema. It is deployed once, as the shared Lambda layer (lambda/shared, on the path at /opt/python).
+# Each Lambda provides a config module with dynamodb_client, TABLE_NAME and logger.
+#
+# A turn is one item per message, keyed by the conversation id and a "<time.time()>_<index>" sort key:
+#   {"id", "timestamp", "message": {"role", "content"}, "source": "nlq" | "nlq-kb", "turn_id", ...}
+# Keys are assigned when the turn is recorded, so a write that is retried overwrites the same items
+# instead of adding the turn again. The whole turn is written with one BatchWriteItem before the
+# response, so the next question in the session always sees it.
+
+_serializer = TypeSerializer()
+
+# Unprocessed batch items are retried this many times before the write is reported as failed
+BATCH_WRITE_ATTEMPTS = 5
+BATCH_WRITE_MAX_ITEMS = 25
+
+
+def turn_messages(question, sql_query, answer):
+    # The user/assistant message pair stored for a turn
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"text": question}
+            ]
+        },
+        {
+            "role": "assistant",
+            "content": [
+                {"text": json.dumps({
+                    "sql_query": sql_query,
+                    "results": answer
+                })}
+            ]
+        }
+    ]
+
+
+def turn_items(id, messages, source, **attributes):
+    # One item per message. An index differentiates messages recorded at the same time (avoids overwrites).
+    timestamp = str(time.time())
+    turn_id = uuid.uuid4().hex
+    return [
+        {
+            "id": id,
+            "timestamp": f"{timestamp}_{idx}",
+            "message": message,
+            "source": source,
+            "turn_id": turn_id,
+            **attributes,
+        }
+        for idx, message in enumerate(messages)
+    ]
+
+
+def record_turn(id, messages, source, extra_items=(), **attributes):
+    # Writes a turn, with any extra_items that go in the same batch, and returns the turn's sort keys
+    # in order
+    items = turn_items(id, messages, source, **attributes)
+    write_items(items + list(extra_items))
+    config.logger.info(f"{len(items)} items with ID {id} written to table {config.TABLE_NAME}")
+    return [item["timestamp"] for item in items]
+
+
+def write_items(items):
+    # Writes items with BatchWriteItem, 25 at a time, resending anything DynamoDB leaves unprocessed.
+    # Items with the same key are written once (a batch may not contain duplicates).
+    unique = list({(item["id"], item["timestamp"]): item for item in items}.values())
+    for start in range(0, len(unique), BATCH_WRITE_MAX_ITEMS):
+        request_items = {config.TABLE_NAME: [
+            {"PutRequest": {"Item": {key: _serializer.serialize(value) for key, value in item.items()}}}
+            for item in unique[start:start + BATCH_WRITE_MAX_ITEMS]
+        ]}
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            response = config.dynamodb_client.batch_write_item(RequestItems=request_items)
+            request_items = response.get("UnprocessedItems") or {}
+            if not request_items:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise Exception(f"{len(request_items[config.TABLE_NAME])} history items were not written after {BATCH_WRITE_ATTEMPTS} attempts")
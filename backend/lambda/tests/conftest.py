@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The nlq services are imported by bare name, as in the Lambda; questions run on the local query
+# engine over backend/sample_data, so no AWS service is called
+NLQ_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nlq")
+sys.path[:0] = [NLQ_DIR, os.path.join(NLQ_DIR, "services"), os.path.join(NLQ_DIR, "..", "shared", "python")]
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["QUERY_ENGINE"] = "local"
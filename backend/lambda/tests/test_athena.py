@@ -0,0 +1,33 @@
+import pytest
+
+import athena
+import config
+
+
+@pytest.mark.parametrize("engine, preflight", [("athena", True), ("redshift", False), ("local", False)])
+def test_preflight_only_for_athena(monkeypatch, engine, preflight):
+    # The local extract only has the Glue sample tables
+    monkeypatch.setattr(config, "QUERY_PREFLIGHT", True)
+    monkeypatch.setattr(config, "QUERY_ENGINE", engine)
+    check = athena._preflight("SELECT SUM(donationamount) FROM donationfact")
+    assert (check is not None) == preflight
+
+
+@pytest.mark.parametrize("first, second", [
+    ("SELECT d.donationamount FROM sample_donations d", "select  e.donationamount from sample_donations AS e"),
+    ("SELECT x.total FROM (SELECT SUM(donationamount) AS total FROM sample_donations) x",
+     "SELECT y.total FROM (SELECT SUM(donationamount) AS total FROM sample_donations) AS y"),
+    ("SELECT donorkey FROM sample_donations;", "SELECT donorkey\nFROM sample_donations"),
+])
+def test_same_fingerprint(first, second):
+    assert athena.fingerprint_sql(first) == athena.fingerprint_sql(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    # A column that shares an alias's name is not an alias
+    ("SELECT d FROM sample_donations d", "SELECT e FROM sample_donations e"),
+    ("SELECT d.d FROM sample_donations d", "SELECT e.e FROM sample_donations e"),
+    ("SELECT * FROM sample_campaigns WHERE campaignname = 'Spring'", "SELECT * FROM sample_campaigns WHERE campaignname = 'spring'"),
+])
+def test_different_fingerprint(first, second):
+    assert athena.fingerprint_sql(first) != athena.fingerprint_sql(second)
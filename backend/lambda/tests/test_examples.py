@@ -0,0 +1,86 @@
+import pytest
+
+import config
+import conversation
+import dynamodb
+import examples
+
+SAMPLES = [{"question": "How many donors are there?", "sql": "SELECT COUNT(*) FROM sample_donors"}]
+
+
+def pair(number):
+    return f"Total donations for campaign {number}", f"SELECT SUM(donationamount) FROM sample_donations WHERE campaignkey = {number}"
+
+
+@pytest.fixture
+def small_store(monkeypatch):
+    monkeypatch.setattr(config, "EXAMPLES_MAX", 3)
+    return examples.ExampleStore(SAMPLES)
+
+
+def questions(store):
+    return [example["question"] for example in store.examples]
+
+
+def test_full_store_evicts_the_least_recently_verified(small_store):
+    for number in range(1, 4):
+        assert small_store.add(*pair(number)) is not None
+    # The curated sample stays; pair 1 made room for pair 3
+    assert questions(small_store) == [SAMPLES[0]["question"], pair(2)[0], pair(3)[0]]
+
+
+def test_verifying_again_makes_a_pair_recent(small_store):
+    small_store.add(*pair(1))
+    small_store.add(*pair(2))
+    assert small_store.add(*pair(1)) is None
+    small_store.add(*pair(3))
+    assert questions(small_store) == [SAMPLES[0]["question"], pair(1)[0], pair(3)[0]]
+
+
+def test_samples_are_never_evicted(monkeypatch):
+    monkeypatch.setattr(config, "EXAMPLES_MAX", 1)
+    store = examples.ExampleStore(SAMPLES)
+    assert store.add(*pair(1)) is None
+    assert questions(store) == [SAMPLES[0]["question"]]
+
+
+class RecordingDynamoDB:
+
+    def __init__(self):
+        self.batches = []
+
+    def batch_write_item(self, RequestItems):
+        self.batches.append([request["PutRequest"]["Item"] for request in RequestItems[config.TABLE_NAME]])
+        return {"UnprocessedItems": {}}
+
+
+def test_verified_example_is_written_with_the_turn(monkeypatch):
+    table = RecordingDynamoDB()
+    monkeypatch.setattr(config, "dynamodb_client", table)
+    monkeypatch.setattr(config, "EXAMPLES_FROM_HISTORY", True)
+    monkeypatch.setattr(examples, "_store", examples.ExampleStore(SAMPLES))
+
+    context = conversation.ConversationContext("session")
+    question, sql = pair(7)
+    context.add_item(examples.add_verified(question, sql))
+    # Already in the store: nothing more to write
+    context.add_item(examples.add_verified(question, sql))
+    context.add_turn(question, sql, "| total |\n| --- |\n| 10 |")
+
+    assert len(table.batches) == 1
+    ids = [item["id"]["S"] for item in table.batches[0]]
+    assert ids == ["session", "session", dynamodb.EXAMPLES_ID]
+
+
+def test_examples_are_read_newest_first(monkeypatch):
+    requests = []
+
+    class Table:
+        def query(self, **request):
+            requests.append(request)
+            return {"Items": []}
+
+    monkeypatch.setattr(config, "dynamodb_client", Table())
+    dynamodb.read_examples(10)
+    assert requests[0]["ScanIndexForward"] is False
+    assert requests[0]["Limit"] == 10
@@ -0,0 +1,80 @@
+import pytest
+
+import athena
+import intents
+import lambda_function
+
+CAMPAIGNS = ["March Miracle Makers", "May Day Miracle Fund", "Spring Fundraiser", "Spring Forward Fund"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("March Miracle Makers", "March Miracle Makers"),
+    ("march miracle makers", "March Miracle Makers"),
+    ("Marhc Miracle Makers", "March Miracle Makers"),
+    ("spring fundraisr", "Spring Fundraiser"),
+    # Words left over after the name
+    ("March Miracle Makers in 2023", None),
+    ("March Miracle Makers excluding online donations", None),
+    ("March Miracle Makers by payment method", None),
+    ("the spring fundraiser last year", None),
+    # Part of a name
+    ("Miracle", None),
+    ("Spring", None),
+    ("", None),
+])
+def test_match_value(text, expected):
+    assert intents.match_value(text, CAMPAIGNS) == expected
+
+
+def test_match_value_ambiguous():
+    assert intents.match_value("Spring Fund", ["Spring Fund A", "Spring Fund B"]) is None
+
+
+@pytest.fixture
+def campaign_values():
+    # Loaded up front, as the background load would be by the time the question repeats
+    intents.load_all_values()
+
+
+@pytest.mark.parametrize("question, intent, sql_part", [
+    ("What was the total amount raised for the March Miracle Makers campaign?", "campaign_total", "c.campaignname = 'March Miracle Makers'"),
+    ("How much was donated to the Spring Fundraiser?", "campaign_total", "c.campaignname = 'Spring Fundraiser'"),
+    ("How much was raised for the March Miracle Makers campaign", "campaign_total", "c.campaignname = 'March Miracle Makers'"),
+    ("Total donations by payment method", "donations_by_payment_method", "GROUP BY p.paymentmethodname"),
+    ("Who are the top 3 donors in March 2024?", "top_donors", "WHERE dt.month = 3 AND dt.year = 2024"),
+    ("Top donors", "top_donors", "LIMIT 5"),
+])
+def test_route(campaign_values, question, intent, sql_part):
+    routed = intents.route(question)
+    assert routed is not None
+    assert routed["intent"] == intent
+    assert sql_part in routed["sql"]
+
+
+@pytest.mark.parametrize("question", [
+    "How much was raised for the March Miracle Makers campaign in 2023?",
+    "How much was raised for the March Miracle Makers campaign excluding online donations?",
+    "Total donations for March Miracle Makers by payment method",
+    "Total donations for the Miracle campaign",
+    "How much was donated to the Autumn Leaves Appeal?",
+    "Which campaign raised the most?",
+])
+def test_route_falls_back_to_the_model(campaign_values, question):
+    assert intents.route(question) is None
+
+
+def test_values_load_off_the_request_path(monkeypatch):
+    # The first question only starts the load and goes to the model
+    monkeypatch.setattr(intents, "_values", {})
+    question = "How much was donated to the Spring Fundraiser?"
+    assert intents.route(question) is None
+    intents.load_column_values("sample_campaigns", "campaignname")
+    assert intents.route(question)["intent"] == "campaign_total"
+
+
+def test_routing_errors_fall_back_to_the_model(campaign_values, monkeypatch):
+    def throttled(query, cancel_event=None):
+        raise Exception("ThrottlingException: Rate exceeded")
+
+    monkeypatch.setattr(athena, "syntax_checker", throttled)
+    assert lambda_function.route_intent("How much was donated to the Spring Fundraiser?") is None
@@ -0,0 +1,34 @@
+import pytest
+
+import renderer
+
+
+@pytest.mark.parametrize("name, non_additive", [
+    ("avg_donation", True),
+    ("average", True),
+    ("avgdonation", True),
+    ("donation_rate", True),
+    ("conversion_ratio", True),
+    ("min_amount", True),
+    ("max", True),
+    ("pct_of_total", True),
+    ("total_donation_amount", False),
+    ("generated_amount", False),
+    ("duration", False),
+    ("admin_count", False),
+    ("minutes", False),
+])
+def test_non_additive_column(name, non_additive):
+    assert (renderer.NON_ADDITIVE_COLUMN.search(name) is not None) == non_additive
+
+
+@pytest.mark.parametrize("name, identifier", [
+    ("donorkey", True),
+    ("campaign_id", True),
+    ("year", True),
+    ("amount_paid", False),
+    ("paid", False),
+    ("monkey_count", False),
+])
+def test_identifier_column(name, identifier):
+    assert (renderer.IDENTIFIER_COLUMN.search(name) is not None) == identifier
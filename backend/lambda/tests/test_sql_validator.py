@@ -0,0 +1,82 @@
+import pytest
+
+import sql_validator
+
+SCHEMA = {
+    "sample_donations": [{"Name": name, "Type": "bigint"} for name in
+                         ["donationkey", "donorkey", "campaignkey", "datekey", "paymentmethodkey", "donationamount"]],
+    "sample_donors": [{"Name": name, "Type": "string"} for name in ["donorkey", "firstname", "lastname", "tags"]],
+    "sample_campaigns": [{"Name": name, "Type": "string"} for name in ["campaignkey", "campaignname", "startdate"]],
+    "sample_date": [{"Name": name, "Type": "bigint"} for name in ["datekey", "date", "day", "month", "year", "quarter"]],
+}
+
+# Queries Athena accepts: a false "invalid" costs a generation retry on every question like it
+VALID = [
+    # Quoted identifiers
+    'SELECT "donationamount" FROM "sample_donations"',
+    'SELECT d."donationamount" FROM "sample_donations" AS d',
+    'SELECT "Donationamount" AS "Total Amount" FROM sample_donations',
+    'SELECT SUM(d.donationamount) AS "total" FROM sample_donations d ORDER BY "total" DESC',
+    # CTE aliases
+    "WITH totals AS (SELECT donorkey, SUM(donationamount) AS total FROM sample_donations GROUP BY donorkey) "
+    "SELECT t.donorkey, t.total FROM totals t ORDER BY total DESC",
+    "WITH totals (donor, total) AS (SELECT donorkey, SUM(donationamount) FROM sample_donations GROUP BY 1) "
+    "SELECT donor, total FROM totals",
+    "WITH a AS (SELECT donorkey FROM sample_donors), b AS (SELECT donorkey, donationamount FROM sample_donations) "
+    "SELECT a.donorkey, SUM(b.donationamount) AS total FROM a JOIN b ON a.donorkey = b.donorkey GROUP BY 1",
+    # Subqueries
+    "SELECT x.total FROM (SELECT SUM(donationamount) AS total FROM sample_donations) x",
+    # UNNEST
+    "SELECT d.firstname, tag FROM sample_donors d CROSS JOIN UNNEST(split(d.tags, ',')) AS t (tag)",
+    "SELECT n FROM UNNEST(ARRAY[1, 2, 3]) AS t(n)",
+    "SELECT n, i FROM UNNEST(ARRAY[10, 20]) WITH ORDINALITY AS t (n, i)",
+    # Lambdas
+    "SELECT transform(split(tags, ','), x -> upper(x)) AS tags FROM sample_donors",
+    "SELECT filter(split(tags, ','), t -> length(t) > 3) AS tags FROM sample_donors",
+    "SELECT reduce(ARRAY[1, 2], 0, (s, x) -> s + x, s -> s) AS total FROM sample_donations",
+    # INTERVAL and DATE literals
+    "SELECT COUNT(*) FROM sample_date WHERE date_parse(date, '%m/%d/%Y') >= current_date - INTERVAL '30' DAY",
+    "SELECT COUNT(*) FROM sample_date WHERE CAST(date AS date) BETWEEN DATE '2024-01-01' AND DATE '2024-03-31'",
+    "SELECT date_add('month', -3, current_date) AS start, TIMESTAMP '2024-01-01 00:00:00' AS t FROM sample_date",
+    "SELECT COUNT(*) FROM sample_date WHERE year = EXTRACT(YEAR FROM current_date - INTERVAL '1' YEAR)",
+    # Keywords used as columns, window functions, Redshift forms
+    "SELECT year, month, day, quarter FROM sample_date",
+    "SELECT donorkey, RANK() OVER (PARTITION BY campaignkey ORDER BY donationamount DESC) AS rnk FROM sample_donations",
+    "SELECT TOP 5 donorkey FROM sample_donations",
+    "SELECT donationamount::varchar FROM sample_donations;",
+]
+
+
+@pytest.mark.parametrize("query", VALID)
+def test_valid(query):
+    result = sql_validator.validate_sql(query, SCHEMA)
+    assert result["valid"], result["errors"]
+
+
+INVALID = [
+    # Unknown columns
+    ("SELECT amount FROM sample_donations", "COLUMN_NOT_FOUND", "amount"),
+    ("SELECT d.amount FROM sample_donations d", "COLUMN_NOT_FOUND", "amount"),
+    ('SELECT "amount" FROM "sample_donations"', "COLUMN_NOT_FOUND", "amount"),
+    ("SELECT d.donationamount FROM sample_donations d JOIN sample_donors dn ON d.donorkey = dn.donorid",
+     "COLUMN_NOT_FOUND", "donorid"),
+    ("SELECT firstname FROM sample_donations", "COLUMN_NOT_FOUND", "firstname"),
+    # Unknown tables and aliases
+    ("SELECT * FROM donations", "TABLE_NOT_FOUND", "donations"),
+    ("SELECT x.donationamount FROM sample_donations d", "UNKNOWN_ALIAS", "'x'"),
+    # Structure
+    ("DELETE FROM sample_donations", "NOT_A_QUERY", None),
+    ("SELECT donorkey FROM sample_donations; SELECT 1", None, None),
+    ("SELECT (donorkey FROM sample_donations", None, None),
+    ("", "EMPTY_QUERY", None),
+]
+
+
+@pytest.mark.parametrize("query, code, name", INVALID)
+def test_invalid(query, code, name):
+    result = sql_validator.validate_sql(query, SCHEMA)
+    assert not result["valid"]
+    if code is not None:
+        assert result["errors"][0]["code"] == code
+    if name is not None:
+        assert name in result["errors"][0]["message"]
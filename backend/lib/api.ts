@@ -70,11 +70,19 @@ export class APIStack extends cdk.Stack {
       cognitoUserPools: [props.userPool], // pass in the user pool created in our Auth stack
     });
     
+    // Python modules shared by the NLQ and Knowledge Base functions (history.py)
+    const sharedLayer = new lambda.LayerVersion(this, 'SharedPythonLayer', {
+      code: lambda.Code.fromAsset(path.join(__dirname, '../lambda/shared')),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_13],
+      description: 'Modules shared by the NLQ Lambda functions',
+    });
+
     // Create the Lambda function
     const lambdaFn = new lambda.Function(this, 'MyLambdaFunction', {
       runtime: lambda.Runtime.PYTHON_3_13,
       handler: 'lambda_function.lambda_handler',  
       code: lambda.Code.fromAsset(path.join(__dirname, '../lambda/nlq')), 
+      layers: [sharedLayer],
       timeout: cdk.Duration.seconds(300),
       environment: {
         ATHENA_OUTPUT: `s3://${props.athenaQueryBucket.bucketName}`, // use the S3 bucket created for Athena query results in our data stack
@@ -82,7 +90,7 @@ export class APIStack extends cdk.Stack {
         GLUE_DB: props.glueDatabaseName, // use the glue database created in our Data stack
         TABLE_NAME: props.table.tableName, //use the DynamoDB table name created in our Data stack
         ATHENA_WORKGROUP: props.workgroupName, // use the Athena workgroup created in our Data stack
-        MODEL_ID: scope.node.tryGetContext("modelId")
+        MODEL_ID: scope.node.tryGetContext("modelId"),
       }
     });
     
@@ -97,7 +105,8 @@ export class APIStack extends cdk.Stack {
     lambdaFn.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: [
-        'bedrock:InvokeModel'
+        'bedrock:InvokeModel',
+        'bedrock:InvokeModelWithResponseStream'
       ],
       resources: [
         `arn:aws:bedrock:*::foundation-model/*`,
@@ -121,6 +130,55 @@ export class APIStack extends cdk.Stack {
       ]
     }));
     
+    // Optionally run generated SQL on the Redshift Serverless workgroup from the RedshiftStack
+    // instead of Athena (set redshiftWorkgroupName in cdk.json)
+    const redshiftWorkgroupName = scope.node.tryGetContext("redshiftWorkgroupName");
+    if (redshiftWorkgroupName) {
+      const redshiftSecretArn = scope.node.tryGetContext("redshiftSecretArn");
+      lambdaFn.addEnvironment('QUERY_ENGINE', 'redshift');
+      lambdaFn.addEnvironment('REDSHIFT_WORKGROUP', redshiftWorkgroupName);
+      lambdaFn.addEnvironment('REDSHIFT_DATABASE', scope.node.tryGetContext("redshiftDatabase") || 'mydatabase');
+
+      lambdaFn.addToRolePolicy(new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: [
+          'redshift-data:ExecuteStatement',
+          'redshift-serverless:GetCredentials',
+        ],
+        resources: [
+          `arn:aws:redshift-serverless:${this.region}:${this.account}:workgroup/*`,
+        ],
+      }));
+
+      // Statement operations are limited to statements the caller started
+      lambdaFn.addToRolePolicy(new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        actions: [
+          'redshift-data:DescribeStatement',
+          'redshift-data:GetStatementResult',
+          'redshift-data:CancelStatement',
+        ],
+        resources: ['*'],
+      }));
+
+      if (redshiftSecretArn) {
+        lambdaFn.addEnvironment('REDSHIFT_SECRET_ARN', redshiftSecretArn);
+        lambdaFn.addToRolePolicy(new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: ['secretsmanager:GetSecretValue'],
+          resources: [redshiftSecretArn],
+        }));
+        lambdaFn.addToRolePolicy(new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: ['kms:Decrypt'],
+          resources: [`arn:aws:kms:${this.region}:${this.account}:key/*`],
+          conditions: {
+            StringEquals: { 'kms:ViaService': `secretsmanager.${this.region}.amazonaws.com` },
+          },
+        }));
+      }
+    }
+
     lambdaFn.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
       actions: [
@@ -140,6 +198,7 @@ export class APIStack extends cdk.Stack {
       runtime: lambda.Runtime.PYTHON_3_13,
       handler: 'lambda_function.lambda_handler',  
       code: lambda.Code.fromAsset(path.join(__dirname, '../lambda/nlq-kb')), 
+      layers: [sharedLayer],
       timeout: cdk.Duration.seconds(300),
       environment: {
         KNOWLEDGE_BASE_ID: scope.node.tryGetContext("BedrockKnowledgeBaseId"),
@@ -158,6 +217,8 @@ export class APIStack extends cdk.Stack {
         "bedrock:GenerateQuery",
         "bedrock:Retrieve",
         "bedrock:RetrieveAndGenerate",
+        "bedrock:RetrieveAndGenerateStream",
+        "bedrock:InvokeModelWithResponseStream",
         "bedrock:GetInferenceProfile",
       ],
       resources: ["*"]
@@ -243,6 +304,7 @@ export class APIStack extends cdk.Stack {
       defaultCorsPreflightOptions: {
         allowOrigins: agw.Cors.ALL_ORIGINS,
         allowMethods: agw.Cors.ALL_METHODS,
+        allowHeaders: [...agw.Cors.DEFAULT_HEADERS, 'X-NLQ-Debug'], // opt-in per-request trace headers
       },
       endpointConfiguration: {
         types: [agw.EndpointType.REGIONAL], 
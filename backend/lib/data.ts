@@ -229,6 +229,10 @@ export class DataStack extends cdk.Stack {
             resultConfiguration: {
               outputLocation: `s3://${this.athenaQueryBucket.bucketName}/`,
             },
+            // Engine version 3 is required for query result reuse
+            engineVersion: {
+              selectedEngineVersion: 'Athena engine version 3',
+            },
           },
         });
         
@@ -149,19 +149,26 @@ export class RedshiftStack extends cdk.Stack {
       handler: 'index.lambda_handler',
       role: redshiftLoadDataLambdaRole,
       code: lambda.Code.fromAsset(path.join(__dirname, '../lambda/redshiftLoader')), 
-      timeout: cdk.Duration.seconds(300),
+      // Large fact tables need the longest custom resource run Lambda allows
+      timeout: cdk.Duration.minutes(15),
       environment: {
         'WORKGROUP_NAME': redshiftWorkgroup.ref,
         'DATABASE_NAME': 'mydatabase',
         'IAM_ROLE': redshiftIamRole.roleArn,
         'BUCKET_NAME': sampleDataBucket,
+        'LOAD_CONCURRENCY': '6',
       },
     });
     
 
     // Custom Resource to trigger the crawler during stack deployment
+    // Optional per-table sources (manifests, compressed CSV, Parquet) come from the redshiftLoadSources
+    // context; changing them reloads the tables on the next deploy
     const redshiftTriggerResource = new cdk.CustomResource(this, 'TriggerRedshiftLoad', {
       serviceToken: redshiftLoadDataLambda.functionArn,
+      properties: {
+        Sources: JSON.stringify(this.node.tryGetContext("redshiftLoadSources") || {}),
+      },
     });
     
     
@@ -7,7 +7,7 @@ import botAvatar from './assets/bot-avatar.png';
 import { Authenticator } from "@aws-amplify/ui-react";
 import { Amplify } from "aws-amplify";
 import "@aws-amplify/ui-react/styles.css";
-import { postMessage } from "./api";
+import { postMessage, StreamEvent } from "./api";
 import { APP_DESCRIPTION, DATASET_ITEMS } from "./constants/demoText.ts";
 
 Amplify.configure({
@@ -21,6 +21,10 @@ Amplify.configure({
 
 export const apiEndpoint = import.meta.env.VITE_API_ENDPOINT; 
 
+// Progress streaming needs an endpoint that streams Server-Sent Events (the local SSE server in
+// backend/lambda/local). The deployed API answers with JSON, so it is off by default.
+const streamingEnabled = import.meta.env.VITE_STREAMING === 'true';
+
 interface Message {
   sender: 'user' | 'bot';
   text: string;
@@ -37,6 +41,14 @@ interface MessageRequest {
   kb_session_id: string;
 }
 
+// Progress labels for the streaming pipeline stages
+const STAGE_LABELS: Record<string, string> = {
+  generating_sql: 'Generating SQL...',
+  query_running: 'Running query...',
+  summarizing: 'Writing answer...',
+  retrieving: 'Querying knowledge base...',
+};
+
 const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
     
   const [messages, setMessages] = useState<Message[]>([]);
@@ -44,6 +56,8 @@ const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
   const [kbSessionId, setKbSessionId] = useState<string>('');
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [expandedIndexes, setExpandedIndexes] = useState<number[]>([]);
+  const [streamStatus, setStreamStatus] = useState<string>('');
+  const [streamingText, setStreamingText] = useState<string>('');
   const chatHistoryRef = useRef<HTMLDivElement | null>(null);
 
   const handleSubmit = async (e: React.FormEvent<HTMLFormElement>) => {
@@ -63,7 +77,25 @@ const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
         kb_session_id: kbSessionId
       };
     
-      const response = await postMessage(data); // API call
+      // Show progress and the answer as it is generated
+      const handleStreamEvent = (streamEvent: StreamEvent) => {
+        switch (streamEvent.event) {
+          case 'status':
+            setStreamStatus(STAGE_LABELS[streamEvent.data.stage] ?? 'Working...');
+            break;
+          case 'sql':
+            setStreamStatus('SQL generated, validating...');
+            break;
+          case 'rows':
+            setStreamStatus(`Received ${streamEvent.data.row_count} rows`);
+            break;
+          case 'token':
+            setStreamingText((prevText) => prevText + streamEvent.data.text);
+            break;
+        }
+      };
+    
+      const response = await postMessage(data, streamingEnabled ? handleStreamEvent : undefined); // API call
     
       const botMessage: Message = {
         sender: 'bot',
@@ -94,6 +126,8 @@ const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
     
     } finally {
       setIsLoading(false);
+      setStreamStatus('');
+      setStreamingText('');
     }
   };
 
@@ -101,7 +135,7 @@ const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
     if (chatHistoryRef.current) {
       chatHistoryRef.current.scrollTop = chatHistoryRef.current.scrollHeight;
     }
-  }, [messages]);
+  }, [messages, streamingText]);
 
   const toggleExpand = (index: number) => {
     setExpandedIndexes((prev) =>
@@ -172,6 +206,26 @@ const Agent: React.FC<AgentProps> = ({ generated_uuid }) => {
                 )}
               </div>
             ))}
+            {isLoading && (streamStatus || streamingText) && (
+              <div className="message bot">
+                <div className="bot-message">
+                  <img
+                    src={botAvatar}
+                    alt="Bot Avatar"
+                    className="avatar"
+                  />
+                  <div className="text-bubble bot">
+                    <div className="markdown-content">
+                      {streamingText ? (
+                        <ReactMarkdown remarkPlugins={[remarkGfm]}>{streamingText}</ReactMarkdown>
+                      ) : (
+                        <em>{streamStatus}</em>
+                      )}
+                    </div>
+                  </div>
+                </div>
+              </div>
+            )}
           </div>
           <form onSubmit={handleSubmit} className="form">
             <input
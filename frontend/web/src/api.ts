@@ -24,7 +24,67 @@ interface MessageRequest {
   kb_session_id: string;
 }
 
-export const postMessage = async (requestData: MessageRequest) => {
+// Progress event emitted by the NLQ pipeline in streaming mode
+export interface StreamEvent {
+  event: string; // status | sql | rows | token | done | error
+  data: any;
+}
+
+// Read a Server-Sent Events body incrementally, calling onEvent for each event as it arrives.
+// Resolves with the data of the final "done" event.
+const readEventStream = async (res: Response, onEvent: (event: StreamEvent) => void) => {
+  if (!res.body) {
+    throw new Error("Streaming is not supported by this browser");
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result: any = null;
+
+  const handleFrame = (frame: string) => {
+    let event = 'message';
+    const dataLines: string[] = [];
+    for (const line of frame.split('\n')) {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    }
+    if (dataLines.length === 0) return;
+
+    const data = JSON.parse(dataLines.join('\n'));
+    if (event === 'error') {
+      throw new Error(data?.answer || data?.error || "Something went wrong. Please try again.");
+    }
+    if (event === 'done') {
+      result = data;
+    }
+    onEvent({ event, data });
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      handleFrame(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+  if (buffer.trim()) handleFrame(buffer);
+
+  if (!result) {
+    throw new Error("The response stream ended before an answer was received");
+  }
+  return result;
+};
+
+// When onEvent is provided the API is asked for a Server-Sent Events stream, and progress
+// (generated SQL, query status, answer tokens) is reported while the answer is produced
+export const postMessage = async (requestData: MessageRequest, onEvent?: (event: StreamEvent) => void) => {
   try {
     const token = await getToken(); // retrieve the bearer token for the user 
     
@@ -33,9 +93,14 @@ export const postMessage = async (requestData: MessageRequest) => {
       headers: {
         "Authorization": token, // pass the cognito token to authorize our API call
         "Content-Type": "application/json",
+        ...(onEvent ? { "Accept": "text/event-stream" } : {}),
       },
       body: JSON.stringify(requestData) 
     });
+
+    if (onEvent && res.ok && res.headers.get("Content-Type")?.includes("text/event-stream")) {
+      return await readEventStream(res, onEvent);
+    }
     
     const responseData = await res.json();
     
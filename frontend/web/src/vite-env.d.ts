@@ -5,6 +5,7 @@ interface ImportMetaEnv {
   readonly VITE_CLIENT_ID: string;
   readonly VITE_USER_POOL_ID: string;
   readonly VITE_API_ENDPOINT: string;
+  readonly VITE_STREAMING?: string;
 }
 
 interface ImportMeta {